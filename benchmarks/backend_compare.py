@@ -0,0 +1,72 @@
+"""
+Side-by-side build + solve timing of the cvxpy path and the direct gurobipy backend
+
+Run from the repository root:
+
+    python -m benchmarks.backend_compare
+    python -m benchmarks.backend_compare --stations 30 --periods 30 96 --vehicles 2 --time-limit 120
+
+For the cvxpy path "build" is creating the problem and "canonicalize" is
+the time from calling solve() until Gurobi starts; for the direct backend
+"build" covers everything up to Model.optimize(). "solve" is Gurobi's own
+runtime in both cases, so the objectives should agree and the difference
+between the two paths is the modeling overhead.
+"""
+import argparse
+import time
+
+import cvxpy as cp
+
+from rebalancing import build_baseline_model, build_electric_model
+from rebalancing.data import random_electric_instance, random_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+
+FORMULATIONS = {
+    "baseline": (random_instance, build_baseline_model, build_baseline_gurobi),
+    "e-bike": (random_electric_instance, build_electric_model, build_electric_gurobi),
+}
+
+
+def time_cvxpy(build, instance, time_limit):
+    start = time.perf_counter()
+    model = build(**instance)
+    built = time.perf_counter()
+    model.solve(solver=cp.GUROBI, TimeLimit=time_limit)
+    done = time.perf_counter()
+    solve_time = model.problem.solver_stats.solve_time
+    return built - start, done - built - solve_time, solve_time, model.objective_value
+
+
+def time_gurobi(build, instance, time_limit):
+    model = build(**instance)
+    model.solve(OutputFlag=0, TimeLimit=time_limit)
+    return model.build_time, 0.0, model.model.Runtime, model.objective_value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[30])
+    parser.add_argument("--periods", type=int, nargs="+", default=[30, 96])
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--time-limit", type=float, default=300)
+    parser.add_argument("--formulations", nargs="+", default=list(FORMULATIONS), choices=list(FORMULATIONS))
+    args = parser.parse_args()
+
+    print(f"{'model':<9}{'S':>5}{'T':>5}{'V':>3}  {'backend':<8}{'build':>9}{'canon':>9}{'solve':>9}{'total':>9}  objective")
+    for name in args.formulations:
+        make_instance, build_cvxpy, build_gurobi = FORMULATIONS[name]
+        for S in args.stations:
+            for T in args.periods:
+                instance = make_instance(S, T, args.vehicles)
+                for backend, run in (("cvxpy", time_cvxpy), ("gurobipy", time_gurobi)):
+                    build = build_cvxpy if backend == "cvxpy" else build_gurobi
+                    build_s, canon_s, solve_s, objective = run(build, instance, args.time_limit)
+                    total = build_s + canon_s + solve_s
+                    print(
+                        f"{name:<9}{S:>5}{T:>5}{args.vehicles:>3}  {backend:<8}"
+                        f"{build_s:>9.3f}{canon_s:>9.3f}{solve_s:>9.3f}{total:>9.3f}  {objective}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
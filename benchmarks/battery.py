@@ -0,0 +1,95 @@
+"""
+Model size and solve time of the battery-charge model against the number
+of charge buckets
+
+Run from the repository root:
+
+    python -m benchmarks.battery
+    python -m benchmarks.battery --stations 30 --periods 96 --vehicles 3 --buckets 2 4 8 16 --no-solve
+    python -m benchmarks.battery --data-dir synthetic --start 68 --stations 12 --periods 16 --buckets 1 2 4 8
+
+Every instance is built with build_battery_gurobi once per bucket count,
+with the e-bikes at the stations spread evenly over the buckets, and
+once with build_electric_gurobi (no charge, "e-bike"). The columns show
+the e-bike rentals lost and the battery swaps of the plan (the objective
+includes --swap-cost per swap); with B=1 no bike is ever too empty to
+rent, but returns still need a rented bike.
+"""
+import argparse
+
+from rebalancing.battery import MIN_CHARGE, TRIP_CHARGE, battery_instance, build_battery_gurobi
+from rebalancing.data import load_electric_instance, random_electric_instance
+from rebalancing.gurobi_backend import build_electric_gurobi
+
+
+def run(instance, B, args):
+    if B is None:
+        model = build_electric_gurobi(**instance, strengthen=args.strengthen)
+    else:
+        model = build_battery_gurobi(
+            **battery_instance(instance, B), min_charge=args.min_charge, trip_charge=args.trip_charge,
+            battery_space=args.battery_space, swap_cost=args.swap_cost, strengthen=args.strengthen,
+        )
+    row = {
+        "rows": model.model.NumConstrs,
+        "cols": model.model.NumVars,
+        "build": model.build_time,
+        "solve": None, "gap": None, "objective": None, "lost": None, "swaps": None,
+    }
+    if not args.no_solve:
+        model.solve(OutputFlag=0, TimeLimit=args.time_limit)
+        solution = model.solution() if B is None else model.aggregate_solution()
+        row.update(solve=model.model.Runtime, gap=model.mip_gap, objective=model.objective_value)
+        if solution is not None:
+            row.update(
+                lost=instance["f_bar_plus"].sum() - solution["x_bar_plus"].sum(),
+                swaps=None if B is None else solution["swaps"].sum(),
+            )
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=6)
+    parser.add_argument("--periods", type=int, default=8)
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--buckets", type=int, nargs="+", default=[1, 2, 3, 4])
+    parser.add_argument("--seeds", type=int, default=2, help="random instances, or --data-dir windows one day apart")
+    parser.add_argument("--data-dir", help="read the demand from the CSVs or demand store here instead")
+    parser.add_argument("--start", type=int, default=0, help="first period of the --data-dir window")
+    parser.add_argument("--min-charge", type=float, default=MIN_CHARGE)
+    parser.add_argument("--trip-charge", type=float, default=TRIP_CHARGE)
+    parser.add_argument("--battery-space", type=float, default=1, help="share of an e-bike's room one battery takes")
+    parser.add_argument("--swap-cost", type=float, default=0.01, help="objective cost of one swap")
+    parser.add_argument("--strengthen", action="store_true")
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--no-solve", action="store_true", help="only build")
+    args = parser.parse_args()
+
+    S, T, V = args.stations, args.periods, args.vehicles
+    print(
+        f"{'seed':>4}  {'model':<8}{'rows':>9}{'cols':>9}{'build':>8}{'solve':>8}{'gap':>8}"
+        f"{'lost':>6}{'swaps':>7}{'objective':>11}"
+    )
+    for seed in range(args.seeds):
+        if args.data_dir:
+            instance = load_electric_instance(S, T, V, args.data_dir, args.start + 96 * seed)
+        else:
+            instance = random_electric_instance(S, T, V, seed=seed)
+        instance.pop("w_s", None)
+        for B in [None, *args.buckets]:
+            row = run(instance, B, args)
+            name = "e-bike" if B is None else f"B={B}"
+            solve = f"{row['solve']:>8.3f}" if row["solve"] is not None else f"{'-':>8}"
+            gap = f"{row['gap']:>8.2%}" if row["gap"] is not None else f"{'-':>8}"
+            lost = f"{row['lost']:>6.0f}" if row["lost"] is not None else f"{'-':>6}"
+            swaps = f"{row['swaps']:>7.0f}" if row["swaps"] is not None else f"{'-':>7}"
+            objective = f"{row['objective']:>11.2f}" if row["objective"] is not None else f"{'-':>11}"
+            print(
+                f"{seed:>4}  {name:<8}{row['rows']:>9}{row['cols']:>9}{row['build']:>8.3f}{solve}{gap}"
+                f"{lost}{swaps}{objective}"
+            )
+
+
+if __name__ == "__main__":
+    main()
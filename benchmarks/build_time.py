@@ -0,0 +1,129 @@
+"""
+Build-time comparison between the original per-(s,t) constraint lists and the
+vectorized builders in rebalancing/model.py
+
+Run from the repository root:
+
+    python -m benchmarks.build_time
+    python -m benchmarks.build_time --stations 30 100 --periods 30 96 --legacy-max-cells 3000
+
+"Build" is the time to create the variables and constraints, "canonicalize"
+is the time cvxpy needs to turn the problem into solver matrices
+(get_problem_data); nothing is solved. The legacy builder is skipped above
+--legacy-max-cells stations*periods*vehicles because it takes hours there.
+"""
+import argparse
+import time
+
+import cvxpy as cp
+import numpy as np
+
+from rebalancing import build_baseline_model, build_electric_model
+from rebalancing.data import random_electric_instance, random_instance
+
+
+# -----Original formulation (as in baseline_problem.py before vectorizing)-----
+def build_legacy_baseline_model(f_plus, f_minus, C_s, C_hat_v, d_s_1, d_hat_v_1):
+    S, T = f_plus.shape
+    V = len(C_hat_v)
+    d = cp.Variable((S, T), integer=True)
+    d_hat = cp.Variable((V, T), integer=True)
+    x_plus = cp.Variable((S, T), integer=True)
+    x_minus = cp.Variable((S, T), integer=True)
+    r_plus, r_minus, z = {}, {}, {}
+    for t in range(T):
+        r_plus[t] = cp.Variable((S, V), integer=True)
+        r_minus[t] = cp.Variable((S, V), integer=True)
+        z[t] = cp.Variable((S, V), boolean=True)
+
+    constraints = [d_hat[:, 0] == d_hat_v_1]
+    constraints += [
+        d_hat[:, t+1] == d_hat[:, t] + sum([r_plus[t][s, :] - r_minus[t][s, :] for s in range(S)])
+        for t in range(T-1)
+    ]
+    constraints += [d[:, 0] == d_s_1]
+    constraints += [
+        d[:, t+1] == (
+            d[:, t]
+            - sum([r_plus[t][:, v] - r_minus[t][:, v] for v in range(V)])
+            - x_plus[:, t] + x_minus[:, t]
+        )
+        for t in range(T-1)
+    ]
+    constraints += [sum([z[t][s, :] for s in range(S)]) == 1 for t in range(T)]
+    constraints += [
+        r_plus[t][s, :] + r_minus[t][s, :] <= cp.multiply(C_hat_v, z[t][s, :])
+        for s in range(S) for t in range(T)
+    ]
+    constraints += [d_hat >= 0] + [d_hat[:, t] <= C_hat_v for t in range(T)]
+    constraints += [d >= 0] + [d[:, t] <= C_s for t in range(T)]
+    constraints += [x_plus >= 0, x_plus <= f_plus, x_minus >= 0, x_minus <= f_minus]
+    constraints += [0 <= r_plus[t] for t in range(T)]
+    constraints += [r_plus[t][s, :] <= C_hat_v for s in range(S) for t in range(T)]
+    constraints += [r_minus[t][s, :] <= C_hat_v for s in range(S) for t in range(T)]
+    constraints += [r_minus[t][s, :] >= 0 for s in range(S) for t in range(T)]
+
+    objective = cp.Minimize(sum(sum(f_plus - x_plus)) + sum(sum(f_minus - x_minus)))
+    return cp.Problem(objective, constraints)
+
+
+def time_build(build, instance, solver):
+    start = time.perf_counter()
+    problem = build(**instance)
+    if not isinstance(problem, cp.Problem):
+        problem = problem.problem
+    built = time.perf_counter()
+    problem.get_problem_data(solver)
+    done = time.perf_counter()
+    return built - start, done - built, problem
+
+
+def check_same_optimum(S=6, T=8, V=2, seed=0, solver=cp.HIGHS):
+    """
+    Solve a small, demand-heavy random instance with both builders and compare the optima
+    """
+    instance = random_instance(S, T, V, seed, rate=6)
+    legacy = build_legacy_baseline_model(**instance)
+    legacy.solve(solver=solver)
+    model = build_baseline_model(**instance)
+    model.solve(solver=solver)
+    return legacy.value, model.problem.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[30, 100, 300])
+    parser.add_argument("--periods", type=int, nargs="+", default=[30, 96, 672])
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--solver", default=cp.GUROBI)
+    parser.add_argument("--legacy-max-cells", type=int, default=30 * 96)
+    parser.add_argument("--check-solver", default=cp.HIGHS, help="solver for the small same-optimum check")
+    args = parser.parse_args()
+
+    legacy_value, vectorized_value = check_same_optimum(solver=args.check_solver)
+    print(f"Same-optimum check: legacy {legacy_value}, vectorized {vectorized_value}")
+    print()
+
+    header = f"{'model':<9}{'S':>5}{'T':>5}{'V':>3}  {'legacy build':>12} {'legacy canon':>12}  {'vec build':>10} {'vec canon':>10}  {'constraints':>18}"
+    print(header)
+    V = args.vehicles
+    for S in args.stations:
+        for T in args.periods:
+            instance = random_instance(S, T, V)
+            vec_build, vec_canon, vec_problem = time_build(build_baseline_model, instance, args.solver)
+            if S * T * V <= args.legacy_max_cells:
+                leg_build, leg_canon, leg_problem = time_build(build_legacy_baseline_model, instance, args.solver)
+                legacy = f"{leg_build:>12.3f} {leg_canon:>12.3f}"
+                counts = f"{len(leg_problem.constraints):>8} -> {len(vec_problem.constraints):<6}"
+            else:
+                legacy = f"{'skipped':>12} {'skipped':>12}"
+                counts = f"{'':>8} -> {len(vec_problem.constraints):<6}"
+            print(f"{'baseline':<9}{S:>5}{T:>5}{V:>3}  {legacy}  {vec_build:>10.3f} {vec_canon:>10.3f}  {counts}")
+
+            instance = random_electric_instance(S, T, V)
+            vec_build, vec_canon, vec_problem = time_build(build_electric_model, instance, args.solver)
+            print(f"{'e-bike':<9}{S:>5}{T:>5}{V:>3}  {'':>12} {'':>12}  {vec_build:>10.3f} {vec_canon:>10.3f}  {'':>8} -> {len(vec_problem.constraints):<6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Build time of the K-commodity builder as the number of commodities grows
+
+Run from the repository root:
+
+    python -m benchmarks.commodities
+    python -m benchmarks.commodities --stations 100 --periods 96 --vehicles 3 --commodities 1 2 4 8 16 32
+
+The first two commodities are the bikes and e-bikes of
+random_electric_instance. Every further one gets random demand, takes a
+quarter of a bike's room in the shared vehicle capacity and no docks
+(like batteries). For K=1 and K=2 there is no shared capacity and the
+baseline and e-bike gurobipy builders, which wrap the K=1 and K=2
+models, are built on the same instance for comparison; nothing is solved
+unless --solve is given.
+"""
+import argparse
+
+import numpy as np
+
+from rebalancing.commodity import build_commodity_gurobi, commodity_instance
+from rebalancing.data import random_electric_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+
+
+def random_commodity_instance(S, T, V, K, seed=0):
+    instance = commodity_instance(random_electric_instance(S, T, V, seed=seed))
+    rng = np.random.default_rng([seed, K])
+    extra = max(K - 2, 0)
+    pad = lambda name, values: np.concatenate([instance[name], values])[:K]
+    instance.update(
+        f_plus=pad("f_plus", rng.poisson(0.3, (extra, S, T)).astype(float)),
+        f_minus=pad("f_minus", rng.poisson(0.3, (extra, S, T)).astype(float)),
+        d_s_1=pad("d_s_1", rng.integers(0, 6, (extra, S)).astype(float)),
+        d_v_1=pad("d_v_1", np.zeros((extra, V))),
+        C_kv=pad("C_kv", np.full((extra, V), 40.0)),
+        value=pad("value", np.full(extra, 0.5)),
+        C_v=np.full(V, 60.0),
+        space=np.concatenate([[1, 1], np.full(extra, 0.25)])[:K],
+        dock=np.concatenate([[1, 1], np.zeros(extra)])[:K],
+        loss=None,
+    )
+    if K <= 2:
+        instance.update(C_v=None, space=None, dock=None)
+    return instance
+
+
+def legacy(instance, K):
+    """
+    The baseline / e-bike builder inputs of a K=1 / K=2 commodity instance
+    """
+    f_plus, f_minus, d_s_1, d_v_1, C_kv = (instance[name] for name in ("f_plus", "f_minus", "d_s_1", "d_v_1", "C_kv"))
+    inputs = dict(
+        f_plus=f_plus[0], f_minus=f_minus[0], C_s=instance["C_s"], C_hat_v=C_kv[0], d_s_1=d_s_1[0], d_hat_v_1=d_v_1[0],
+    )
+    if K == 1:
+        return build_baseline_gurobi, inputs
+    inputs.update(
+        f_bar_plus=f_plus[1], f_bar_minus=f_minus[1], C_tilde_v=C_kv[1], d_bar_s_1=d_s_1[1], d_tilde_v_1=d_v_1[1],
+    )
+    return build_electric_gurobi, inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--periods", type=int, default=96)
+    parser.add_argument("--vehicles", type=int, default=3)
+    parser.add_argument("--commodities", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeats", type=int, default=3, help="builds per case; the fastest is reported")
+    parser.add_argument("--solve", action="store_true")
+    parser.add_argument("--time-limit", type=float, default=60)
+    args = parser.parse_args()
+
+    S, T, V = args.stations, args.periods, args.vehicles
+    print(f"S={S} T={T} V={V}")
+    print(f"{'K':>4}  {'builder':<10}{'rows':>10}{'cols':>10}{'build':>9}{'per K':>9}{'solve':>9}  objective")
+    for K in args.commodities:
+        instance = random_commodity_instance(S, T, V, K)
+        cases = [("commodity", build_commodity_gurobi, instance)]
+        if K in (1, 2):
+            cases.append(("legacy", *legacy(instance, K)))
+        for name, build, inputs in cases:
+            models = [build(**inputs) for _ in range(args.repeats)]
+            model = min(models, key=lambda model: model.build_time)
+            solve, objective = "-", "-"
+            if args.solve:
+                model.solve(OutputFlag=0, TimeLimit=args.time_limit)
+                solve, objective = f"{model.model.Runtime:.3f}", model.objective_value
+            print(
+                f"{K:>4}  {name:<10}{model.model.NumConstrs:>10}{model.model.NumVars:>10}"
+                f"{model.build_time:>9.3f}{model.build_time / K:>9.3f}{solve:>9}  {objective}"
+            )
+
+
+if __name__ == "__main__":
+    main()
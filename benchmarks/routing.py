@@ -0,0 +1,107 @@
+"""
+Model size, build and solve time of travel-time routing with dense versus
+pruned arc sets
+
+Run from the repository root:
+
+    python -m benchmarks.routing
+    python -m benchmarks.routing --stations 30 100 300 --periods 16 --vehicles 2 --no-solve
+    python -m benchmarks.routing --data-dir synthetic --stations 100 300 --periods 16
+
+Every instance is built with the direct gurobipy backend three times:
+without routing ("free", z may jump anywhere), with all S^2 arcs and the
+unreachable ones fixed to 0 through their bounds ("dense"), and with the
+reachable arcs of routing.reachable_arcs only ("pruned"). Stations are
+spread uniformly over a --side km square, or taken from the distances.npy
+of --data-dir. Dense and pruned models have the same optimum; the free
+model is a relaxation of both.
+"""
+import argparse
+
+import numpy as np
+
+from rebalancing.data import random_instance, station_distances
+from rebalancing.gurobi_backend import build_baseline_gurobi
+from rebalancing.routing import L_T, SERVICE, SPEED, dense_arcs, reach_km, reachability, arc_list
+from rebalancing.synthetic import DETOUR
+
+VARIANTS = ("free", "dense", "pruned")
+
+
+def random_distances(S, side, seed=0):
+    coordinates = np.random.default_rng([seed, S]).uniform(0, side, (S, 2))
+    return DETOUR * np.hypot(*(coordinates[:, None, :] - coordinates[None, :, :]).transpose(2, 0, 1))
+
+
+def run(instance, variant, reach, solve, time_limit):
+    S = reach.shape[0]
+    arcs = {"free": None, "dense": dense_arcs(S), "pruned": arc_list(reach)}[variant]
+    model = build_baseline_gurobi(**instance, arcs=arcs)
+    build_time = model.build_time
+    if variant == "dense":
+        V, T = model.V, model.T
+        high = np.repeat(reach.toarray().ravel().astype(float), V)[:, None] * np.ones(T - 1)
+        model.tighten_bounds("y", high=high)
+    row = {
+        "arcs": 0 if arcs is None else len(arcs),
+        "rows": model.model.NumConstrs,
+        "cols": model.model.NumVars,
+        "build": build_time,
+        "solve": None, "gap": None, "objective": None,
+    }
+    if solve:
+        model.solve(OutputFlag=0, TimeLimit=time_limit)
+        row.update(solve=model.model.Runtime, gap=model.mip_gap, objective=model.objective_value)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[8, 12])
+    parser.add_argument("--periods", type=int, nargs="+", default=[8])
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[1])
+    parser.add_argument("--seeds", type=int, default=2, help="random instances per size")
+    parser.add_argument("--rate", type=float, default=2.0, help="mean rentals per station and period")
+    parser.add_argument("--data-dir", help="take D_ij from distances.npy here instead of random stations")
+    parser.add_argument("--side", type=float, default=3.0, help="km side of the square of random stations")
+    parser.add_argument("--minutes", type=float, default=L_T, help="period length L_t")
+    parser.add_argument("--speed", type=float, default=SPEED, help="km/h")
+    parser.add_argument("--service", type=float, default=SERVICE, help="minutes per period spent at the station")
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--no-solve", action="store_true", help="only build")
+    args = parser.parse_args()
+
+    print(f"Arcs up to {reach_km(args.minutes, args.speed, args.service):.2f} km")
+    print(
+        f"{'S':>5}{'T':>5}{'V':>3}{'seed':>5}  {'arcs':<8}{'count':>8}{'rows':>9}{'cols':>9}"
+        f"{'build':>8}{'solve':>8}{'gap':>8}  objective"
+    )
+    totals = {variant: [0.0, 0.0] for variant in VARIANTS}
+    for S in args.stations:
+        if args.data_dir:
+            D_ij = station_distances(args.data_dir, S)
+            if D_ij is None:
+                parser.error(f"no distance matrix in {args.data_dir}")
+        for T in args.periods:
+            for V in args.vehicles:
+                for seed in range(args.seeds):
+                    if not args.data_dir:
+                        D_ij = random_distances(S, args.side, seed)
+                    reach = reachability(D_ij, args.minutes, args.speed, args.service)
+                    instance = random_instance(S, T, V, seed=seed, rate=args.rate)
+                    for variant in VARIANTS:
+                        row = run(instance, variant, reach, not args.no_solve, args.time_limit)
+                        totals[variant][0] += row["build"]
+                        totals[variant][1] += row["solve"] or 0
+                        solve = f"{row['solve']:>8.3f}" if row["solve"] is not None else f"{'-':>8}"
+                        gap = f"{row['gap']:>8.2%}" if row["gap"] is not None else f"{'-':>8}"
+                        print(
+                            f"{S:>5}{T:>5}{V:>3}{seed:>5}  {variant:<8}{row['arcs']:>8}{row['rows']:>9}{row['cols']:>9}"
+                            f"{row['build']:>8.3f}{solve}{gap}  {row['objective']}"
+                        )
+    for variant, (build, solve) in totals.items():
+        print(f"Total {variant:<7} build {build:.3f}s, solve {solve:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Solve time and MIP gap of every installed MIP solver on the same instances
+
+Run from the repository root:
+
+    python -m benchmarks.solver_compare
+    python -m benchmarks.solver_compare --data-dir . --periods 30 96 --vehicles 1 3 --time-limit 120
+    python -m benchmarks.solver_compare --solvers HIGHS SCIP --presets default feasibility optimality
+
+Every instance is built once per run with the cvxpy builders and solved
+with each solver and tuning preset (rebalancing/solvers.py) under the same
+time limit, single-threaded unless --threads is given. "solve" is the
+solver's own time, "canon" the rest of problem.solve(). "vs best" is the
+objective relative to the best one found for that instance, so a solver
+that stops at the time limit with a worse plan shows up even when it
+reports no gap. Without --data-dir the instances are random ones with the
+magnitudes of the 30-station data.
+"""
+import argparse
+import time
+
+from rebalancing import build_baseline_model, build_electric_model
+from rebalancing.data import load_baseline_instance, load_electric_instance, random_electric_instance, random_instance
+from rebalancing.solvers import PRESETS, available_solvers, solver_options
+
+FORMULATIONS = {
+    "baseline": (random_instance, load_baseline_instance, build_baseline_model),
+    "e-bike": (random_electric_instance, load_electric_instance, build_electric_model),
+}
+
+
+def run(build, instance, solver, preset, time_limit, threads):
+    model = build(**instance)
+    start = time.perf_counter()
+    try:
+        model.solve(**solver_options(solver, time_limit, threads=threads, preset=preset))
+    except Exception as error:
+        return {"status": f"error: {type(error).__name__}", "total": time.perf_counter() - start}
+    total = time.perf_counter() - start
+    stats = model.problem.solver_stats
+    solve_time = stats.solve_time if stats is not None and stats.solve_time is not None else total
+    return {
+        "status": model.problem.status,
+        "solve": solve_time,
+        "canon": total - solve_time,
+        "total": total,
+        "gap": model.mip_gap,
+        "objective": model.objective_value,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[10])
+    parser.add_argument("--periods", type=int, nargs="+", default=[12])
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--data-dir", help="use the demand files in this folder instead of random instances")
+    parser.add_argument("--solvers", nargs="+", default=None, help="default: every installed MIP solver")
+    parser.add_argument("--presets", nargs="+", default=["default"], choices=["default", "feasibility", "optimality"])
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--formulations", nargs="+", default=list(FORMULATIONS), choices=list(FORMULATIONS))
+    args = parser.parse_args()
+
+    solvers = [solver.upper() for solver in args.solvers] if args.solvers else available_solvers()
+    unknown = [solver for solver in solvers if solver not in PRESETS]
+    if unknown:
+        parser.error(f"unknown solvers {unknown}; choose from {list(PRESETS)}")
+
+    print(
+        f"{'model':<9}{'S':>5}{'T':>5}{'V':>3}  {'solver':<8}{'preset':<13}{'canon':>8}{'solve':>9}"
+        f"{'gap':>9}{'vs best':>9}  {'status':<16}objective"
+    )
+    totals = {}
+    for name in args.formulations:
+        make_instance, load_instance, build = FORMULATIONS[name]
+        for S in args.stations:
+            for T in args.periods:
+                for V in args.vehicles:
+                    if args.data_dir:
+                        instance = load_instance(S=S, T=T, V=V, data_dir=args.data_dir)
+                    else:
+                        instance = make_instance(S, T, V)
+                    rows = [
+                        (solver, preset, run(build, instance, solver, preset, args.time_limit, args.threads))
+                        for solver in solvers for preset in args.presets
+                    ]
+                    objectives = [row["objective"] for _, _, row in rows if row.get("objective") is not None]
+                    best = min(objectives) if objectives else None
+                    for solver, preset, row in rows:
+                        totals[solver, preset] = totals.get((solver, preset), 0.0) + row["total"]
+                        objective = row.get("objective")
+                        gap = f"{row['gap']:>9.2%}" if row.get("gap") is not None else f"{'-':>9}"
+                        if objective is None or best is None:
+                            versus = f"{'-':>9}"
+                        else:
+                            versus = f"{(objective - best) / max(abs(best), 1e-9):>9.2%}"
+                        timings = (
+                            f"{row['canon']:>8.3f}{row['solve']:>9.3f}" if "solve" in row else f"{'-':>8}{'-':>9}"
+                        )
+                        print(
+                            f"{name:<9}{S:>5}{T:>5}{V:>3}  {solver:<8}{preset:<13}{timings}{gap}{versus}  "
+                            f"{row['status']:<16}{objective}"
+                        )
+    print("Total time per solver and preset:")
+    for (solver, preset), seconds in totals.items():
+        print(f"  {solver:<8}{preset:<13}{seconds:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
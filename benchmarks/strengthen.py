@@ -0,0 +1,79 @@
+"""
+Effect of model strengthening (symmetry breaking + bound propagation) on
+model size and solve time
+
+Run from the repository root:
+
+    python -m benchmarks.strengthen
+    python -m benchmarks.strengthen --stations 30 --periods 30 96 --vehicles 2 3 5 --time-limit 300
+
+Every instance is built with the direct gurobipy backend twice, as is and
+with strengthen=True, and solved with the same time limit. rows/cols are
+the sizes handed to Gurobi; "removed" and "tightened" come from
+model.reduction. The vehicles all have the same capacity, as in the
+scripts, so every extra vehicle adds a symmetry-breaking row.
+"""
+import argparse
+
+from rebalancing.data import random_electric_instance, random_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+
+FORMULATIONS = {
+    "baseline": (random_instance, build_baseline_gurobi),
+    "e-bike": (random_electric_instance, build_electric_gurobi),
+}
+
+
+def run(build, instance, strengthen, time_limit):
+    model = build(**instance, strengthen=strengthen)
+    model.solve(OutputFlag=0, TimeLimit=time_limit)
+    reduction = model.reduction or {}
+    return {
+        "rows": model.model.NumConstrs,
+        "cols": model.model.NumVars,
+        "removed": f"{reduction.get('rows_removed', 0)}/{reduction.get('columns_removed', 0)}",
+        "tightened": reduction.get("bounds_tightened", 0),
+        "build": model.build_time,
+        "solve": model.model.Runtime,
+        "gap": model.mip_gap,
+        "objective": model.objective_value,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[6])
+    parser.add_argument("--periods", type=int, nargs="+", default=[8])
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--seeds", type=int, default=3, help="random instances per size")
+    parser.add_argument("--rate", type=float, default=2.0, help="mean rentals per station and period")
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--formulations", nargs="+", default=list(FORMULATIONS), choices=list(FORMULATIONS))
+    args = parser.parse_args()
+
+    print(
+        f"{'model':<9}{'S':>4}{'T':>5}{'V':>3}{'seed':>5}  {'strengthen':<11}{'rows':>7}{'cols':>7}"
+        f"{'removed':>12}{'tightened':>10}{'build':>8}{'solve':>8}{'gap':>8}  objective"
+    )
+    totals = {False: 0.0, True: 0.0}
+    for name in args.formulations:
+        make_instance, build = FORMULATIONS[name]
+        for S in args.stations:
+            for T in args.periods:
+                for V in args.vehicles:
+                    for seed in range(args.seeds):
+                        instance = make_instance(S, T, V, seed=seed)
+                        instance["f_plus"] = instance["f_plus"] * args.rate / 0.6
+                        for strengthen in (False, True):
+                            row = run(build, instance, strengthen, args.time_limit)
+                            totals[strengthen] += row["solve"]
+                            gap = f"{row['gap']:>8.2%}" if row["gap"] is not None else f"{'-':>8}"
+                            print(
+                                f"{name:<9}{S:>4}{T:>5}{V:>3}{seed:>5}  {str(strengthen):<11}{row['rows']:>7}{row['cols']:>7}"
+                                f"{row['removed']:>12}{row['tightened']:>10}{row['build']:>8.3f}{row['solve']:>8.3f}{gap}  {row['objective']}"
+                            )
+    print(f"Total solve time: {totals[False]:.3f}s as is, {totals[True]:.3f}s strengthened")
+
+
+if __name__ == "__main__":
+    main()
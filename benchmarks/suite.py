@@ -0,0 +1,241 @@
+"""
+Benchmark suite: build and solve scaling over stations, periods, vehicles
+and bike types, with a history file for catching regressions
+
+Run from the repository root (the demand files must be in --data-dir):
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --stations 30 100 --periods 30 96 --vehicles 1 3 --backend cvxpy gurobipy
+    python -m benchmarks.suite --no-solve --stations 30 300 1000 --periods 96 672
+
+Every (formulation, backend, S, T, V) case runs in a fresh process so its
+peak RSS is its own. A case records the data-load, build, canonicalization
+(cvxpy only) and solver times, peak RSS, variable and constraint counts,
+objective and MIP gap, and is appended as one JSON line to --history
+together with the git commit and host. Each new result is compared with
+the last one of the same case in the history, and slowdowns beyond
+--tolerance are flagged.
+
+Instances come from the demand files via rebalancing/data.py. Beyond the
+30 stations of the data, stations are inflated synthetically: copies of
+the real stations with Poisson-resampled demand and the same capacities
+and initial inventories (and beyond 5 vehicles, copies of the vehicles).
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import cvxpy as cp
+import numpy as np
+
+from rebalancing import build_baseline_model, build_electric_model
+from rebalancing.data import load_baseline_instance, load_electric_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+
+DATA_STATIONS = 30
+DATA_VEHICLES = 5
+FORMULATIONS = {
+    "baseline": (load_baseline_instance, {"cvxpy": build_baseline_model, "gurobipy": build_baseline_gurobi}),
+    "e-bike": (load_electric_instance, {"cvxpy": build_electric_model, "gurobipy": build_electric_gurobi}),
+}
+# Per-station inputs and whether they are demand (resampled) or copied
+STATION_INPUTS = {
+    "f_plus": True, "f_minus": True, "f_bar_plus": True, "f_bar_minus": True,
+    "C_s": False, "d_s_1": False, "d_bar_s_1": False, "w_s": False,
+}
+VEHICLE_INPUTS = ("C_hat_v", "C_tilde_v", "d_hat_v_1", "d_tilde_v_1")
+TIMED = ("load_time", "build_time", "canon_time", "solve_time")
+
+
+def inflate_instance(instance, S, seed=0):
+    """
+    Instance with S stations made of copies of the real ones; demand of the
+    copies is resampled from a Poisson distribution with the real demand as mean
+    """
+    rng = np.random.default_rng(seed)
+    inflated = dict(instance)
+    for name, resample in STATION_INPUTS.items():
+        if instance.get(name) is None:
+            continue
+        values = np.asarray(instance[name])
+        rows = np.resize(np.arange(len(values)), S)
+        copies = values[rows]
+        if resample:
+            copies = np.where(np.arange(S)[:, None] < len(values), copies, rng.poisson(copies))
+        inflated[name] = copies.astype(float) if resample else copies
+    return inflated
+
+
+def load_instance(formulation, S, T, V, data_dir=".", seed=0):
+    """
+    Instance of the data with S stations and V vehicles; vehicles beyond the
+    five of the scripts repeat their capacities and initial loads
+    """
+    load, _ = FORMULATIONS[formulation]
+    instance = load(S=min(S, DATA_STATIONS), T=T, V=min(V, DATA_VEHICLES), data_dir=data_dir)
+    if S > DATA_STATIONS:
+        instance = inflate_instance(instance, S, seed)
+    if V > DATA_VEHICLES:
+        instance.update({name: np.resize(instance[name], V) for name in VEHICLE_INPUTS if name in instance})
+    return instance
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_case(case, data_dir=".", solve=True, time_limit=300, solver=cp.GUROBI):
+    """
+    Load, build and solve one case; returns its record
+    """
+    formulation, backend, S, T, V = case["formulation"], case["backend"], case["S"], case["T"], case["V"]
+    record = dict(case)
+
+    start = time.perf_counter()
+    instance = load_instance(formulation, S, T, V, data_dir)
+    record["load_time"] = time.perf_counter() - start
+
+    build = FORMULATIONS[formulation][1][backend]
+    start = time.perf_counter()
+    model = build(**instance)
+    record["build_time"] = time.perf_counter() - start
+
+    if backend == "cvxpy":
+        metrics = model.problem.size_metrics
+        record["variables"] = metrics.num_scalar_variables
+        record["constraints"] = metrics.num_scalar_eq_constr + metrics.num_scalar_leq_constr
+        if solve:
+            model.solve(solver=solver, TimeLimit=time_limit) if solver == cp.GUROBI else model.solve(solver=solver)
+            record["canon_time"] = model.problem.compilation_time
+            record["solve_time"] = model.problem.solver_stats.solve_time
+        else:
+            start = time.perf_counter()
+            model.problem.get_problem_data(solver)
+            record["canon_time"] = time.perf_counter() - start
+    else:
+        record["variables"] = model.model.NumVars
+        record["constraints"] = model.model.NumConstrs
+        record["canon_time"] = 0.0
+        if solve:
+            model.solve(OutputFlag=0, TimeLimit=time_limit)
+            record["solve_time"] = model.model.Runtime
+
+    if solve:
+        record["objective"] = model.objective_value
+        record["mip_gap"] = model.mip_gap
+    record["peak_rss_mb"] = peak_rss_mb()
+    return record
+
+
+def _run_isolated(case, data_dir, solve, time_limit, solver):
+    try:
+        return run_case(case, data_dir, solve, time_limit, solver)
+    except Exception as error:
+        return {**case, "error": f"{type(error).__name__}: {error}"}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(record):
+    return tuple(record[name] for name in ("formulation", "backend", "S", "T", "V", "solved"))
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def regressions(record, history, tolerance=0.25, floor=0.05):
+    """
+    Timings of record that are more than `tolerance` slower than the last
+    run of the same case (ignoring timings under `floor` seconds)
+    """
+    previous = [row for row in history if case_key(row) == case_key(record) and "error" not in row]
+    if not previous:
+        return {}
+    last = previous[-1]
+    slower = {}
+    for name in TIMED + ("peak_rss_mb",):
+        old, new = last.get(name), record.get(name)
+        if old is None or new is None or max(old, new) < floor:
+            continue
+        if new > old * (1 + tolerance):
+            slower[name] = (old, new)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int, nargs="+", default=[10, 30])
+    parser.add_argument("--periods", type=int, nargs="+", default=[8, 30])
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--formulations", nargs="+", default=list(FORMULATIONS), choices=list(FORMULATIONS))
+    parser.add_argument("--backend", nargs="+", default=["cvxpy", "gurobipy"], choices=["cvxpy", "gurobipy"])
+    parser.add_argument("--solver", default=cp.GUROBI, help="cvxpy solver")
+    parser.add_argument("--no-solve", action="store_true", help="only load, build and canonicalize")
+    parser.add_argument("--time-limit", type=float, default=300)
+    parser.add_argument("--history", default="benchmarks/history.jsonl")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    history = read_history(args.history)
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+    }
+    cases = [
+        {"formulation": formulation, "backend": backend, "S": S, "T": T, "V": V, "solved": not args.no_solve}
+        for formulation in args.formulations for backend in args.backend
+        for S in args.stations for T in args.periods for V in args.vehicles
+    ]
+
+    print(
+        f"{'model':<9}{'backend':<9}{'S':>5}{'T':>5}{'V':>3}{'load':>8}{'build':>8}{'canon':>8}{'solve':>8}"
+        f"{'RSS MB':>8}{'vars':>9}{'cons':>9}{'gap':>8}  objective"
+    )
+    for case in cases:
+        # A fresh process per case, so the peak RSS belongs to that case alone
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            record = pool.submit(_run_isolated, case, args.data_dir, not args.no_solve, args.time_limit, args.solver).result()
+        record.update(run)
+        with open(args.history, "a") as f:
+            f.write(json.dumps(record, default=float) + "\n")
+        if "error" in record:
+            print(f"{case['formulation']:<9}{case['backend']:<9}{case['S']:>5}{case['T']:>5}{case['V']:>3}  {record['error']}")
+            continue
+        gap = f"{record['mip_gap']:>8.2%}" if record.get("mip_gap") is not None else f"{'-':>8}"
+        seconds = "".join(f"{record[name]:>8.3f}" if record.get(name) is not None else f"{'-':>8}" for name in TIMED)
+        print(
+            f"{case['formulation']:<9}{case['backend']:<9}{case['S']:>5}{case['T']:>5}{case['V']:>3}{seconds}"
+            f"{record['peak_rss_mb']:>8.0f}{record['variables']:>9}{record['constraints']:>9}{gap}  {record.get('objective', '-')}"
+        )
+        for name, (old, new) in regressions(record, history, args.tolerance).items():
+            print(f"    regression: {name} {old:.3f} -> {new:.3f}")
+    print(f"Appended {len(cases)} records to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Time to first incumbent and final gap with and without the greedy MIP start
+
+Run from the repository root:
+
+    python -m benchmarks.warm_start
+    python -m benchmarks.warm_start --stations 30 --periods 96 --vehicles 1 3 5 --time-limit 60
+    python -m benchmarks.warm_start --data-dir . --periods 96
+
+Every instance is solved twice with the direct gurobipy backend, once from
+scratch and once starting from rebalancing.heuristic.greedy_plan, with the
+same time limit. "first" is the Gurobi runtime at the first incumbent
+(for the warm start, the heuristic time plus the time until the start is
+accepted), "gap" the MIP gap when the solve stops. Without --data-dir the
+instances are random ones with the magnitudes of the 30-station data.
+"""
+import argparse
+import time
+
+from gurobipy import GRB
+
+from rebalancing.data import load_baseline_instance, load_electric_instance, random_electric_instance, random_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+from rebalancing.heuristic import greedy_plan, plan_objective
+
+FORMULATIONS = {
+    "baseline": (random_instance, load_baseline_instance, build_baseline_gurobi),
+    "e-bike": (random_electric_instance, load_electric_instance, build_electric_gurobi),
+}
+
+
+def solve_tracked(model, time_limit):
+    """
+    Solve and return (runtime at the first incumbent, final gap, objective, runtime)
+    """
+    first = []
+
+    def callback(gurobi_model, where):
+        if where == GRB.Callback.MIPSOL and not first:
+            first.append(gurobi_model.cbGet(GRB.Callback.RUNTIME))
+
+    model.model.setParam("OutputFlag", 0)
+    model.model.setParam("TimeLimit", time_limit)
+    model.model.optimize(callback)
+    gap = model.mip_gap
+    return (first[0] if first else None), gap, model.objective_value, model.model.Runtime
+
+
+def compare(build, instance, time_limit):
+    """
+    Rows for the cold solve and the greedy warm start of one instance
+    """
+    cold = solve_tracked(build(**instance), time_limit)
+
+    start = time.perf_counter()
+    plan = greedy_plan(**instance)
+    heuristic_time = time.perf_counter() - start
+    model = build(**instance)
+    model.set_start(plan)
+    first, gap, objective, runtime = solve_tracked(model, time_limit)
+    warm = (None if first is None else heuristic_time + first), gap, objective, runtime
+    return [
+        ("cold", None) + cold,
+        ("greedy", plan_objective(plan, instance)) + warm,
+    ]
+
+
+def _seconds(value):
+    return f"{value:>9.3f}" if value is not None else f"{'-':>9}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[10])
+    parser.add_argument("--periods", type=int, nargs="+", default=[12])
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--data-dir", help="use the demand files in this folder instead of random instances")
+    parser.add_argument("--formulations", nargs="+", default=list(FORMULATIONS), choices=list(FORMULATIONS))
+    args = parser.parse_args()
+
+    print(f"{'model':<9}{'S':>5}{'T':>5}{'V':>3}  {'start':<7}{'heuristic':>10}{'first':>9}{'solve':>9}{'gap':>9}  objective")
+    for name in args.formulations:
+        make_instance, load_instance, build = FORMULATIONS[name]
+        for S in args.stations:
+            for T in args.periods:
+                for V in args.vehicles:
+                    if args.data_dir:
+                        instance = load_instance(S=S, T=T, V=V, data_dir=args.data_dir)
+                    else:
+                        instance = make_instance(S, T, V)
+                    for start, heuristic, first, gap, objective, runtime in compare(build, instance, args.time_limit):
+                        heuristic = f"{heuristic:>10.1f}" if heuristic is not None else f"{'-':>10}"
+                        gap = f"{gap:>9.2%}" if gap is not None else f"{'-':>9}"
+                        print(
+                            f"{name:<9}{S:>5}{T:>5}{V:>3}  {start:<7}{heuristic}"
+                            f"{_seconds(first)}{_seconds(runtime)}{gap}  {objective}"
+                        )
+
+
+if __name__ == "__main__":
+    main()
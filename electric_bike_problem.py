@@ -1,10 +1,13 @@
 """
 Testing the baseline bike rebalancing problem
 """
-import cvxpy as cp
 import numpy as np
 import pandas as pd
 
+from rebalancing import Results, SolutionCache, build_electric_model
+from rebalancing.data import demand_matrix
+from rebalancing.solvers import solver_options
+
 # -----Sets / indices-----
 T = 30 # Num time periods
 S = 30 # Num stations
@@ -15,13 +18,13 @@ V = 1 # Num vehicles
 INVENTORY_FILEPATH = "./Initial_Inven.json"
 inven_init = pd.read_json(INVENTORY_FILEPATH)
 RENTALS_FILEPATH = "./rentals_classic.csv"
-rentals_df = pd.read_csv(RENTALS_FILEPATH, usecols=["rentals", "time_period", "station_id"])
 RENTALS_E_FILEPATH = "./rentals_electric.csv"
-rentals_e_df = pd.read_csv(RENTALS_E_FILEPATH, usecols=["rentals", "time_period", "station_id"])
 RETURNS_FILEPATH = "./returns_classic.csv"
-returns_df = pd.read_csv(RETURNS_FILEPATH, usecols=["returns", "time_period", "station_id"])
 RETURNS_E_FILEPATH = "./returns_electric.csv"
-returns_e_df = pd.read_csv(RETURNS_E_FILEPATH, usecols=["returns", "time_period", "station_id"])
+RESULTS_FILEPATH = "./electric_results.npz" # Solution arrays and metadata; see rebalancing/results.py
+PRINT_SOLUTION = False # Print every solution matrix; slow and very long for large S and T
+SOLVER = None # MIP solver, e.g. "GUROBI", "HIGHS", "SCIP"; None picks the best installed one (see rebalancing/solvers.py)
+CACHE_DIR = None # e.g. ".rebalancing_cache" to reuse the solution of identical inputs (see rebalancing/cache.py)
 
 
 # -----Setting parameters / input data-----
@@ -44,322 +47,130 @@ d_tilde_v_1 = d_tilde_v_1[:V] # Subset when we want a toy model with a small num
 
 a_classic = 1 # Value of classic ride
 a_electric = 2 # Value of electric ride
-w_s = np.random.randint(1, size=(S, T)) # Num "dead" e-bikes at each station at time t
-
-time_periods = list(range(96*500))
-f_plus = pd.pivot_table(
-    rentals_df, values="rentals", index="station_id", columns="time_period"
-).reindex(time_periods, axis='columns').fillna(0).to_numpy()[:S, :T] # Subset when we want a toy model with a small number of time periods
-f_minus = pd.pivot_table(
-    returns_df, values="returns", index="station_id", columns="time_period"
-).reindex(time_periods, axis='columns').fillna(0).to_numpy()[:S, :T] # Subset when we want a toy model with a small number of time periods
-f_bar_plus = pd.pivot_table(
-    rentals_e_df, values="rentals", index="station_id", columns="time_period"
-).reindex(time_periods, axis='columns').fillna(0).to_numpy()[:S, :T]
-f_bar_minus = pd.pivot_table(
-    returns_e_df, values="returns", index="station_id", columns="time_period"
-).reindex(time_periods, axis='columns').fillna(0).to_numpy()[:S, :T]
-
-# -----Variables-----
-d = cp.Variable((S, T), integer=True) # Num classic bikes at station s at time t
-d_bar = cp.Variable((S, T), integer=True) # Num e-bikes at s at t
-d_hat = cp.Variable((V, T), integer=True) # Num classic bikes in vehicle v at time t
-d_tilde = cp.Variable((V, T), integer=True) # Num e-bikes in v at t
-
-x_plus = cp.Variable((S, T), integer=True) # Num of successful classic bike trips starting at stations s at time t
-x_minus = cp.Variable((S, T), integer=True) # Num of successful classic returns starting at stations s at time t
-x_bar_plus = cp.Variable((S, T), integer=True) # Num of successful e-bike trips starting at stations s at time t
-x_bar_minus = cp.Variable((S, T), integer=True) # Num of successful e-bike returns starting at stations s at time t
-
-# Need to Frankenstein n-dimensional variables for n>2 in cvxpy...
-r_plus = {} # Num of bikes vehicle v picks up at stations s at time t
-r_minus = {} # Num of bikes vehicle v unloads up at stations s at time t
-r_bar_plus = {} # Num e-bikes vehicle v picks up at s at t
-r_bar_minus = {} # Num e-bikes vehicle v drops off at s at t
-z = {} # 1 if vehicle v is at station s at time t
-for t in range(T):
-    r_plus[t] = cp.Variable((S, V), integer=True)
-    r_minus[t] = cp.Variable((S, V), integer=True)
-    r_bar_plus[t] = cp.Variable((S, V), integer=True)
-    r_bar_minus[t] = cp.Variable((S, V), integer=True)
-    z[t] = cp.Variable((S, V), boolean=True)
-
-
-# -----Constraints-----
-# Initial d_hat
-d_hat_constraint = [
-    d_hat[:, 0] == d_hat_v_1
-]
-# Other d_hat
-d_hat_constraint.extend([
-    d_hat[:, t+1] == (
-        d_hat[:, t]
-        + sum([r_plus[t][s, :] - r_minus[t][s, :] for s in range(S)])
-    )
-
-    for t in range(T-1)
-])
-
-# Initial d_tilde
-d_tilde_constraint = [
-    d_tilde[:, 0] == d_tilde_v_1
-]
-# Other d_tilde
-d_tilde_constraint.extend([
-    d_tilde[:, t+1] == (
-        d_tilde[:, t]
-        + sum([r_bar_plus[t][s, :] - r_bar_minus[t][s, :] for s in range(S)])
-    )
-
-    for t in range(T-1)
-])
-
-# Initial d
-d_constraint = [
-    d[:, 0] == d_s_1
-]
-# Other d
-d_constraint.extend([
-    d[:, t+1] == (
-        d[:, t]
-        - sum([r_plus[t][:, v] - r_minus[t][:, v] for v in range(V)])
-        - x_plus[:, t] + x_minus[:, t]
-    )
-
-    for t in range(T-1)
-])
-
-# Initial d_bar
-d_bar_constraint = [
-    d_bar[:, 0] == d_bar_s_1
-]
-# Other d_bar
-d_bar_constraint.extend([
-    d_bar[:, t+1] == (
-        d_bar[:, t]
-        - sum([r_bar_plus[t][:, v] - r_bar_minus[t][:, v] for v in range(V)])
-        - x_bar_plus[:, t] + x_bar_minus[:, t] - w_s[:, t]
-    )
-
-    for t in range(T-1)
-])
-
-# z - each vehicle can only be in one location at a time
-z_constraint = [
-    sum([z[t][s, :] for s in range(S)]) == 1
-    for t in range(T)
-]
-
-# Capacity constraint classic
-capacity_constraint = [
-    r_plus[t][s, :] + r_minus[t][s, :] <= cp.multiply(C_hat_v,  z[t][s, :])
-    for s in range(S) for t in range(T)
-]
-# Capacity constraint electric
-capacity_electric_constraint = [
-    r_bar_plus[t][s, :] + r_bar_minus[t][s, :] <= cp.multiply(C_tilde_v,  z[t][s, :])
-    for s in range(S) for t in range(T)
-]
-
-# Limits on variables
-d_hat_limits = [
-    d_hat >= 0
-]
-d_hat_limits.extend([
-    d_hat[:, t] <= C_hat_v
-    for t in range(T)
-])
-
-d_tilde_limits = [
-    d_tilde >= 0
-]
-d_tilde_limits.extend([
-    d_tilde[:, t] <= C_tilde_v
-    for t in range(T)
-])
-
-d_limits = [
-    d >= 0 #TODO: Need to index here?
-]
-d_limits.extend([d_bar >= 0])
-d_limits.extend([
-    d[:, t] + d_bar[:, t] <= C_s
-    for t in range(T)
-])
-
-x_plus_limits = [
-    x_plus >= 0
-]
-x_plus_limits.extend([
-    x_plus <= f_plus
-])
-
-x_minus_limits = [
-    x_minus >= 0
-]
-x_minus_limits.extend([
-    x_minus <= f_minus
-])
-
-x_bar_plus_limits = [
-    x_bar_plus >= 0
-]
-x_bar_plus_limits.extend([
-    x_bar_plus <= f_bar_plus
-])
-
-x_bar_minus_limits = [
-    x_bar_minus >= 0
-]
-x_bar_minus_limits.extend([
-    x_bar_minus <= f_bar_minus
-])
-
-r_plus_limits = [
-    0 <= r_plus[t] for t in range(T)
-]
-r_plus_limits.extend([
-    r_plus[t][s, :] <= C_hat_v
-    for s in range(S) for t in range(T)
-])
-
-r_minus_limits = [
-    r_minus[t][s, :] <= C_hat_v
-    for s in range(S) for t in range(T)
-]
-r_minus_limits.extend([
-    r_minus[t][s, :] >= 0
-    for s in range(S) for t in range(T)
-])
-
-r_bar_plus_limits = [
-    0 <= r_bar_plus[t] for t in range(T)
-]
-r_bar_plus_limits.extend([
-    r_bar_plus[t][s, :] <= C_tilde_v
-    for s in range(S) for t in range(T)
-])
-
-r_bar_minus_limits = [
-    r_bar_minus[t][s, :] <= C_tilde_v
-    for s in range(S) for t in range(T)
-]
-r_bar_minus_limits.extend([
-    r_bar_minus[t][s, :] >= 0
-    for s in range(S) for t in range(T)
-])
-
-# Sum all constraints
-constraints = (
-    d_hat_constraint + d_tilde_constraint + d_constraint + d_bar_constraint + z_constraint
-    + capacity_constraint + capacity_electric_constraint + d_hat_limits + d_tilde_limits
-    + d_limits + x_plus_limits + x_minus_limits + x_bar_plus_limits + x_bar_minus_limits
-    + r_plus_limits + r_minus_limits + r_bar_plus_limits + r_bar_minus_limits
-)
-
-# -----Objective-----
-objective = (
-    (sum(sum(f_plus - x_plus)) + sum(sum(f_minus - x_minus))) * a_classic
-    + (sum(sum(f_bar_plus - x_bar_plus)) + sum(sum(f_bar_minus - x_bar_minus))) * a_electric
+w_s = None # Num "dead" e-bikes leaving each station at time t; battery charge and swaps are modeled in rebalancing/battery.py
+
+f_plus = demand_matrix(RENTALS_FILEPATH, "rentals", S, T) # Subset when we want a toy model with a small number of time periods
+f_minus = demand_matrix(RETURNS_FILEPATH, "returns", S, T) # Subset when we want a toy model with a small number of time periods
+f_bar_plus = demand_matrix(RENTALS_E_FILEPATH, "rentals", S, T)
+f_bar_minus = demand_matrix(RETURNS_E_FILEPATH, "returns", S, T)
+
+# -----Model-----
+# Variables, constraints and objective are built as whole-tensor blocks; see rebalancing/model.py
+model = build_electric_model(
+    f_plus, f_minus, f_bar_plus, f_bar_minus, C_s, C_hat_v, C_tilde_v,
+    d_s_1, d_bar_s_1, d_hat_v_1, d_tilde_v_1, a_classic=a_classic, a_electric=a_electric, w_s=w_s,
 )
-
-objective = cp.Minimize(objective)
-
-# -----Define problem-----
-prob = cp.Problem(objective, constraints)
+d = model["d"] # Num classic bikes at station s at time t
+d_bar = model["d_bar"] # Num e-bikes at s at t
+d_hat = model["d_hat"] # Num classic bikes in vehicle v at time t
+d_tilde = model["d_tilde"] # Num e-bikes in v at t
+x_plus = model["x_plus"] # Num of successful classic bike trips starting at stations s at time t
+x_minus = model["x_minus"] # Num of successful classic returns starting at stations s at time t
+x_bar_plus = model["x_bar_plus"] # Num of successful e-bike trips starting at stations s at time t
+x_bar_minus = model["x_bar_minus"] # Num of successful e-bike returns starting at stations s at time t
+objective = model.objective
+prob = model.problem
 
 # -----Define problem-----
-prob.solve(solver=cp.GUROBI, verbose=True)
+instance = dict(
+    f_plus=f_plus, f_minus=f_minus, f_bar_plus=f_bar_plus, f_bar_minus=f_bar_minus, C_s=C_s, C_hat_v=C_hat_v,
+    C_tilde_v=C_tilde_v, d_s_1=d_s_1, d_bar_s_1=d_bar_s_1, d_hat_v_1=d_hat_v_1, d_tilde_v_1=d_tilde_v_1,
+    a_classic=a_classic, a_electric=a_electric, w_s=w_s,
+)
+cache = SolutionCache(CACHE_DIR) if CACHE_DIR else None
+results = cache.get(instance) if cache else None # None: not cached yet, so solve
+if results is None:
+    prob.solve(**solver_options(SOLVER), verbose=True)
+    results = Results.from_model(
+        model,
+        dict(f_plus=f_plus, f_minus=f_minus, f_bar_plus=f_bar_plus, f_bar_minus=f_bar_minus, C_s=C_s, w_s=w_s),
+        config=dict(S=S, T=T, V=V, a_classic=a_classic, a_electric=a_electric),
+    )
+    if cache:
+        cache.put(instance, results)
+results.save(RESULTS_FILEPATH)
+z = results["z"] # (T, S, V); z[t] is 1 if vehicle v is at station s at time t
+r_bar_plus = results["r_bar_plus"] # Num e-bikes vehicle v picks up at s at t
+lost = results.lost_demand()
 
 # -----Visualize results-----
 station_ids = [f"s{i}" for i in range(S)]
 vehicle_ids = [f"v{i}" for i in range(V)]
 time_ids = [f"t{i}" for i in range(T)]
 
-print("-----Num classic bikes in each station over time-----")
-print(pd.DataFrame(d.value, index=station_ids, columns=time_ids))
+def print_solution():
+    print("-----Num classic bikes in each station over time-----")
+    print(pd.DataFrame(results["d"], index=station_ids, columns=time_ids))
 
-print("-----Num e-bikes in each station over time-----")
-print(pd.DataFrame(d_bar.value, index=station_ids, columns=time_ids))
+    print("-----Num e-bikes in each station over time-----")
+    print(pd.DataFrame(results["d_bar"], index=station_ids, columns=time_ids))
 
-print("-----Num of bikes in each vehicle-----")
-print(pd.DataFrame(d_hat.value, index=vehicle_ids, columns=time_ids))
+    print("-----Num of bikes in each vehicle-----")
+    print(pd.DataFrame(results["d_hat"], index=vehicle_ids, columns=time_ids))
 
-print("-----Num of e-bikes in each vehicle-----")
-print(pd.DataFrame(d_tilde.value, index=vehicle_ids, columns=time_ids))
+    print("-----Num of e-bikes in each vehicle-----")
+    print(pd.DataFrame(results["d_tilde"], index=vehicle_ids, columns=time_ids))
 
-# print("-----How many e-bikes vehicles pick up-----")
-# for t in range(T):
-#     print(f"Time = {t}")
-#     print(pd.DataFrame(r_bar_plus[t].value, index=station_ids, columns=vehicle_ids))
+    # print("-----How many e-bikes vehicles pick up-----")
+    # for t in range(T):
+    #     print(f"Time = {t}")
+    #     print(pd.DataFrame(r_bar_plus[t], index=station_ids, columns=vehicle_ids))
+
+    print("-----Successful classic trips-----")
+    print(pd.DataFrame(results["x_plus"], index=station_ids, columns=time_ids))
 
-print("-----Successful classic trips-----")
-print(pd.DataFrame(x_plus.value, index=station_ids, columns=time_ids))
+    print("-----Successful classic returns-----")
+    print(pd.DataFrame(results["x_minus"], index=station_ids, columns=time_ids))
 
-print("-----Successful classic returns-----")
-print(pd.DataFrame(x_minus.value, index=station_ids, columns=time_ids))
+    print("-----Successful e-bike trips-----")
+    print(pd.DataFrame(results["x_bar_plus"], index=station_ids, columns=time_ids))
 
-print("-----Successful e-bike trips-----")
-print(pd.DataFrame(x_bar_plus.value, index=station_ids, columns=time_ids))
+    print("-----Successful e-bike returns-----")
+    print(pd.DataFrame(results["x_bar_minus"], index=station_ids, columns=time_ids))
 
-print("-----Successful e-bike returns-----")
-print(pd.DataFrame(x_bar_minus.value, index=station_ids, columns=time_ids))
+    print("-----Lost classic rental demand-----")
+    print(pd.DataFrame(lost["classic_rentals"], index=station_ids, columns=time_ids))
 
-lost_rental_demand =  f_plus - x_plus.value
-print("-----Lost classic rental demand-----")
-print(pd.DataFrame(lost_rental_demand, index=station_ids, columns=time_ids))
+    print("-----Lost classic return demand-----")
+    print(pd.DataFrame(lost["classic_returns"], index=station_ids, columns=time_ids))
 
-lost_return_demand = f_minus - x_minus.value
-print("-----Lost classic return demand-----")
-print(pd.DataFrame(lost_return_demand, index=station_ids, columns=time_ids))
+    print("-----Lost e-bike rental demand-----")
+    print(pd.DataFrame(lost["ebike_rentals"], index=station_ids, columns=time_ids))
 
-lost_ebike_rental_demand =  f_bar_plus - x_bar_plus.value
-print("-----Lost e-bike rental demand-----")
-print(pd.DataFrame(lost_ebike_rental_demand, index=station_ids, columns=time_ids))
+    print("-----Lost e-bike return demand-----")
+    print(pd.DataFrame(lost["ebike_returns"], index=station_ids, columns=time_ids))
 
-lost_ebike_return_demand = f_bar_minus - x_bar_minus.value
-print("-----Lost e-bike return demand-----")
-print(pd.DataFrame(lost_ebike_return_demand, index=station_ids, columns=time_ids))
+if PRINT_SOLUTION:
+    print_solution()
 print("-----Ebike + Classic-----")
 print()
 print("-----Objective value-----")
-print(objective.value)
+print(results.objective)
 print()
 
 def visualize():
+    kpis = results.kpis()
     print("-----Trip info-----")
-    print('Successful classic trips:', np.sum(x_plus.value))
-    print('Successful classic returns:', np.sum(x_minus.value))
-    print('Successful ebike trips:', np.sum(x_bar_plus.value))
-    print('Successful ebike returns:', np.sum(x_bar_minus.value))
+    print('Successful classic trips:', kpis["successful_classic_rentals"])
+    print('Successful classic returns:', kpis["successful_classic_returns"])
+    print('Successful ebike trips:', kpis["successful_ebike_rentals"])
+    print('Successful ebike returns:', kpis["successful_ebike_returns"])
     print()
-    print('Lost classic rental demand:', np.sum(lost_rental_demand))
-    print('Lost classic return demand:', np.sum(lost_return_demand))
-    print('Lost ebike rental demand:', np.sum(lost_ebike_rental_demand))
-    print('Lost ebike return demand:', np.sum(lost_ebike_return_demand))
+    print('Lost classic rental demand:', kpis["lost_classic_rentals"])
+    print('Lost classic return demand:', kpis["lost_classic_returns"])
+    print('Lost ebike rental demand:', kpis["lost_ebike_rentals"])
+    print('Lost ebike return demand:', kpis["lost_ebike_returns"])
     print()
 
-    print('Successful total trips:', np.sum(x_plus.value) + np.sum(x_bar_plus.value))
-    print('Successful total returns:', np.sum(x_minus.value)+np.sum(x_bar_minus.value))
+    print('Successful total trips:', kpis["successful_classic_rentals"] + kpis["successful_ebike_rentals"])
+    print('Successful total returns:', kpis["successful_classic_returns"] + kpis["successful_ebike_returns"])
     print()
-    diff = 0
     print("-----Station Volatility -----")
-    for s in range(S):
-        diff += np.max(d.value[s] + d_bar.value[s]) - np.min(d.value[s] + d_bar.value[s])
-    print(f'total volatility of classic + ebikes: {diff}')
+    print(f'total volatility of classic + ebikes: {kpis["volatility"]}')
     print()
-    vehs = [[] for y in range(V)]
-    for t in range(T):
-        # print(f"Time = {t}")
-        # print(pd.DataFrame(z[t].value, index=station_ids, columns=vehicle_ids))
-        for v in range(V):
-            if np.where(z[t].value!=0)[0][v] not in vehs[v]:
-                vehs[v] = np.hstack((vehs[v],np.where(z[t].value!=0)[0][v]))
-    vehs = vehs[::-1] # swap axes.
 
     print("-----Where did the Vehicles Go?-----")
-    for v in range(V):
-        cnt = len(vehs[v])
+    for v, cnt in enumerate(kpis["unique_stations_visited"]):
         print(f'Total unique stations visited by vehicle {v}: {cnt}')
 
 visualize()
@@ -368,10 +179,10 @@ visualize()
 # for t in range(T):
 #     print(f"*****In time period {t}:*****")
 #     for v in range(V):
-#         print(f"Vehicle {v} is at station: {z[t].value[:, v]}")
+#         print(f"Vehicle {v} is at station: {z[t][:, v]}")
 #         print(f"Vehicle {v} has {d_hat.value[v, t]} bikes in the vehicle")
-#         print(f"Vehicle {v} leaves {r_minus[t].value[:, v]} at the station")
-#         print(f"Vehicle {v} picks up {r_plus[t].value[:, v]} at the station")
+#         print(f"Vehicle {v} leaves {r_minus[t][:, v]} at the station")
+#         print(f"Vehicle {v} picks up {r_plus[t][:, v]} at the station")
 #     for s in range(S):
 #         print(f"At station {s}:")
 #         print(f"There are {d.value[s, t]} bikes already")
@@ -0,0 +1,23 @@
+"""
+Bike rebalancing models with classic bikes and e-bikes
+"""
+from .model import (
+    RebalancingModel,
+    aggregation_matrices,
+    build_baseline_model,
+    build_electric_model,
+)
+from .gurobi_backend import (
+    GurobiRebalancingModel,
+    build_baseline_gurobi,
+    build_electric_gurobi,
+)
+from .commodity import CommodityModel, build_commodity_gurobi, commodity_instance
+from .battery import BatteryModel, battery_instance, build_battery_gurobi
+from .parametric import ParametricModel, capacity_split_sweep
+from .rolling import rolling_horizon
+from .results import Results
+from .cache import SolutionCache
+from .heuristic import greedy_plan
+from .anytime import IncumbentStream, solve_anytime
+from .simulator import day_scenarios, simulate
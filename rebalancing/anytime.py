@@ -0,0 +1,296 @@
+"""
+Anytime solving with time, gap and stall budgets
+
+Trucks are dispatched on schedule whether or not the MIP has been proven
+optimal. solve_anytime stops at the first of
+  - time_limit: seconds of solver time
+  - mip_gap: the relative gap it has to prove
+  - stall_time: seconds without a better incumbent (once there is one)
+and reports every improved incumbent as it is found, decoded into the
+arrays of model.solution() (d, z, r_*, ...), so a dispatcher can always
+take the best plan so far:
+
+    result = solve_anytime(model, instance, time_limit=60, mip_gap=0.01, stall_time=15,
+                           on_incumbent=lambda incumbent: dispatch(incumbent.solution))
+
+    stream = IncumbentStream(model, instance, time_limit=60)
+    for incumbent in stream:
+        dispatch(incumbent.solution)
+    print(stream.result.gap)
+
+With the instance given, the greedy plan (heuristic.py) is the MIP start,
+so a feasible plan exists from the first second; if the solver still has
+none when it stops, the greedy plan is returned with the gap against the
+solver's bound, provided it meets the model's rows (start_is_feasible).
+The first incumbent is only reported as the greedy one if its objective is
+the greedy plan's. Only gurobipy models (gurobi_backend.py) are supported,
+since cvxpy does not pass callbacks to the solver.
+
+    python -m rebalancing.anytime --model electric --periods 96 --time-limit 30 --gap 0.01 --stall 10
+"""
+import argparse
+import queue
+import threading
+
+import gurobipy as gp
+import numpy as np
+from gurobipy import GRB
+
+from .data import load_baseline_instance, load_electric_instance
+from .gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+from .heuristic import greedy_plan, plan_objective
+from .results import INPUT_NAMES, Results
+
+IMPROVEMENT = 1e-6 # relative objective decrease that counts as a better incumbent
+
+
+class Incumbent:
+    """
+    A feasible plan found during the solve: solver time, objective, best
+    bound and gap at that moment, and the decoded solution arrays
+    """
+    def __init__(self, time, objective, bound, solution, source="solver"):
+        self.time = time
+        self.objective = objective
+        self.bound = bound
+        self.gap = relative_gap(objective, bound)
+        self.solution = solution
+        self.source = source
+
+    def __repr__(self):
+        gap = "-" if self.gap is None else f"{self.gap:.2%}"
+        return f"Incumbent(time={self.time:.2f}, objective={self.objective}, gap={gap}, source={self.source!r})"
+
+
+class AnytimeResult:
+    """
+    Best plan when the solve stopped, its proven gap, why the solve stopped
+    and every incumbent on the way
+    """
+    def __init__(self, best, bound, stop_reason, status, incumbents, runtime):
+        self.best = best
+        self.solution = best.solution
+        self.objective = best.objective
+        self.bound = bound
+        self.gap = relative_gap(best.objective, bound)
+        self.stop_reason = stop_reason
+        self.status = status
+        self.incumbents = incumbents
+        self.runtime = runtime
+
+
+def relative_gap(objective, bound):
+    """
+    Gurobi's MIP gap |objective - bound| / |objective|, 0 for a proven zero
+    """
+    if objective is None or bound is None or abs(bound) >= GRB.INFINITY:
+        return None
+    if objective == bound:
+        return 0.0
+    return abs(objective - bound) / abs(objective) if objective != 0 else float("inf")
+
+
+def start_is_feasible(model, tolerance=1e-6):
+    """
+    Whether the MIP start of a gurobipy model is complete and meets its
+    bounds, integrality and rows
+    """
+    model.model.update()
+    start = np.asarray(model.x.Start)
+    if np.any(start >= GRB.UNDEFINED):
+        return False
+    integer = np.asarray(model.x.VType) != GRB.CONTINUOUS
+    if np.any(start < model.x.LB - tolerance) or np.any(start > model.x.UB + tolerance):
+        return False
+    if np.any(np.abs(start[integer] - np.round(start[integer])) > tolerance):
+        return False
+    rows = model.model.getConstrs()
+    if not rows:
+        return True
+    activity = model.model.getA() @ start
+    rhs = np.asarray(model.model.getAttr("RHS", rows))
+    sense = np.asarray(model.model.getAttr("Sense", rows))
+    violation = np.select(
+        [sense == GRB.LESS_EQUAL, sense == GRB.GREATER_EQUAL], [activity - rhs, rhs - activity], np.abs(activity - rhs),
+    )
+    return bool(np.all(violation <= tolerance))
+
+
+def _stop_reason(status, stalled):
+    if stalled:
+        return "stall"
+    if status == GRB.TIME_LIMIT:
+        return "time_limit"
+    if status == GRB.OPTIMAL:
+        return "gap"
+    if status == GRB.INTERRUPTED:
+        return "interrupted"
+    return f"status {status}"
+
+
+def solve_anytime(
+    model, instance=None, time_limit=None, mip_gap=None, stall_time=None, on_incumbent=None,
+    callback=None, **params,
+):
+    """
+    Solve a gurobipy model within the budgets; returns an AnytimeResult
+
+    on_incumbent is called with every improved Incumbent (from the solver's
+    thread of control, so it should return quickly). callback is an extra
+    Gurobi callback run first, e.g. Trace.gurobi_callback(). params are
+    further Gurobi parameters.
+    """
+    params.setdefault("OutputFlag", 0)
+    if time_limit is not None:
+        params["TimeLimit"] = time_limit
+    if mip_gap is not None:
+        params["MIPGap"] = mip_gap
+    for name, value in params.items():
+        model.model.setParam(name, value)
+
+    found = []
+    greedy = None
+    if instance is not None:
+        plan = greedy_plan(**instance)
+        greedy = Incumbent(0.0, float(plan_objective(plan, instance)), None, plan, source="greedy")
+        model.set_start(plan)
+    stalled = [False]
+    improved_at = [None]
+
+    def anytime_callback(gurobi_model, where):
+        if callback is not None:
+            callback(gurobi_model, where)
+        if where == GRB.Callback.MIPSOL:
+            objective = gurobi_model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            best = found[-1].objective if found else np.inf
+            if objective < best - IMPROVEMENT * max(1.0, abs(best)):
+                runtime = gurobi_model.cbGet(GRB.Callback.RUNTIME)
+                bound = gurobi_model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+                solution = model.decode(np.asarray(gurobi_model.cbGetSolution(model.x)))
+                incumbent = Incumbent(runtime, objective, bound if abs(bound) < GRB.INFINITY else None, solution)
+                found.append(incumbent)
+                improved_at[0] = runtime
+                if on_incumbent is not None:
+                    on_incumbent(incumbent)
+        elif where == GRB.Callback.MIP:
+            runtime = gurobi_model.cbGet(GRB.Callback.RUNTIME)
+            if improved_at[0] is None and gurobi_model.cbGet(GRB.Callback.MIP_SOLCNT) > 0:
+                improved_at[0] = runtime
+                objective = gurobi_model.cbGet(GRB.Callback.MIP_OBJBST)
+                # The accepted MIP start is an incumbent without a MIPSOL callback; a solution
+                # Gurobi found itself in presolve is picked up once the solve ends
+                if greedy is not None and abs(objective - greedy.objective) <= IMPROVEMENT * max(1.0, abs(objective)):
+                    bound = gurobi_model.cbGet(GRB.Callback.MIP_OBJBND)
+                    start = Incumbent(runtime, greedy.objective, bound if abs(bound) < GRB.INFINITY else None, greedy.solution, "greedy")
+                    found.append(start)
+                    if on_incumbent is not None:
+                        on_incumbent(start)
+            if stall_time is not None and improved_at[0] is not None and runtime - improved_at[0] > stall_time:
+                stalled[0] = True
+                gurobi_model.terminate()
+
+    model.model.optimize(anytime_callback)
+    status = model.model.Status
+    try:
+        bound = model.model.ObjBound
+    except gp.GurobiError:
+        bound = None
+    if bound is not None and abs(bound) >= GRB.INFINITY:
+        bound = None
+
+    if model.model.SolCount > 0:
+        best = Incumbent(model.model.Runtime, model.model.ObjVal, bound, model.solution())
+        # Solutions found in presolve never reach the callback
+        if not found or best.objective < found[-1].objective - IMPROVEMENT * max(1.0, abs(found[-1].objective)):
+            found.append(best)
+            if on_incumbent is not None:
+                on_incumbent(best)
+    elif greedy is not None and start_is_feasible(model):
+        # The solver has no plan (e.g. stopped before it processed the start); fall back to the greedy one
+        best = greedy
+        if on_incumbent is not None:
+            on_incumbent(greedy)
+    else:
+        raise RuntimeError(f"no feasible plan within the budget (Gurobi status {status})")
+    return AnytimeResult(best, bound, _stop_reason(status, stalled[0]), status, found, model.model.Runtime)
+
+
+class IncumbentStream:
+    """
+    Iterate over the improved incumbents of solve_anytime as they are found
+
+    The solve runs in a background thread. A greedy fallback is yielded
+    too, so the last incumbent is always the plan to dispatch, and once the
+    iteration ends the AnytimeResult is in .result. Leaving the loop early
+    stops the solver.
+    """
+    def __init__(self, model, instance=None, **budgets):
+        self.model = model
+        self.instance = instance
+        self.budgets = budgets
+        self.result = None
+
+    def __iter__(self):
+        found = queue.Queue()
+        done = object()
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = solve_anytime(self.model, self.instance, on_incumbent=found.put, **self.budgets)
+            except Exception as error:
+                outcome["error"] = error
+            found.put(done)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                incumbent = found.get()
+                if incumbent is done:
+                    break
+                yield incumbent
+        finally:
+            if thread.is_alive():
+                self.model.model.terminate()
+            thread.join()
+        if "error" in outcome:
+            raise outcome["error"]
+        self.result = outcome["result"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["baseline", "electric"], default="electric")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--periods", type=int, default=96)
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--gap", type=float, help="stop at this relative MIP gap")
+    parser.add_argument("--stall", type=float, help="stop after this many seconds without a better incumbent")
+    parser.add_argument("--out", help="save the best plan as a results file (.npz or .parquet)")
+    args = parser.parse_args()
+
+    load, build = {
+        "baseline": (load_baseline_instance, build_baseline_gurobi),
+        "electric": (load_electric_instance, build_electric_gurobi),
+    }[args.model]
+    instance = load(S=args.stations, T=args.periods, V=args.vehicles, data_dir=args.data_dir, start=args.start)
+    model = build(**instance)
+    result = solve_anytime(
+        model, instance, time_limit=args.time_limit, mip_gap=args.gap, stall_time=args.stall, on_incumbent=print,
+    )
+    gap = "-" if result.gap is None else f"{result.gap:.2%}"
+    print(f"Stopped ({result.stop_reason}) after {result.runtime:.1f}s: objective {result.objective}, gap {gap}")
+    if args.out:
+        inputs = {name: instance[name] for name in INPUT_NAMES if instance.get(name) is not None}
+        Results(result.solution, inputs, {
+            "config": vars(args), "objective": result.objective, "mip_gap": result.gap,
+            "timings": {"solve_time": result.runtime}, "stop_reason": result.stop_reason,
+        }).save(args.out)
+
+
+if __name__ == "__main__":
+    main()
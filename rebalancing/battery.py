@@ -0,0 +1,422 @@
+"""
+E-bike battery charge as aggregated charge buckets
+
+Instead of tracking the charge of every e-bike, the e-bike inventories
+hold counts per charge bucket b = 0 (empty) ... B-1 (full): d_bar is
+(B*S, T) with row b*S + s, d_tilde (B*V, T), x_bar_plus / x_bar_minus
+(B*S, T) and r_bar_plus / r_bar_minus (B*S*V, T) with row b*S*V + s*V + v.
+
+  - Rentals only take bikes with at least min_charge, i.e. from bucket
+    ceil(min_charge * B) up; the others are the "dead" bikes that sit in
+    the docks until their battery is swapped (this replaces the w_s input
+    of the e-bike model).
+  - A trip uses trip_charge, i.e. drains round(trip_charge * B) buckets.
+    Rented bikes join a (B, T+1) pool of bikes being ridden, moved down
+    by the depletion_matrix, and returns take bikes out of that pool, so
+    the charge mix of the returns follows the rentals. A lost rental is
+    a bike that never comes back. Bikes already out at the start are
+    in_transit.
+  - A vehicle at a station can swap the battery of any bike there, which
+    moves it to the full bucket. Charged batteries are loaded at the
+    start (batteries[:, 0], a decision unless batteries_v_1 is given) and
+    the swapped-out ones go back into the vehicle, so the load takes
+    battery_space of the C_tilde_v e-bike space for the whole horizon.
+
+Every e-bike block is built once for all buckets as a Kronecker product
+with the B x B identity, so the model grows linearly with B:
+
+    model = build_battery_gurobi(**battery_instance(instance, B=4))
+    model.solve()
+    model.aggregate_solution() # d_bar, x_bar_plus, ... summed over the buckets
+
+    python -m benchmarks.battery --buckets 2 3 4 6 8
+"""
+import time
+
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+from .gurobi_backend import ColumnLayout, GurobiRebalancingModel, _bounds, _shift, _strengthen
+from .model import STACKED_VARIABLES, aggregation_matrices, identical_vehicles, symmetry_matrix
+from .routing import arc_incidence
+
+BUCKETS = 4 # Charge buckets: 0-25%, 25-50%, 50-75%, 75-100%
+MIN_CHARGE = 0.25 # Lowest charge an e-bike can be rented with
+TRIP_CHARGE = 0.25 # Charge one trip uses
+# Variables with one block of rows per charge bucket
+BUCKET_VARIABLES = ("d_bar", "d_tilde", "x_bar_plus", "x_bar_minus", "r_bar_plus", "r_bar_minus", "swap")
+
+
+class BatteryModel(GurobiRebalancingModel):
+    """
+    GurobiRebalancingModel with charge buckets: value() returns d_bar,
+    x_bar_plus and x_bar_minus as (B, S, T), d_tilde as (B, V, T),
+    r_bar_plus, r_bar_minus and swap as (B, T, S, V), batteries as (V, T)
+    and riding as (B, T+1); the classic variables keep their shapes
+    """
+    def __init__(self, B, *args, **kwargs):
+        self.B = B
+        super().__init__(*args, **kwargs)
+
+    def _reshape(self, name, values):
+        _, shape = self.layout.blocks[name]
+        value = values[self.layout.columns(name)].reshape(shape)
+        if name in ("r_bar_plus", "r_bar_minus", "swap"):
+            return value.reshape(self.B, self.S, self.V, self.T).transpose(0, 3, 1, 2)
+        if name in BUCKET_VARIABLES:
+            return value.reshape(self.B, -1, self.T)
+        if name in STACKED_VARIABLES:
+            return value.reshape(self.S, self.V, self.T).transpose(2, 0, 1)
+        return value
+
+    def _layout_order(self, name, value):
+        value = np.asarray(value, dtype=float)
+        if name in ("r_bar_plus", "r_bar_minus", "swap"):
+            value = value.transpose(0, 2, 3, 1)
+        elif name in STACKED_VARIABLES:
+            value = value.transpose(1, 2, 0)
+        return np.ravel(value)
+
+    def aggregate_solution(self):
+        """
+        Solution in the names and shapes of build_electric_gurobi, with the
+        e-bike variables summed over the buckets (for Results, kpis and
+        the simulator), plus the swaps per (T, S, V)
+        """
+        solution = self.solution()
+        if solution["z"] is None:
+            return None
+        aggregate = {name: value for name, value in solution.items() if name not in ("batteries", "riding")}
+        for name in BUCKET_VARIABLES:
+            aggregate[name] = solution[name].sum(axis=0)
+        aggregate["swaps"] = aggregate.pop("swap")
+        return aggregate
+
+
+def charge_buckets(B, min_charge=MIN_CHARGE, trip_charge=TRIP_CHARGE):
+    """
+    Lowest rentable bucket and buckets drained per trip for B buckets
+    """
+    min_bucket = min(max(int(np.ceil(min_charge * B - 1e-9)), 1), B - 1)
+    drain = max(int(np.rint(trip_charge * B)), 1)
+    return min_bucket, drain
+
+
+def depletion_matrix(B, drain=1):
+    """
+    (B, B) 0/1 matrix P with P[b, k] = 1 if a trip started in bucket k
+    ends in bucket b = max(k - drain, 0)
+    """
+    source = np.arange(B)
+    return sp.csr_matrix((np.ones(B), (np.maximum(source - drain, 0), source)), shape=(B, B))
+
+
+def charge_split(counts, B=BUCKETS, mix=None):
+    """
+    (B, n) integer split of the (n,) counts over the buckets by the mix
+    (default uniform), rounded by largest remainder so every column keeps
+    its total
+    """
+    counts = np.rint(np.asarray(counts, dtype=float))
+    mix = np.full(B, 1 / B) if mix is None else np.asarray(mix, dtype=float) / np.sum(mix)
+    share = mix[:, None] * counts[None, :]
+    split = np.floor(share)
+    remainder = share - split
+    missing = (counts - split.sum(axis=0)).astype(int)
+    rank = np.argsort(np.argsort(-remainder, axis=0, kind="stable"), axis=0)
+    return split + (rank < missing[None, :])
+
+
+def in_transit_bikes(f_bar_plus, f_bar_minus, B=BUCKETS, drain=1):
+    """
+    (B,) bikes out on a trip at the start: enough for the return demand of
+    every period if all rentals succeed, as if rented full
+    """
+    surplus = np.cumsum(np.sum(f_bar_minus, axis=0) - np.sum(f_bar_plus, axis=0))
+    in_transit = np.zeros(B)
+    in_transit[max(B - 1 - drain, 0)] = np.ceil(max(surplus.max(initial=0), 0))
+    return in_transit
+
+
+def battery_instance(instance, B=BUCKETS, mix=None):
+    """
+    Inputs of build_battery_gurobi for an electric instance dict: the
+    e-bikes at the stations are split over the buckets by mix (default
+    uniform), the ones in the vehicles are full; w_s is dropped
+    """
+    V = len(instance["C_tilde_v"])
+    e_v_1 = np.zeros((B, V))
+    e_v_1[-1] = instance["d_tilde_v_1"]
+    inputs = {
+        name: value for name, value in instance.items()
+        if name not in ("d_bar_s_1", "d_tilde_v_1", "w_s")
+    }
+    inputs.update(e_s_1=charge_split(instance["d_bar_s_1"], B, mix), e_v_1=e_v_1)
+    return inputs
+
+
+def build_battery_gurobi(
+    f_plus, f_minus, f_bar_plus, f_bar_minus, C_s, C_hat_v, C_tilde_v, d_s_1, e_s_1, d_hat_v_1, e_v_1,
+    a_classic=1, a_electric=2, min_charge=MIN_CHARGE, trip_charge=TRIP_CHARGE, battery_space=1, swap_cost=0,
+    batteries_v_1=None, in_transit=None, z_sv_1=None, arcs=None, env=None, strengthen=False,
+):
+    """
+    E-bike rebalancing with battery charge buckets and swaps
+
+    e_s_1: (B, S) and e_v_1: (B, V) initial e-bikes per bucket at the
+    stations and in the vehicles (see battery_instance); B is taken from
+    them. Bikes below min_charge cannot be rented, a trip uses
+    trip_charge (see charge_buckets), and a charged battery takes
+    battery_space of C_tilde_v and every swap costs swap_cost (a small
+    value keeps swaps that do not help out of the plan). batteries_v_1 fixes the (V,) batteries
+    loaded at the start, otherwise the load is chosen; in_transit is the
+    (B,) e-bikes being ridden at the start (default in_transit_bikes).
+    The other inputs are as in build_electric_gurobi.
+    """
+    start = time.perf_counter()
+    f_plus, f_minus = np.asarray(f_plus, dtype=float), np.asarray(f_minus, dtype=float)
+    f_bar_plus, f_bar_minus = np.asarray(f_bar_plus, dtype=float), np.asarray(f_bar_minus, dtype=float)
+    C_s, C_hat_v, C_tilde_v = (np.asarray(C, dtype=float) for C in (C_s, C_hat_v, C_tilde_v))
+    e_s_1, e_v_1 = np.asarray(e_s_1, dtype=float), np.asarray(e_v_1, dtype=float)
+    B = e_s_1.shape[0]
+    S, T = f_plus.shape
+    V = len(C_hat_v)
+    min_bucket, drain = charge_buckets(B, min_charge, trip_charge)
+    if battery_space <= 0:
+        raise ValueError("battery_space must be positive")
+    if in_transit is None:
+        in_transit = in_transit_bikes(f_bar_plus, f_bar_minus, B, drain)
+    battery_cap = np.floor(C_tilde_v / battery_space)
+
+    station_sum, vehicle_sum = aggregation_matrices(S, V)
+    current, following = _shift(T)
+    I_B = sp.eye(B, format="csr")
+    I_T = sp.eye(T, format="csr")
+    ones_B = sp.csr_matrix(np.ones((1, B)))
+
+    # -----Variables-----
+    layout = ColumnLayout()
+    layout.add("d", (S, T))
+    layout.add("d_hat", (V, T))
+    layout.add("x_plus", (S, T))
+    layout.add("x_minus", (S, T))
+    layout.add("r_plus", (S * V, T))
+    layout.add("r_minus", (S * V, T))
+    layout.add("d_bar", (B * S, T))
+    layout.add("d_tilde", (B * V, T))
+    layout.add("x_bar_plus", (B * S, T))
+    layout.add("x_bar_minus", (B * S, T))
+    layout.add("r_bar_plus", (B * S * V, T))
+    layout.add("r_bar_minus", (B * S * V, T))
+    layout.add("swap", (B * S * V, T))
+    layout.add("batteries", (V, T))
+    layout.add("riding", (B, T + 1))
+    layout.add("z", (S * V, T))
+    if arcs is not None:
+        arcs = np.asarray(arcs, dtype=np.int64).reshape(-1, 2)
+        layout.add("y", (len(arcs) * V, T - 1))
+
+    lb = np.zeros(layout.size)
+    ub = np.zeros(layout.size)
+    vtype = np.full(layout.size, GRB.INTEGER)
+    vtype[layout.columns("z")] = GRB.BINARY
+    z_lb = np.zeros((S * V, T))
+    if z_sv_1 is not None:
+        z_lb[:, 0] = np.ravel(z_sv_1)
+    _bounds(lb, ub, "z", layout, z_lb, 1)
+    if arcs is not None:
+        _bounds(lb, ub, "y", layout, 0, 1)
+        vtype[layout.columns("y")] = GRB.CONTINUOUS
+    # Integral once the rentals and returns are
+    vtype[layout.columns("riding")] = GRB.CONTINUOUS
+
+    def initial(n, first, high):
+        # (n, T) bounds with the first column fixed to first
+        low = np.zeros((n, T))
+        high = np.repeat(np.ravel(high)[:, None], T, axis=1).astype(float)
+        low[:, 0] = high[:, 0] = np.ravel(first)
+        return low, high
+
+    move_cap = np.repeat(np.tile(C_hat_v, S)[:, None], T, axis=1)
+    e_move_cap = np.tile(np.repeat(np.tile(C_tilde_v, S)[:, None], T, axis=1), (B, 1))
+    swap_cap = np.tile(np.repeat(np.tile(battery_cap, S)[:, None], T, axis=1), (B, 1))
+    swap_cap[(B - 1) * S * V:] = 0 # Full batteries are not swapped
+    rent_cap = np.tile(f_bar_plus, (B, 1))
+    rent_cap[:min_bucket * S] = 0 # Empty batteries are not rented
+    trips_lb = [np.zeros((S, T)), np.zeros((S, T))]
+    if strengthen:
+        # Moves and swaps of the last period change no inventory and its
+        # classic trips only appear in the objective
+        for cap in (move_cap, e_move_cap, swap_cap):
+            cap[:, -1] = 0
+        for low, demand in zip(trips_lb, (f_plus, f_minus)):
+            low[:, -1] = np.floor(demand[:, -1])
+    _bounds(lb, ub, "d", layout, *initial(S, d_s_1, C_s))
+    _bounds(lb, ub, "d_hat", layout, *initial(V, d_hat_v_1, C_hat_v))
+    _bounds(lb, ub, "x_plus", layout, trips_lb[0], f_plus)
+    _bounds(lb, ub, "x_minus", layout, trips_lb[1], f_minus)
+    _bounds(lb, ub, "r_plus", layout, 0, move_cap)
+    _bounds(lb, ub, "r_minus", layout, 0, move_cap)
+    _bounds(lb, ub, "d_bar", layout, *initial(B * S, e_s_1, np.tile(C_s, B)))
+    _bounds(lb, ub, "d_tilde", layout, *initial(B * V, e_v_1, np.tile(C_tilde_v, B)))
+    _bounds(lb, ub, "x_bar_plus", layout, 0, rent_cap)
+    _bounds(lb, ub, "x_bar_minus", layout, 0, np.tile(f_bar_minus, (B, 1)))
+    _bounds(lb, ub, "r_bar_plus", layout, 0, e_move_cap)
+    _bounds(lb, ub, "r_bar_minus", layout, 0, e_move_cap)
+    _bounds(lb, ub, "swap", layout, 0, swap_cap)
+    batteries_lb = np.zeros((V, T))
+    batteries_ub = np.repeat(battery_cap[:, None], T, axis=1)
+    if batteries_v_1 is not None:
+        batteries_lb[:, 0] = batteries_ub[:, 0] = batteries_v_1
+    _bounds(lb, ub, "batteries", layout, batteries_lb, batteries_ub)
+    riding_lb = np.zeros((B, T + 1))
+    riding_ub = np.full((B, T + 1), np.inf)
+    riding_lb[:, 0] = riding_ub[:, 0] = in_transit
+    _bounds(lb, ub, "riding", layout, riding_lb, riding_ub)
+
+    # -----Constraints-----
+    blocks = []
+    I_SVT = sp.eye(S * V * T, format="csr")
+    I_BSVT = sp.eye(B * S * V * T, format="csr")
+    bucket_vehicle_sum = sp.kron(I_B, vehicle_sum, format="csr") # (B*V, B*S*V)
+    bucket_station_sum = sp.kron(I_B, station_sum, format="csr") # (B*S, B*S*V)
+
+    # Bikes in the vehicles
+    A = layout.rows(
+        ("d_hat", sp.kron(sp.eye(V), following - current)),
+        ("r_plus", -sp.kron(vehicle_sum, current)),
+        ("r_minus", sp.kron(vehicle_sum, current)),
+    )
+    blocks.append((A, "=", np.zeros(V * (T - 1))))
+    A = layout.rows(
+        ("d_tilde", sp.kron(sp.eye(B * V), following - current)),
+        ("r_bar_plus", -sp.kron(bucket_vehicle_sum, current)),
+        ("r_bar_minus", sp.kron(bucket_vehicle_sum, current)),
+    )
+    blocks.append((A, "=", np.zeros(B * V * (T - 1))))
+
+    # Bikes at the stations; a swap moves a bike from its bucket to the full one
+    A = layout.rows(
+        ("d", sp.kron(sp.eye(S), following - current)),
+        ("r_plus", sp.kron(station_sum, current)),
+        ("r_minus", -sp.kron(station_sum, current)),
+        ("x_plus", sp.kron(sp.eye(S), current)),
+        ("x_minus", -sp.kron(sp.eye(S), current)),
+    )
+    blocks.append((A, "=", np.zeros(S * (T - 1))))
+    recharge = sp.csr_matrix((np.ones(B), (np.full(B, B - 1), np.arange(B))), shape=(B, B)) - I_B
+    A = layout.rows(
+        ("d_bar", sp.kron(sp.eye(B * S), following - current)),
+        ("r_bar_plus", sp.kron(bucket_station_sum, current)),
+        ("r_bar_minus", -sp.kron(bucket_station_sum, current)),
+        ("x_bar_plus", sp.kron(sp.eye(B * S), current)),
+        ("x_bar_minus", -sp.kron(sp.eye(B * S), current)),
+        ("swap", -sp.kron(sp.kron(recharge, station_sum), current)),
+    )
+    blocks.append((A, "=", np.zeros(B * S * (T - 1))))
+
+    # Rentals and returns of all buckets are within the e-bike demand
+    for name, demand in (("x_bar_plus", f_bar_plus), ("x_bar_minus", f_bar_minus)):
+        A = layout.rows((name, sp.kron(sp.kron(ones_B, sp.eye(S)), I_T)))
+        blocks.append((A, "<", demand.ravel()))
+
+    # Bikes being ridden: rentals join drained, returns leave
+    ride = sp.kron(depletion_matrix(B, drain), sp.csr_matrix(np.ones((1, S))))
+    back = sp.kron(I_B, sp.csr_matrix(np.ones((1, S))))
+    riding_current, riding_following = _shift(T + 1)
+    A = layout.rows(
+        ("riding", sp.kron(I_B, riding_following - riding_current)),
+        ("x_bar_plus", -sp.kron(ride, I_T)),
+        ("x_bar_minus", sp.kron(back, I_T)),
+    )
+    blocks.append((A, "=", np.zeros(B * T)))
+
+    # Charged batteries in the vehicles
+    A = layout.rows(
+        ("batteries", sp.kron(sp.eye(V), following - current)),
+        ("swap", sp.kron(sp.kron(ones_B, vehicle_sum), current)),
+    )
+    blocks.append((A, "=", np.zeros(V * (T - 1))))
+
+    # E-bikes and the battery load (charged or not) share the e-bike space
+    loaded = sp.csr_matrix((np.ones(T), (np.arange(T), np.zeros(T))), shape=(T, T))
+    A = layout.rows(
+        ("d_tilde", sp.kron(sp.kron(ones_B, sp.eye(V)), I_T)),
+        ("batteries", battery_space * sp.kron(sp.eye(V), loaded)),
+    )
+    blocks.append((A, "<", np.repeat(C_tilde_v, T)))
+
+    # Pickups, drop-offs and swaps only where the vehicle is
+    A = layout.rows(
+        ("r_plus", I_SVT),
+        ("r_minus", I_SVT),
+        ("z", -sp.diags(np.repeat(np.tile(C_hat_v, S), T))),
+    )
+    blocks.append((A, "<", np.zeros(S * V * T)))
+    at_vehicle = sp.kron(sp.kron(np.ones((B, 1)), sp.eye(S * V)), I_T, format="csr") # (B*S*V*T, S*V*T)
+    A = layout.rows(
+        ("r_bar_plus", I_BSVT),
+        ("r_bar_minus", I_BSVT),
+        ("z", -sp.diags(np.repeat(np.tile(C_tilde_v, B * S), T)) @ at_vehicle),
+    )
+    blocks.append((A, "<", np.zeros(B * S * V * T)))
+    A = layout.rows(
+        ("swap", sp.kron(sp.kron(ones_B, sp.eye(S * V)), I_T)),
+        ("z", -sp.diags(np.repeat(np.tile(battery_cap, S), T))),
+    )
+    blocks.append((A, "<", np.zeros(S * V * T)))
+
+    # Each vehicle can only be in one location at a time
+    blocks.append((layout.rows(("z", sp.kron(vehicle_sum, I_T))), "=", np.ones(V * T)))
+
+    # Vehicles only move along reachable arcs
+    if arcs is not None:
+        tail_sum, head_sum = arc_incidence(arcs, S, V)
+        I_SV = sp.eye(S * V, format="csr")
+        I_T1 = sp.eye(T - 1, format="csr")
+        for select, incidence in ((current, tail_sum), (following, head_sum)):
+            A = layout.rows(("z", sp.kron(I_SV, select)), ("y", -sp.kron(incidence, I_T1)))
+            blocks.append((A, "=", np.zeros(S * V * (T - 1))))
+
+    # Classic and e-bikes of every charge share the station docks
+    A = layout.rows(("d", sp.eye(S * T)), ("d_bar", sp.kron(sp.kron(ones_B, sp.eye(S)), I_T)))
+    blocks.append((A, "<", np.repeat(C_s, T)))
+
+    pairs = []
+    if strengthen:
+        initial_loads = [d_hat_v_1, *e_v_1] + ([batteries_v_1] if batteries_v_1 is not None else [])
+        pairs = identical_vehicles([C_hat_v, C_tilde_v], initial_loads, z_sv_1, S, V)
+        if pairs:
+            A = layout.rows(("z", sp.kron(symmetry_matrix(pairs, S, V), np.ones((1, T)))))
+            blocks.append((A, "<", np.zeros(len(pairs))))
+
+    columns, values, reduction = None, None, None
+    if strengthen:
+        blocks, columns, values, lb, ub, reduction = _strengthen(blocks, lb, ub, vtype)
+        reduction["symmetry_rows"] = len(pairs)
+        lb, ub, vtype = lb[columns], ub[columns], vtype[columns]
+
+    model = gp.Model("rebalancing", env=env)
+    x = model.addMVar(len(lb), lb=lb, ub=ub, vtype=vtype)
+    for A, sense, b in blocks:
+        model.addMConstr(A, x, sense, b)
+
+    # -----Objective-----
+    c = np.zeros(layout.size)
+    c[layout.columns("x_plus")] = -a_classic
+    c[layout.columns("x_minus")] = -a_classic
+    c[layout.columns("x_bar_plus")] = -a_electric
+    c[layout.columns("x_bar_minus")] = -a_electric
+    c[layout.columns("swap")] = swap_cost
+    constant = a_classic * (f_plus.sum() + f_minus.sum()) + a_electric * (f_bar_plus.sum() + f_bar_minus.sum())
+    if strengthen:
+        constant += c @ values
+        c = c[columns]
+    model.setMObjective(None, c, float(constant), sense=GRB.MINIMIZE)
+    model.update()
+
+    return BatteryModel(
+        B, model, x, layout, S, T, V, time.perf_counter() - start, columns, values, reduction, pairs,
+    )
@@ -0,0 +1,267 @@
+"""
+On-disk cache of solved instances
+
+Sweeps, notebooks and reruns of the scripts often solve exactly the same
+instance. SolutionCache stores every solution as a Results file (see
+results.py) named by a hash of all builder inputs (demand windows, C_s,
+vehicle capacities, initial inventories, a_classic / a_electric, w_s,
+z_sv_1) and the formulation with its version, so an identical instance
+is answered from disk without building the model:
+
+    cache = SolutionCache(".rebalancing_cache", max_mb=1024)
+    results = cache.solve(build_electric_gurobi, instance, OutputFlag=0)
+    results.metadata["cache"]["hit"]
+
+A cached solution is only returned if its MIP gap is at most max_gap
+(default: Gurobi's default MIPGap), so a time-limited solve never stands
+in for a run that asks for a better one; a better solution replaces it.
+On a miss, the vehicle routes of the closest cached instance of the same
+shape are used as a partial MIP start (nearest()).
+
+Files are written to a temporary name and renamed, and deleted files are
+treated as misses, so sweep workers can share one cache directory. The
+least recently used entries are removed once the cache exceeds max_mb.
+
+    python -m rebalancing.cache --dir .rebalancing_cache
+    python -m rebalancing.cache --dir .rebalancing_cache --max-mb 200
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from .kpis import DEMAND
+from .results import Results
+
+# Bump when a change to model.py / gurobi_backend.py changes what the models solve
+FORMULATION_VERSION = 1
+DEFAULT_DIR = ".rebalancing_cache"
+DEFAULT_MAX_MB = 1024
+DEFAULT_MAX_GAP = 1e-4 # Gurobi's default MIPGap
+# Builder defaults, so that leaving an input out and passing its default hash alike
+DEFAULT_INPUTS = {"electric": {"a_classic": 1, "a_electric": 2}, "baseline": {}}
+DEMAND_INPUTS = tuple(demand for _, demand in DEMAND.values())
+SUFFIX = ".npz"
+
+
+def formulation(instance):
+    return "electric" if instance.get("f_bar_plus") is not None else "baseline"
+
+
+def canonical_inputs(instance):
+    """
+    Builder inputs as float arrays, without inputs that do not change the
+    model: None, an all-zero w_s and inputs equal to the builder default
+    """
+    name = formulation(instance)
+    inputs = {**DEFAULT_INPUTS[name], **{key: value for key, value in instance.items() if value is not None}}
+    inputs.pop("env", None)
+    canonical = {}
+    for key, value in inputs.items():
+        value = np.ascontiguousarray(value, dtype=np.float64)
+        if key == "w_s" and not value.any():
+            continue
+        canonical[key] = value
+    return canonical
+
+
+def instance_key(instance):
+    """
+    Hex digest of the formulation, its version and every builder input
+    """
+    digest = hashlib.sha256(f"{formulation(instance)}/{FORMULATION_VERSION}".encode())
+    for key, value in sorted(canonical_inputs(instance).items()):
+        digest.update(key.encode())
+        digest.update(str(value.shape).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()[:32]
+
+
+def _shape(instance):
+    S, T = np.shape(instance["f_plus"])
+    return [S, T, int(np.shape(instance["C_hat_v"])[0])]
+
+
+class SolutionCache:
+    """
+    Results files keyed by instance_key() in one directory
+    """
+    def __init__(self, cache_dir=DEFAULT_DIR, max_mb=DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 2**20
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + SUFFIX)
+
+    def _load(self, key):
+        try:
+            results = Results.load(self.path(key))
+        except (OSError, ValueError, KeyError):
+            # Removed by another worker in the meantime, or not fully written by an older version
+            return None
+        return results
+
+    def get(self, instance, max_gap=DEFAULT_MAX_GAP):
+        """
+        Cached Results of instance if its gap is at most max_gap, else None
+        """
+        key = instance_key(instance)
+        results = self._load(key)
+        if results is None:
+            return None
+        gap = results.mip_gap
+        if max_gap is not None and gap is not None and gap > max_gap:
+            return None
+        try:
+            os.utime(self.path(key)) # recently used
+        except OSError:
+            pass
+        return results
+
+    def put(self, instance, results):
+        """
+        Store the Results of instance, unless a solution with a smaller gap is cached
+        """
+        key = instance_key(instance)
+        cached = self._load(key)
+        if cached is not None and (cached.mip_gap or 0) <= (results.mip_gap or 0):
+            return key
+        results.metadata["cache"] = {
+            "key": key, "formulation": formulation(instance), "version": FORMULATION_VERSION,
+            "shape": _shape(instance), "stored": time.time(),
+        }
+        # Write under a temporary name and rename, so readers never see a partial file
+        handle, temporary = tempfile.mkstemp(suffix=SUFFIX, prefix=".tmp-", dir=self.cache_dir)
+        os.close(handle)
+        try:
+            results.save(temporary)
+            os.replace(temporary, self.path(key))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        self.evict()
+        return key
+
+    def entries(self):
+        """
+        (path, size, last use) of every cached file, least recently used first
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(SUFFIX) or entry.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, max_bytes=None):
+        """
+        Remove the least recently used files until the cache fits max_bytes; returns how many
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return removed
+
+    def clear(self):
+        return self.evict(0)
+
+    def nearest(self, instance):
+        """
+        (Results, distance) of the cached instance of the same formulation
+        and shape whose demand is closest in L1 distance, or None
+        """
+        name, shape = formulation(instance), _shape(instance)
+        best, best_distance = None, np.inf
+        for path, _, _ in self.entries():
+            # Only the metadata and the demand arrays of every entry are read
+            try:
+                with np.load(path) as archive:
+                    info = json.loads(archive["metadata"].item()).get("cache", {})
+                    if info.get("formulation") != name or info.get("shape") != shape:
+                        continue
+                    distance = sum(
+                        np.abs(np.asarray(instance[demand], dtype=float) - archive[f"input/{demand}"]).sum()
+                        for demand in DEMAND_INPUTS
+                        if f"input/{demand}" in archive.files and instance.get(demand) is not None
+                    )
+            except (OSError, ValueError, KeyError):
+                continue
+            if distance < best_distance:
+                best, best_distance = info["key"], distance
+        results = None if best is None else self._load(best)
+        return None if results is None else (results, best_distance)
+
+    def solve(self, build, instance, max_gap=DEFAULT_MAX_GAP, warm_start=True, config=None, **solve_kwargs):
+        """
+        Cached Results of instance, or build, solve and cache it
+
+        On a miss with warm_start, the vehicle routes of the nearest cached
+        instance are the MIP start. metadata["cache"] tells whether it was
+        a hit, and the lookup / solve time.
+        """
+        start = time.perf_counter()
+        results = self.get(instance, max_gap)
+        if results is not None:
+            results.metadata["cache"].update(hit=True, lookup_time=time.perf_counter() - start)
+            return results
+        model = build(**instance)
+        near = self.nearest(instance) if warm_start else None
+        if near is not None:
+            model.set_start({"z": near[0]["z"]})
+        model.solve(**solve_kwargs)
+        results = Results.from_model(model, instance, config)
+        self.put(instance, results)
+        results.metadata["cache"].update(
+            hit=False, solve_time=time.perf_counter() - start,
+            warm_start=None if near is None else near[0].metadata["cache"]["key"],
+        )
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    parser.add_argument("--max-mb", type=float, help="evict least recently used entries down to this size")
+    parser.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+
+    cache = SolutionCache(args.dir)
+    if args.clear:
+        print(f"Removed {cache.clear()} entries")
+    elif args.max_mb is not None:
+        print(f"Removed {cache.evict(args.max_mb * 2**20)} entries")
+    entries = cache.entries()
+    print(f"{len(entries)} entries, {sum(size for _, size, _ in entries) / 2**20:.1f} MB in {args.dir}")
+    for path, size, used in entries[::-1]:
+        results = cache._load(os.path.basename(path)[:-len(SUFFIX)])
+        if results is None:
+            continue
+        info = results.metadata.get("cache", {})
+        gap = "-" if results.mip_gap is None else f"{results.mip_gap:.2%}"
+        print(
+            f"  {os.path.basename(path)[:12]}  {info.get('formulation', '?'):<9}{str(info.get('shape')):<16}"
+            f"objective {results.objective:<10} gap {gap:<8} last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Rebalancing with K commodities on one array axis
+
+The baseline and e-bike builders repeat every variable and constraint
+block per bike type. Here the commodity is an axis of every input and
+variable: station inventories d and trips x_plus / x_minus are (K*S, T)
+with row k*S + s, vehicle loads d_hat are (K*V, T) with row k*V + v, and
+moves r_plus / r_minus are (K*S*V, T) with row k*S*V + s*V + v. Every
+constraint block is built once for all commodities as a Kronecker product
+with the K x K identity, so the build time grows linearly with K.
+
+Per commodity k:
+
+  - value[k] weights its lost rentals and returns (a_classic, a_electric)
+  - C_kv[k] is the per-vehicle capacity for it (C_hat_v, C_tilde_v), if any
+  - space[k] is the room one unit takes in a vehicle with the shared
+    capacity C_v (e.g. a battery takes less than a bike)
+  - dock[k] is the docks one unit takes at a station (0 for batteries)
+  - loss[k] is the (S, T) number of units leaving the station (w_s)
+
+    model = build_commodity_gurobi(**commodity_instance(instance)) # an electric instance is K=2
+    model.solve()
+    model.legacy_solution() # d, d_bar, d_hat, d_tilde, ... as from build_electric_gurobi
+
+The baseline and e-bike models are the K=1 and K=2 cases without a shared
+vehicle capacity: build_baseline_gurobi and build_electric_gurobi build
+them here and return model.legacy_model().
+"""
+import time
+
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+from .gurobi_backend import ColumnLayout, GurobiRebalancingModel, _bounds, _shift, _strengthen
+from .model import aggregation_matrices, identical_vehicles, symmetry_matrix
+from .routing import arc_incidence
+
+# Variables with one block of rows per commodity
+COMMODITY_VARIABLES = ("d", "d_hat", "x_plus", "x_minus", "r_plus", "r_minus")
+# Names of the same variables in build_baseline_gurobi / build_electric_gurobi, per bike type
+LEGACY_NAMES = (
+    ("d", "d_hat", "x_plus", "x_minus", "r_plus", "r_minus"),
+    ("d_bar", "d_tilde", "x_bar_plus", "x_bar_minus", "r_bar_plus", "r_bar_minus"),
+)
+
+
+class CommodityModel(GurobiRebalancingModel):
+    """
+    GurobiRebalancingModel with a leading commodity axis: value() returns
+    d, x_plus and x_minus as (K, S, T), d_hat as (K, V, T), r_plus and
+    r_minus as (K, T, S, V) and z as (T, S, V)
+    """
+    def __init__(self, K, *args, **kwargs):
+        self.K = K
+        super().__init__(*args, **kwargs)
+
+    def _reshape(self, name, values):
+        _, shape = self.layout.blocks[name]
+        value = values[self.layout.columns(name)].reshape(shape)
+        if name in ("r_plus", "r_minus"):
+            return value.reshape(self.K, self.S, self.V, self.T).transpose(0, 3, 1, 2)
+        if name == "z":
+            return value.reshape(self.S, self.V, self.T).transpose(2, 0, 1)
+        if name in COMMODITY_VARIABLES:
+            return value.reshape(self.K, -1, self.T)
+        return value
+
+    def _layout_order(self, name, value):
+        value = np.asarray(value, dtype=float)
+        if name in ("r_plus", "r_minus"):
+            value = value.transpose(0, 2, 3, 1)
+        elif name == "z":
+            value = value.transpose(1, 2, 0)
+        return np.ravel(value)
+
+    def legacy_model(self):
+        """
+        The same model as a GurobiRebalancingModel with the variable names and
+        shapes of build_baseline_gurobi (K=1) or build_electric_gurobi (K=2)
+        """
+        if self.K > len(LEGACY_NAMES):
+            raise ValueError(f"only one or two commodities have legacy names, not {self.K}")
+        # The rows of each commodity are a contiguous range of columns
+        layout = ColumnLayout()
+        layout.size = self.layout.size
+        for k, names in enumerate(LEGACY_NAMES[:self.K]):
+            for name, legacy_name in zip(COMMODITY_VARIABLES, names):
+                start, (rows, T) = self.layout.blocks[name]
+                rows //= self.K
+                layout.blocks[legacy_name] = (start + k * rows * T, (rows, T))
+        for name in ("z", "y"):
+            if name in self.layout.blocks:
+                layout.blocks[name] = self.layout.blocks[name]
+        return GurobiRebalancingModel(
+            self.model, self.x, layout, self.S, self.T, self.V, self.build_time, self.columns,
+            self.fixed_values, self.reduction, self.pairs,
+        )
+
+    def legacy_solution(self):
+        """
+        Solution under the names and shapes of build_baseline_gurobi (K=1)
+        or build_electric_gurobi (K=2)
+        """
+        if self.model.SolCount == 0:
+            return None
+        return self.legacy_model().solution()
+
+
+def _weighted_sum(weights, n):
+    """
+    (n, K*n) matrix summing weights[k] * X[k] over the commodity blocks,
+    without explicit zeros for weightless commodities
+    """
+    A = sp.kron(sp.csr_matrix(weights[None, :]), sp.eye(n), format="csr")
+    A.eliminate_zeros()
+    return A
+
+
+def commodity_instance(instance):
+    """
+    Inputs of build_commodity_gurobi for a baseline (K=1) or electric (K=2)
+    instance dict
+    """
+    electric = instance.get("f_bar_plus") is not None
+    types = [("f_plus", "f_minus", "d_s_1", "d_hat_v_1", "C_hat_v", "a_classic")]
+    if electric:
+        types.append(("f_bar_plus", "f_bar_minus", "d_bar_s_1", "d_tilde_v_1", "C_tilde_v", "a_electric"))
+    stack = lambda position, default=None: np.array([
+        np.asarray(instance.get(names[position], default), dtype=float) for names in types
+    ])
+    S, T = np.shape(instance["f_plus"])
+    loss = None
+    if electric and instance.get("w_s") is not None:
+        loss = np.zeros((2, S, T))
+        loss[1] = instance["w_s"]
+    return dict(
+        f_plus=stack(0), f_minus=stack(1), C_s=np.asarray(instance["C_s"], dtype=float),
+        d_s_1=stack(2), d_v_1=stack(3), C_kv=stack(4),
+        value=np.array([instance.get("a_classic", 1), instance.get("a_electric", 2)][:len(types)], dtype=float),
+        loss=loss, z_sv_1=instance.get("z_sv_1"), arcs=instance.get("arcs"),
+    )
+
+
+def build_commodity_gurobi(
+    f_plus, f_minus, C_s, d_s_1, d_v_1, value=None, C_kv=None, C_v=None, space=None, dock=None, loss=None,
+    z_sv_1=None, arcs=None, env=None, strengthen=False,
+):
+    """
+    Rebalancing problem with K commodities
+
+    f_plus, f_minus: (K, S, T) demand; d_s_1: (K, S) and d_v_1: (K, V)
+    initial station and vehicle inventories; C_s: (S,) docks.
+    value: (K,) weight of lost demand (default 1). C_kv: (K, V) capacity of
+    every vehicle per commodity; C_v: (V,) capacity shared by all
+    commodities, where one unit of commodity k takes space[k] (default 1).
+    At least one of C_kv and C_v is needed. dock: (K,) docks one unit takes
+    (default 1); loss: optional (K, S, T) units leaving the stations.
+    z_sv_1, arcs and strengthen work as in build_electric_gurobi.
+    """
+    start = time.perf_counter()
+    f_plus = np.asarray(f_plus, dtype=float)
+    f_minus = np.asarray(f_minus, dtype=float)
+    K, S, T = f_plus.shape
+    V = np.shape(d_v_1)[1]
+    value = np.ones(K) if value is None else np.asarray(value, dtype=float)
+    space = np.ones(K) if space is None else np.asarray(space, dtype=float)
+    dock = np.ones(K) if dock is None else np.asarray(dock, dtype=float)
+    C_s = np.asarray(C_s, dtype=float)
+    if C_kv is None and C_v is None:
+        raise ValueError("needs per-commodity vehicle capacities C_kv, a shared capacity C_v, or both")
+    # Most units of each commodity a vehicle can carry (and move per period)
+    caps = np.full((K, V), np.inf)
+    if C_kv is not None:
+        caps = np.minimum(caps, np.asarray(C_kv, dtype=float))
+    if C_v is not None:
+        with np.errstate(divide="ignore"):
+            caps = np.minimum(caps, np.floor(np.asarray(C_v, dtype=float)[None, :] / space[:, None]))
+    if not np.isfinite(caps).all():
+        raise ValueError("a commodity that takes no space needs a capacity in C_kv")
+
+    station_sum, vehicle_sum = aggregation_matrices(S, V)
+    current, following = _shift(T)
+    I_K = sp.eye(K, format="csr")
+    I_T = sp.eye(T, format="csr")
+
+    # -----Variables-----
+    layout = ColumnLayout()
+    layout.add("d", (K * S, T))
+    layout.add("d_hat", (K * V, T))
+    layout.add("x_plus", (K * S, T))
+    layout.add("x_minus", (K * S, T))
+    layout.add("r_plus", (K * S * V, T))
+    layout.add("r_minus", (K * S * V, T))
+    layout.add("z", (S * V, T))
+    if arcs is not None:
+        arcs = np.asarray(arcs, dtype=np.int64).reshape(-1, 2)
+        layout.add("y", (len(arcs) * V, T - 1))
+
+    lb = np.zeros(layout.size)
+    ub = np.zeros(layout.size)
+    vtype = np.full(layout.size, GRB.INTEGER)
+    vtype[layout.columns("z")] = GRB.BINARY
+    z_lb = np.zeros((S * V, T))
+    if z_sv_1 is not None:
+        z_lb[:, 0] = np.ravel(z_sv_1)
+    _bounds(lb, ub, "z", layout, z_lb, 1)
+    if arcs is not None:
+        _bounds(lb, ub, "y", layout, 0, 1)
+        vtype[layout.columns("y")] = GRB.CONTINUOUS
+
+    # A commodity that takes no docks has no station capacity
+    station_cap = np.full((K, S), np.inf)
+    docked = dock > 0
+    station_cap[docked] = C_s[None, :] / dock[docked, None]
+    station_ub = np.repeat(station_cap.ravel(), T).reshape(K * S, T)
+    station_lb = np.zeros((K * S, T))
+    station_lb[:, 0] = station_ub[:, 0] = np.ravel(d_s_1)
+    vehicle_ub = np.repeat(caps.ravel(), T).reshape(K * V, T)
+    vehicle_lb = np.zeros((K * V, T))
+    vehicle_lb[:, 0] = vehicle_ub[:, 0] = np.ravel(d_v_1)
+    vehicle_cap = np.repeat(np.repeat(caps[:, None, :], S, axis=1).ravel(), T) # per (k, s, v, t)
+    move_cap = vehicle_cap.reshape(K * S * V, T).copy()
+    trips_lb = [np.zeros((K * S, T)), np.zeros((K * S, T))]
+    if strengthen:
+        # Moves of the last period change no inventory and its trips only appear in the objective
+        move_cap[:, -1] = 0
+        for low, demand in zip(trips_lb, (f_plus, f_minus)):
+            low[:, -1] = np.floor(demand.reshape(K * S, T)[:, -1])
+    _bounds(lb, ub, "d", layout, station_lb, station_ub)
+    _bounds(lb, ub, "d_hat", layout, vehicle_lb, vehicle_ub)
+    _bounds(lb, ub, "x_plus", layout, trips_lb[0], f_plus.reshape(K * S, T))
+    _bounds(lb, ub, "x_minus", layout, trips_lb[1], f_minus.reshape(K * S, T))
+    _bounds(lb, ub, "r_plus", layout, 0, move_cap)
+    _bounds(lb, ub, "r_minus", layout, 0, move_cap)
+
+    # -----Constraints-----
+    blocks = []
+    commodity_vehicle_sum = sp.kron(I_K, vehicle_sum, format="csr") # (K*V, K*S*V)
+    commodity_station_sum = sp.kron(I_K, station_sum, format="csr") # (K*S, K*S*V)
+
+    # Bikes in the vehicles
+    A = layout.rows(
+        ("d_hat", sp.kron(sp.eye(K * V), following - current)),
+        ("r_plus", -sp.kron(commodity_vehicle_sum, current)),
+        ("r_minus", sp.kron(commodity_vehicle_sum, current)),
+    )
+    blocks.append((A, "=", np.zeros(K * V * (T - 1))))
+
+    # Bikes at the stations
+    A = layout.rows(
+        ("d", sp.kron(sp.eye(K * S), following - current)),
+        ("r_plus", sp.kron(commodity_station_sum, current)),
+        ("r_minus", -sp.kron(commodity_station_sum, current)),
+        ("x_plus", sp.kron(sp.eye(K * S), current)),
+        ("x_minus", -sp.kron(sp.eye(K * S), current)),
+    )
+    b = np.zeros(K * S * (T - 1))
+    if loss is not None:
+        b = -np.asarray(loss, dtype=float)[:, :, :-1].ravel()
+    blocks.append((A, "=", b))
+
+    # Pickups and drop-offs only where the vehicle is
+    I_SVKT = sp.eye(K * S * V * T, format="csr")
+    at_vehicle = sp.kron(sp.kron(np.ones((K, 1)), sp.eye(S * V)), I_T) # (K*S*V*T, S*V*T)
+    A = layout.rows(
+        ("r_plus", I_SVKT),
+        ("r_minus", I_SVKT),
+        ("z", -sp.diags(vehicle_cap) @ at_vehicle),
+    )
+    blocks.append((A, "<", np.zeros(K * S * V * T)))
+
+    # Shared vehicle space
+    if C_v is not None:
+        A = layout.rows(("d_hat", _weighted_sum(space, V * T)))
+        blocks.append((A, "<", np.repeat(np.asarray(C_v, dtype=float), T)))
+
+    # Each vehicle can only be in one location at a time
+    blocks.append((layout.rows(("z", sp.kron(vehicle_sum, I_T))), "=", np.ones(V * T)))
+
+    # Vehicles only move along reachable arcs
+    if arcs is not None:
+        tail_sum, head_sum = arc_incidence(arcs, S, V)
+        I_SV = sp.eye(S * V, format="csr")
+        I_T1 = sp.eye(T - 1, format="csr")
+        for select, incidence in ((current, tail_sum), (following, head_sum)):
+            A = layout.rows(("z", sp.kron(I_SV, select)), ("y", -sp.kron(incidence, I_T1)))
+            blocks.append((A, "=", np.zeros(S * V * (T - 1))))
+
+    # Commodities share the station docks
+    if K > 1:
+        A = layout.rows(("d", _weighted_sum(dock, S * T)))
+        blocks.append((A, "<", np.repeat(C_s, T)))
+
+    pairs = []
+    if strengthen:
+        pairs = identical_vehicles(list(caps), list(np.asarray(d_v_1)), z_sv_1, S, V)
+        if pairs:
+            A = layout.rows(("z", sp.kron(symmetry_matrix(pairs, S, V), np.ones((1, T)))))
+            blocks.append((A, "<", np.zeros(len(pairs))))
+
+    columns, values, reduction = None, None, None
+    if strengthen:
+        blocks, columns, values, lb, ub, reduction = _strengthen(blocks, lb, ub, vtype)
+        reduction["symmetry_rows"] = len(pairs)
+        lb, ub, vtype = lb[columns], ub[columns], vtype[columns]
+
+    model = gp.Model("rebalancing", env=env)
+    x = model.addMVar(len(lb), lb=lb, ub=ub, vtype=vtype)
+    for A, sense, b in blocks:
+        model.addMConstr(A, x, sense, b)
+
+    # -----Objective-----
+    c = np.zeros(layout.size)
+    weights = np.repeat(value, S * T)
+    c[layout.columns("x_plus")] = -weights
+    c[layout.columns("x_minus")] = -weights
+    constant = float(value @ (f_plus.sum(axis=(1, 2)) + f_minus.sum(axis=(1, 2))))
+    if strengthen:
+        constant += c @ values
+        c = c[columns]
+    model.setMObjective(None, c, constant, sense=GRB.MINIMIZE)
+    model.update()
+
+    return CommodityModel(
+        K, model, x, layout, S, T, V, time.perf_counter() - start, columns, values, reduction, pairs,
+    )
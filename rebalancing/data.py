@@ -0,0 +1,143 @@
+"""
+Input data for the rebalancing problems
+
+demand_matrix reproduces the pivot the scripts use to turn the rentals /
+returns CSVs into (S, T) expected-demand arrays, and the load_*_instance
+functions return every input of the model builders, with the same defaults
+as baseline_problem.py and electric_bike_problem.py, as a dict that can be
+passed straight to build_baseline_model / build_electric_model.
+random_instance / random_electric_instance draw inputs of the same shape
+for tests and benchmarks without the dataset.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .demand_store import NUM_DAYS, PERIODS_PER_DAY, open_store
+
+INVENTORY_FILENAME = "Initial_Inven.json"
+CAPACITY_FILENAME = "Capacities.json" # only written for synthetic networks
+DISTANCE_FILENAME = "distances.npy" # D_ij in km, only written for synthetic networks
+C_S = np.concatenate([[40] * 5, [20] * 25]) # Capacity of each station s
+
+
+def demand_matrix(filepath, values, S=None, T=None, start=0):
+    """
+    Expected demand at station s in period start + t, as an (S, T) array
+
+    values is the demand column of the CSV ("rentals" or "returns"). If a
+    demand store compiled from this CSV is up to date (see demand_store.py),
+    the window is read from it instead of pivoting the CSV.
+    """
+    store = open_store(os.path.dirname(filepath) or ".")
+    source = store.source(filepath) if store is not None else None
+    if source is not None and source[0] == values:
+        return np.asarray(store.window(values, source[1], S, T, start), dtype=float)
+
+    df = pd.read_csv(filepath, usecols=[values, "time_period", "station_id"])
+    time_periods = list(range(PERIODS_PER_DAY * NUM_DAYS))
+    demand = pd.pivot_table(
+        df, values=values, index="station_id", columns="time_period"
+    ).reindex(time_periods, axis='columns').fillna(0).to_numpy()
+    stop = None if T is None else start + T
+    return demand[:S, start:stop]
+
+
+def initial_inventory(data_dir="."):
+    return pd.read_json(os.path.join(data_dir, INVENTORY_FILENAME))[0].to_numpy()
+
+
+def station_capacities(data_dir="."):
+    """
+    C_s, or the capacities of a synthetic network (see synthetic.py) in data_dir
+    """
+    path = os.path.join(data_dir, CAPACITY_FILENAME)
+    if os.path.exists(path):
+        return pd.read_json(path)[0].to_numpy()
+    return C_S
+
+
+def station_distances(data_dir=".", S=None):
+    """
+    (S, S) distances D_ij between the first S stations, or None when
+    data_dir has no distance matrix
+    """
+    path = os.path.join(data_dir, DISTANCE_FILENAME)
+    if not os.path.exists(path):
+        return None
+    distances = np.load(path, mmap_mode="r")
+    return np.array(distances[:S, :S], dtype=float)
+
+
+def load_baseline_instance(S=30, T=30, V=1, data_dir=".", start=0):
+    """
+    Inputs of build_baseline_model as set up in baseline_problem.py
+    """
+    path = lambda filename: os.path.join(data_dir, filename)
+    return dict(
+        f_plus=demand_matrix(path("rentals.csv"), "rentals", S, T, start),
+        f_minus=demand_matrix(path("returns.csv"), "returns", S, T, start),
+        C_s=station_capacities(data_dir)[:S],
+        C_hat_v=np.array([2, 2, 40, 40, 40])[:V],
+        d_s_1=initial_inventory(data_dir)[:S],
+        d_hat_v_1=np.array([0, 0, 7, 8, 1])[:V],
+    )
+
+
+def load_electric_instance(S=30, T=30, V=1, data_dir=".", start=0):
+    """
+    Inputs of build_electric_model as set up in electric_bike_problem.py
+    """
+    path = lambda filename: os.path.join(data_dir, filename)
+    d_s_1 = initial_inventory(data_dir) - 3 # Initial num of classic bikes at station s
+    d_s_1[d_s_1 < 0] = 0
+    return dict(
+        f_plus=demand_matrix(path("rentals_classic.csv"), "rentals", S, T, start),
+        f_minus=demand_matrix(path("returns_classic.csv"), "returns", S, T, start),
+        f_bar_plus=demand_matrix(path("rentals_electric.csv"), "rentals", S, T, start),
+        f_bar_minus=demand_matrix(path("returns_electric.csv"), "returns", S, T, start),
+        C_s=station_capacities(data_dir)[:S],
+        C_hat_v=np.array([40, 40, 40, 40, 40])[:V],
+        C_tilde_v=np.array([40, 40, 40, 40, 40])[:V],
+        d_s_1=d_s_1[:S],
+        d_bar_s_1=np.ones(S) * 3,
+        d_hat_v_1=np.array([0, 0, 3, 3, 1])[:V],
+        d_tilde_v_1=np.array([0, 0, 2, 3, 0])[:V],
+        a_classic=1,
+        a_electric=2,
+        w_s=np.zeros((S, T)),
+    )
+
+
+def random_instance(S, T, V, seed=0, rate=0.6):
+    """
+    Baseline inputs with the same magnitudes as the 30-station dataset
+    """
+    rng = np.random.default_rng(seed)
+    return dict(
+        f_plus=rng.poisson(rate, size=(S, T)).astype(float),
+        f_minus=rng.poisson(rate, size=(S, T)).astype(float),
+        C_s=np.where(np.arange(S) < S // 6, 40, 20),
+        C_hat_v=np.full(V, 40),
+        d_s_1=rng.integers(0, 20, size=S),
+        d_hat_v_1=np.zeros(V, dtype=int),
+    )
+
+
+def random_electric_instance(S, T, V, seed=0):
+    """
+    Inputs of build_electric_model on top of random_instance, with 3 e-bikes
+    per station
+    """
+    rng = np.random.default_rng(seed + 1)
+    instance = random_instance(S, T, V, seed)
+    instance.update(
+        f_bar_plus=rng.poisson(0.4, size=(S, T)).astype(float),
+        f_bar_minus=rng.poisson(0.4, size=(S, T)).astype(float),
+        C_tilde_v=np.full(V, 40),
+        d_bar_s_1=np.full(S, 3),
+        d_tilde_v_1=np.zeros(V, dtype=int),
+    )
+    instance["d_s_1"] = np.maximum(instance["d_s_1"] - 3, 0)
+    return instance
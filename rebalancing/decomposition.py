@@ -0,0 +1,528 @@
+"""
+Zone decomposition for city-scale networks
+
+The monolithic model has a z[t] of shape (S, V) and becomes intractable
+long before a few hundred stations. decompose() splits it into zones:
+
+  1. cluster_stations partitions the stations into zones: geographically
+     (k-means on an embedding of the D_ij distances, with balanced zone
+     sizes) when distances are given, otherwise so that every zone mixes
+     stations that fill up with stations that run empty
+  2. assign_vehicles gives every zone vehicles in proportion to the bikes
+     its stations would lack or could not dock without rebalancing
+     (vehicles with a starting station go to its zone)
+  3. a master problem, the same model with every zone as one station and
+     all vehicles, decides how many bikes each zone sends to or receives
+     from the others per period. Its bound is a lower bound of the
+     monolithic model, but a weak one: rentals and returns of one zone
+     net out in it, so it is 0 whenever every zone can absorb its demand
+     in aggregate (bound_gap is then not reported)
+  4. the zone subproblems are solved in parallel. Every importing zone
+     gets a gateway, its station that runs emptiest, and every exporting
+     zone delivers to one importing zone: the gateway is added to the
+     exporting zone as a depot station with the master's transfers as
+     rentals, so serving them means bringing the bikes there on time, and
+     the importing zone gets the bikes actually delivered as returns at
+     its gateway, one period later. Exporting and neutral zones are
+     solved first, importing zones after them.
+  5. the zone routes are combined, with exporting vehicles at the depot
+     placed at the gateway, and the monolithic model is solved with these
+     vehicle positions fixed (repair). Only its pickups, drop-offs and
+     trips are free, so the plan is feasible for the monolithic model
+     and the transfers are carried by the vehicles that drive to the
+     gateways.
+
+    plan, report = decompose(build_electric_gurobi, instance, zone_size=30, distances=distances)
+
+The plan has the arrays of model.solution() for the whole network, and
+report["objective"] is its weighted lost demand. compare_monolithic also
+solves the monolithic model and reports the gap between the two:
+
+    python -m rebalancing.decomposition --data-dir synthetic --stations 300 --periods 32 --vehicles 5 --zone-size 60
+    python -m rebalancing.decomposition --stations 30 --periods 16 --vehicles 3 --zones 3 --compare
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import gurobipy as gp
+import numpy as np
+from scipy.cluster.vq import kmeans2
+
+from .data import load_baseline_instance, load_electric_instance, station_distances
+from .gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+from .heuristic import plan_objective
+from .model import STACKED_VARIABLES
+
+# Inputs with one row per station or one entry per vehicle
+STATION_INPUTS = ("f_plus", "f_minus", "f_bar_plus", "f_bar_minus", "C_s", "d_s_1", "d_bar_s_1", "w_s")
+VEHICLE_INPUTS = ("C_hat_v", "C_tilde_v", "d_hat_v_1", "d_tilde_v_1")
+# Demand, pickups / drop-offs and lost-demand weight of each bike type
+BIKE_TYPES = (
+    ("f_plus", "f_minus", "x_plus", "x_minus", "r_plus", "r_minus", "a_classic", 1),
+    ("f_bar_plus", "f_bar_minus", "x_bar_plus", "x_bar_minus", "r_bar_plus", "r_bar_minus", "a_electric", 2),
+)
+VEHICLE_VARIABLES = ("d_hat", "d_tilde")
+
+
+def _bike_types(instance):
+    return [types for types in BIKE_TYPES if instance.get(types[0]) is not None]
+
+
+def station_need(instance):
+    """
+    (S,) net returns minus rentals over the horizon and (S,) bikes a
+    station would lack or could not dock without rebalancing, both
+    weighted by bike type
+    """
+    initial = {"f_plus": "d_s_1", "f_bar_plus": "d_bar_s_1"}
+    drift, need, docked = 0.0, 0.0, 0.0
+    for rentals, returns, *_, weight, default in _bike_types(instance):
+        change = np.cumsum(np.asarray(instance[returns], dtype=float) - instance[rentals], axis=1)
+        level = np.asarray(instance[initial[rentals]], dtype=float)[:, None] + change
+        a = instance.get(weight, default)
+        drift = drift + a * change[:, -1]
+        need = need + a * np.maximum(0, -level.min(axis=1))
+        docked = docked + level
+    need = need + np.maximum(0, docked.max(axis=1) - np.asarray(instance["C_s"], dtype=float))
+    return drift, need
+
+
+def embedding(distances, dims=2):
+    """
+    (S, dims) coordinates whose euclidean distances approximate D_ij (classical MDS)
+    """
+    distances = np.asarray(distances, dtype=float)
+    squared = np.square((distances + distances.T) / 2)
+    centered = squared - squared.mean(axis=0) - squared.mean(axis=1)[:, None] + squared.mean()
+    values, vectors = np.linalg.eigh(-centered / 2)
+    top = np.argsort(values)[::-1][:dims]
+    return vectors[:, top] * np.sqrt(np.maximum(values[top], 0))
+
+
+def _balanced_assignment(points, centroids, room):
+    """
+    Nearest centroid of every point with at most `room` points per
+    centroid; the points with the clearest choice are placed first
+    """
+    distance = np.linalg.norm(points[:, None, :] - centroids[None, :, :], axis=2)
+    ranked = np.sort(distance, axis=1)
+    labels = np.empty(len(points), dtype=int)
+    free = np.full(len(centroids), room)
+    for point in np.argsort(ranked[:, 0] - ranked[:, 1]):
+        zone = next(zone for zone in np.argsort(distance[point]) if free[zone] > 0)
+        labels[point] = zone
+        free[zone] -= 1
+    return labels
+
+
+def cluster_stations(instance, zones, distances=None, seed=0):
+    """
+    (S,) zone of every station, numbered 0..zones-1
+
+    With D_ij, zones are k-means clusters of the station embedding with at
+    most ceil(S / zones) stations each. Without it, stations are sorted by
+    their net drift and dealt out in snake order, so every zone gets
+    stations that fill up and stations that run empty.
+    """
+    S = len(instance["C_s"])
+    zones = max(1, min(zones, S))
+    if zones == 1:
+        return np.zeros(S, dtype=int)
+    if distances is None:
+        drift, _ = station_need(instance)
+        snake = np.concatenate([np.arange(zones), np.arange(zones)[::-1]])
+        labels = np.empty(S, dtype=int)
+        labels[np.argsort(drift, kind="stable")] = np.resize(snake, S)
+        return labels
+    points = embedding(distances)
+    centroids, _ = kmeans2(points, zones, minit="++", seed=seed)
+    labels = _balanced_assignment(points, centroids, int(np.ceil(S / zones)))
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def assign_vehicles(instance, labels):
+    """
+    (V,) zone of every vehicle: its starting station's zone if it has one,
+    otherwise one for every zone first and then by the D'Hondt rule on the
+    zones' station need
+    """
+    zones = labels.max() + 1
+    V = len(instance["C_hat_v"])
+    _, need = station_need(instance)
+    zone_need = np.bincount(labels, weights=need, minlength=zones) + 1e-9
+    assigned = np.full(V, -1)
+    z_sv_1 = instance.get("z_sv_1")
+    if z_sv_1 is not None:
+        z_sv_1 = np.asarray(z_sv_1).reshape(len(labels), V)
+        for v in np.flatnonzero(z_sv_1.any(axis=0)):
+            assigned[v] = labels[z_sv_1[:, v].argmax()]
+    counts = np.bincount(assigned[assigned >= 0], minlength=zones)
+    for v in np.flatnonzero(assigned < 0):
+        # Zones without a vehicle come first
+        priority = zone_need / (counts + 1) + np.where(counts == 0, zone_need.sum(), 0)
+        assigned[v] = np.argmax(priority)
+        counts[assigned[v]] += 1
+    return assigned
+
+
+def zone_matrix(labels):
+    """
+    (zones, S) 0/1 matrix summing station rows into zone rows
+    """
+    return (labels[None, :] == np.arange(labels.max() + 1)[:, None]).astype(float)
+
+
+def master_instance(instance, labels):
+    """
+    The instance with every zone as one station (summed demand, docks and
+    inventory) and all vehicles; a relaxation of the monolithic model
+    """
+    M = zone_matrix(labels)
+    master = dict(instance)
+    for name in STATION_INPUTS:
+        if instance.get(name) is not None:
+            master[name] = M @ np.asarray(instance[name], dtype=float)
+    if instance.get("z_sv_1") is not None:
+        V = len(instance["C_hat_v"])
+        master["z_sv_1"] = np.minimum(M @ np.asarray(instance["z_sv_1"], dtype=float).reshape(len(labels), V), 1)
+    return master
+
+
+def transfer_targets(net, need=None):
+    """
+    Cumulative (zones, T) export and import targets from the master's net
+    drop-offs minus pickups per zone; a zone exports or imports according
+    to its net over the horizon
+
+    The master's transfers are not unique where they do not change its
+    objective, so with the (zones,) need imports are capped at it and
+    exports scaled down to match.
+    """
+    cumulative = np.cumsum(net, axis=1)
+    final = cumulative[:, -1:]
+    exports = np.minimum(np.maximum.accumulate(np.maximum(-cumulative, 0), axis=1), np.maximum(-final, 0))
+    imports = np.minimum(np.maximum.accumulate(np.maximum(cumulative, 0), axis=1), np.maximum(final, 0))
+    if need is not None:
+        imports = np.minimum(imports, np.asarray(need, dtype=float)[:, None])
+        exports = exports * min(1.0, imports[:, -1].sum() / max(exports[:, -1].sum(), 1.0))
+    return np.floor(exports + 1e-6), np.floor(imports + 1e-6)
+
+
+def gateways(instance, labels, importing, exports, imports):
+    """
+    (zones,) gateway station of every importing zone, the station that runs
+    emptiest over the horizon, and the importing zone every exporting zone
+    delivers to (-1 where none): the one with the most imports left to
+    cover, exporters with the largest transfers first
+    """
+    drift, _ = station_need(instance)
+    zones = len(importing)
+    gateway = np.full(zones, -1)
+    for zone in np.flatnonzero(importing):
+        stations = np.flatnonzero(labels == zone)
+        gateway[zone] = stations[np.argmin(drift[stations])]
+    destination = np.full(zones, -1)
+    if not importing.any():
+        return gateway, destination
+    left = np.where(importing, imports, -np.inf)
+    for zone in np.argsort(-exports, kind="stable"):
+        if exports[zone] > 0 and not importing[zone]:
+            destination[zone] = np.argmax(left)
+            left[destination[zone]] -= exports[zone]
+    return gateway, destination
+
+
+def zone_instance(instance, stations, vehicles, depot=None):
+    """
+    Inputs of one zone: its stations, its vehicles (one without capacity if
+    it has none) and, with a depot, a depot station last; depot maps
+    station inputs to the depot's row (zero where missing)
+    """
+    zone = dict(instance)
+    for name in STATION_INPUTS:
+        if instance.get(name) is None:
+            continue
+        values = np.asarray(instance[name], dtype=float)[stations]
+        if depot is not None:
+            row = np.broadcast_to(depot.get(name, 0.0), values.shape[1:])
+            values = np.concatenate([values, row[None]])
+        zone[name] = values
+    for name in VEHICLE_INPUTS:
+        if instance.get(name) is not None:
+            zone[name] = np.asarray(instance[name], dtype=float)[vehicles] if len(vehicles) else np.zeros(1)
+    z_sv_1 = instance.get("z_sv_1")
+    if z_sv_1 is not None and len(vehicles):
+        z_sv_1 = np.asarray(z_sv_1, dtype=float).reshape(len(instance["C_s"]), -1)[stations][:, vehicles]
+        zone["z_sv_1"] = z_sv_1 if depot is None else np.vstack([z_sv_1, np.zeros((1, len(vehicles)))])
+    else:
+        zone["z_sv_1"] = None
+    return zone
+
+
+def _bound(model):
+    """
+    Best bound of a solved model of either backend
+    """
+    if hasattr(model, "model"):
+        try:
+            return model.model.ObjBound
+        except gp.GurobiError:
+            return None
+    objective, gap = model.objective_value, model.mip_gap
+    if objective is None or gap is None:
+        return None
+    return objective - gap * abs(objective)
+
+
+def solve_zone(build, instance, solve_kwargs):
+    """
+    Build and solve one zone; returns its solution, objective and times
+    (a top-level function, so it can run in a worker process)
+    """
+    start = time.perf_counter()
+    model = build(**instance)
+    model.solve(**solve_kwargs)
+    if model.objective_value is None:
+        raise RuntimeError("no solution of a zone subproblem")
+    return {
+        "solution": model.solution(),
+        "objective": model.objective_value,
+        "mip_gap": model.mip_gap,
+        "time": time.perf_counter() - start,
+    }
+
+
+def _solve_zones(build, instances, workers, solve_kwargs):
+    if workers == 1 or len(instances) == 1:
+        return [solve_zone(build, zone, solve_kwargs) for zone in instances]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(solve_zone, [build] * len(instances), instances, [solve_kwargs] * len(instances)))
+
+
+def _combine(instance, labels, vehicles, results, positions):
+    """
+    Monolithic-shaped plan from the zone solutions; a zone's depot row is
+    placed at its gateway station for the vehicle variables and dropped
+    from the station variables
+    """
+    S, T = np.shape(instance["f_plus"])
+    V = len(instance["C_hat_v"])
+    plan = {}
+    for zone, result in enumerate(results):
+        stations = np.flatnonzero(labels == zone)
+        fleet = np.flatnonzero(vehicles == zone)
+        for name, value in result["solution"].items():
+            if name in STACKED_VARIABLES:
+                value = value[:, :len(positions[zone]), :len(fleet)]
+                plan.setdefault(name, np.zeros((T, S, V)))[np.ix_(np.arange(T), positions[zone], fleet)] = value
+            elif name in VEHICLE_VARIABLES:
+                plan.setdefault(name, np.zeros((V, T)))[fleet] = value[:len(fleet)]
+            else:
+                plan.setdefault(name, np.zeros((S, T)))[stations] = value[:len(stations)]
+    return plan
+
+
+def repair(build, instance, plan, **solve_kwargs):
+    """
+    The monolithic model solved with the vehicle positions of plan fixed
+
+    Only the pickups, drop-offs and trips along the given routes are
+    optimized, so the result is a feasible plan of the monolithic model
+    whatever the zones assumed about each other. Returns the model.
+    """
+    model = build(**instance)
+    model.tighten_bounds("z", plan["z"], plan["z"])
+    model.solve(**solve_kwargs)
+    if model.objective_value is None:
+        raise RuntimeError("no plan along the routes of the zones")
+    return model
+
+
+def decompose(build, instance, zones=None, zone_size=30, distances=None, workers=None, seed=0, **solve_kwargs):
+    """
+    Solve instance zone by zone (see the module docstring); build is a
+    gurobipy model builder and solve_kwargs go to every solve. Without
+    zones there are ceil(S / zone_size) zones, but not more than vehicles.
+
+    Returns the repaired plan and a report with the zones, the master's
+    transfers and bound, the (exporting zone, importing zone, gateway)
+    triples, per-zone and repair times and the plan's objective.
+    """
+    start = time.perf_counter()
+    S, T = np.shape(instance["f_plus"])
+    # A zone without a vehicle can only lose demand, so by default there are not more zones than vehicles
+    zones = zones or max(1, min(int(np.ceil(S / zone_size)), len(instance["C_hat_v"])))
+    labels = cluster_stations(instance, zones, distances, seed)
+    vehicles = assign_vehicles(instance, labels)
+    zones = labels.max() + 1
+    workers = workers or min(zones, os.cpu_count() or 1)
+    report = {
+        "zones": int(zones),
+        "zone_sizes": np.bincount(labels).tolist(),
+        "zone_vehicles": np.bincount(vehicles, minlength=zones).tolist(),
+        "cluster_time": time.perf_counter() - start,
+    }
+
+    # -----Master: inter-zone transfers-----
+    phase = time.perf_counter()
+    master = build(**master_instance(instance, labels))
+    master.solve(**solve_kwargs)
+    if master.objective_value is None:
+        raise RuntimeError("no solution of the master problem")
+    report["master_objective"] = master.objective_value
+    report["master_bound"] = _bound(master)
+    report["master_time"] = time.perf_counter() - phase
+    types = _bike_types(instance)
+    targets = []
+    fleet = np.bincount(vehicles, minlength=zones) > 0
+    _, need = station_need(instance)
+    zone_need = np.bincount(labels, weights=need, minlength=zones)
+    for *_, r_plus, r_minus, _, _ in types:
+        net = np.rint(master.value(r_minus) - master.value(r_plus)).sum(axis=2).T
+        # Zones without a vehicle cannot bring bikes to their depot or fetch them from it
+        net = net * fleet[:, None]
+        targets.append(transfer_targets(net, zone_need))
+    exporting = np.any([exports[:, -1] > 0 for exports, _ in targets], axis=0)
+    importing = np.any([imports[:, -1] > 0 for _, imports in targets], axis=0) & ~exporting
+    gateway, destination = gateways(
+        instance, labels, importing, sum(exports[:, -1] for exports, _ in targets),
+        sum(imports[:, -1] for _, imports in targets),
+    )
+    report["gateways"] = [
+        (int(zone), int(destination[zone]), int(gateway[destination[zone]])) for zone in np.flatnonzero(destination >= 0)
+    ]
+
+    # -----Exporting and neutral zones: deliver the transfers to a gateway-----
+    # An exporting zone sees its destination's gateway as a depot row
+    phase = time.perf_counter()
+    depots = [{} if destination[zone] >= 0 else None for zone in range(zones)]
+    positions = [np.flatnonzero(labels == zone) for zone in range(zones)]
+    for zone in np.flatnonzero(destination >= 0):
+        positions[zone] = np.append(positions[zone], gateway[destination[zone]])
+        for (rentals, *_), (exports, _) in zip(types, targets):
+            # Bikes counted at the end of period t are at the depot in t + 1;
+            # trips of the last period are not bound by any inventory
+            due = np.zeros(T)
+            due[1:] = np.diff(exports[zone], prepend=0)[:-1]
+            due[-1] = 0
+            depots[zone][rentals] = due
+        depots[zone]["C_s"] = max(1.0, sum(due.sum() for due in depots[zone].values()))
+    first = np.flatnonzero(~importing)
+    instances = [
+        zone_instance(instance, np.flatnonzero(labels == zone), np.flatnonzero(vehicles == zone), depots[zone])
+        for zone in range(zones)
+    ]
+    results = [None] * zones
+    for zone, result in zip(first, _solve_zones(build, [instances[zone] for zone in first], workers, solve_kwargs)):
+        results[zone] = result
+    report["export_time"] = time.perf_counter() - phase
+
+    # -----Importing zones: expect what was delivered at their gateway, one period later-----
+    phase = time.perf_counter()
+    second = np.flatnonzero(importing)
+    report["planned_transfers"], report["delivered_transfers"] = [], []
+    for (rentals, returns, x_plus, *_), (exports, imports) in zip(types, targets):
+        report["planned_transfers"].append(float(exports[:, -1].sum()))
+        delivered = np.zeros((zones, T))
+        for zone in np.flatnonzero(destination >= 0):
+            delivered[destination[zone]] += np.cumsum(results[zone]["solution"][x_plus][-1])
+        report["delivered_transfers"].append(float(delivered[:, -1].sum()))
+        for zone in second:
+            available = np.zeros(T)
+            available[1:] = delivered[zone, :-1]
+            received = np.floor(np.minimum(imports[zone], available) + 1e-6)
+            stations = np.flatnonzero(labels == zone)
+            instances[zone][returns][stations == gateway[zone]] += np.diff(received, prepend=0)
+    for zone, result in zip(second, _solve_zones(build, [instances[zone] for zone in second], workers, solve_kwargs)):
+        results[zone] = result
+    report["import_time"] = time.perf_counter() - phase
+    report["zone_times"] = [result["time"] for result in results]
+    report["zone_gaps"] = [result["mip_gap"] for result in results]
+
+    # -----Repair: the monolithic model along the zones' routes-----
+    phase = time.perf_counter()
+    routes = _combine(instance, labels, vehicles, results, positions)
+    model = repair(build, instance, routes, **solve_kwargs)
+    plan = {name: np.round(value) for name, value in model.solution().items()}
+    report["repair_time"] = time.perf_counter() - phase
+    objective = float(plan_objective(plan, instance))
+    report["objective"] = objective
+    bound = report["master_bound"]
+    # The master bound is 0 whenever every zone can absorb its demand in aggregate
+    report["bound_gap"] = None if bound is None or bound <= 0 else (objective - bound) / max(abs(objective), 1e-9)
+    report["total_time"] = time.perf_counter() - start
+    return plan, report
+
+
+def compare_monolithic(
+    build, instance, zones=None, zone_size=30, distances=None, workers=None, seed=0, **solve_kwargs,
+):
+    """
+    decompose() next to the monolithic solve; monolithic_gap is the
+    decomposed objective against the monolithic bound. Only for instances
+    small enough to solve as one model.
+    """
+    _, report = decompose(build, instance, zones, zone_size, distances, workers, seed, **solve_kwargs)
+    start = time.perf_counter()
+    model = build(**instance)
+    model.solve(**solve_kwargs)
+    report["monolithic_time"] = time.perf_counter() - start
+    report["monolithic_objective"] = model.objective_value
+    report["monolithic_bound"] = _bound(model)
+    bound = report["monolithic_bound"]
+    report["monolithic_gap"] = None if bound is None else (report["objective"] - bound) / max(abs(report["objective"]), 1e-9)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["baseline", "electric"], default="electric")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--periods", type=int, default=32)
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--zones", type=int, help="number of zones (default: stations / zone size)")
+    parser.add_argument("--zone-size", type=int, default=30)
+    parser.add_argument("--no-distances", action="store_true", help="ignore distances.npy in the data folder")
+    parser.add_argument("--workers", type=int, help="parallel zone solves (default: one per zone, up to the cores)")
+    parser.add_argument("--time-limit", type=float, default=120, help="Gurobi time limit per solve")
+    parser.add_argument("--threads", type=int, default=1, help="Gurobi threads per solve")
+    parser.add_argument("--compare", action="store_true", help="also solve the monolithic model")
+    args = parser.parse_args()
+
+    load, build = {
+        "baseline": (load_baseline_instance, build_baseline_gurobi),
+        "electric": (load_electric_instance, build_electric_gurobi),
+    }[args.model]
+    instance = load(S=args.stations, T=args.periods, V=args.vehicles, data_dir=args.data_dir, start=args.start)
+    distances = None if args.no_distances else station_distances(args.data_dir, args.stations)
+    kwargs = dict(
+        zones=args.zones, zone_size=args.zone_size, distances=distances, workers=args.workers,
+        OutputFlag=0, TimeLimit=args.time_limit, Threads=args.threads,
+    )
+    if args.compare:
+        report = compare_monolithic(build, instance, **kwargs)
+    else:
+        _, report = decompose(build, instance, **kwargs)
+    fmt = lambda value: "-" if value is None else f"{value:.2%}"
+    print(f"{report['zones']} zones, sizes {report['zone_sizes']}, vehicles {report['zone_vehicles']}")
+    print(f"Master: objective {report['master_objective']:.2f}, bound {report['master_bound']:.2f} ({report['master_time']:.2f}s)")
+    print(f"Transfers planned {report['planned_transfers']}, delivered {report['delivered_transfers']}")
+    for zone, destination, station in report["gateways"]:
+        print(f"  zone {zone} -> zone {destination} at station {station}")
+    print(
+        f"Decomposed: objective {report['objective']:.2f}, gap to master bound {fmt(report['bound_gap'])}, "
+        f"{report['total_time']:.2f}s (slowest zone {max(report['zone_times']):.2f}s, repair {report['repair_time']:.2f}s)"
+    )
+    if args.compare:
+        print(
+            f"Monolithic: objective {report['monolithic_objective']}, bound {report['monolithic_bound']}, "
+            f"{report['monolithic_time']:.2f}s; decomposed vs monolithic bound {fmt(report['monolithic_gap'])}"
+        )
+
+
+if __name__ == "__main__":
+    main()
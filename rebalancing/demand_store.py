@@ -0,0 +1,201 @@
+"""
+Precompiled demand store
+
+compile_demand_store turns the rentals/returns CSVs into one uint16 .npy
+array of shape (kind, bike type, station, period), with kinds
+(rentals, returns) and bike types (classic, electric), plus a small JSON
+header with the station index and the source files it was compiled from.
+DemandStore opens the array as a read-only memory map, so a (station,
+period) window is a zero-copy view and only the pages that are read are
+loaded into memory:
+
+    python -m rebalancing.demand_store --data-dir .
+
+    store = DemandStore(".")
+    f_bar_plus = store.window("rentals", "electric", S=30, T=96, start=96 * 7)
+
+demand_matrix in rebalancing/data.py uses the store automatically as long
+as the CSVs it was compiled from are unchanged.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+NUM_DAYS = 500
+PERIODS_PER_DAY = 96
+
+STORE_FILENAME = "demand_store.npy"
+HEADER_FILENAME = "demand_store.json"
+KINDS = ("rentals", "returns")
+BIKE_TYPES = ("classic", "electric")
+CHUNK_SIZE = 1_000_000
+
+
+def _source_files(data_dir):
+    """
+    CSV files of each kind: the combined file when present, else the split files
+    """
+    sources = {}
+    for kind in KINDS:
+        combined = os.path.join(data_dir, f"{kind}.csv")
+        if os.path.exists(combined):
+            sources[kind] = [combined]
+        else:
+            sources[kind] = [os.path.join(data_dir, f"{kind}_{bike}.csv") for bike in BIKE_TYPES]
+    return sources
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _read_chunks(path, kind):
+    usecols = [kind, "time_period", "station_id", "bike_type"]
+    return pd.read_csv(path, usecols=usecols, chunksize=CHUNK_SIZE)
+
+
+def store_periods(days=NUM_DAYS):
+    """
+    Period columns of a store of `days` days (at least NUM_DAYS): period p
+    of day d is time_period d * PERIODS_PER_DAY + p + 1, as in the CSVs, so
+    column 0 stays empty and the last period of the last day is the last
+    column
+    """
+    return PERIODS_PER_DAY * max(days, NUM_DAYS) + 1
+
+
+def compile_demand_store(data_dir=".", out_dir=None, periods=None):
+    """
+    Compile the rentals/returns CSVs in data_dir into a demand store in out_dir
+    with `periods` columns (default store_periods())
+    """
+    periods = periods or store_periods()
+    out_dir = out_dir or data_dir
+    sources = _source_files(data_dir)
+
+    # Stations that appear in the data, in the order of the pivot in demand_matrix
+    station_ids = set()
+    for paths in sources.values():
+        for path in paths:
+            for chunk in pd.read_csv(path, usecols=["station_id"], chunksize=CHUNK_SIZE):
+                station_ids.update(chunk["station_id"].unique().tolist())
+    station_ids = sorted(station_ids)
+    row_of = {station: row for row, station in enumerate(station_ids)}
+
+    shape = (len(KINDS), len(BIKE_TYPES), len(station_ids), periods)
+    demand = np.lib.format.open_memmap(
+        os.path.join(out_dir, STORE_FILENAME), mode="w+", dtype=np.uint16, shape=shape
+    )
+    for k, kind in enumerate(KINDS):
+        for path in sources[kind]:
+            for chunk in _read_chunks(path, kind):
+                chunk = chunk[chunk["time_period"] < periods]
+                counts = chunk[kind].to_numpy()
+                if np.any(counts != np.round(counts)) or np.any(counts < 0) or np.any(counts > np.iinfo(np.uint16).max):
+                    raise ValueError(f"{path}: {kind} must be integer counts between 0 and 65535")
+                bike = chunk["bike_type"].map({b: i for i, b in enumerate(BIKE_TYPES)}).to_numpy()
+                rows = chunk["station_id"].map(row_of).to_numpy()
+                np.add.at(demand[k], (bike, rows, chunk["time_period"].to_numpy()), counts.astype(np.uint16))
+    demand.flush()
+
+    header = {
+        "shape": list(shape),
+        "kinds": list(KINDS),
+        "bike_types": list(BIKE_TYPES),
+        "station_ids": station_ids,
+        "sources": {os.path.basename(path): _stat(path) for paths in sources.values() for path in paths},
+    }
+    for kind in KINDS:
+        for bike in BIKE_TYPES:
+            split = os.path.join(data_dir, f"{kind}_{bike}.csv")
+            if os.path.exists(split):
+                header["sources"][os.path.basename(split)] = _stat(split)
+    with open(os.path.join(out_dir, HEADER_FILENAME), "w") as f:
+        json.dump(header, f)
+    return DemandStore(out_dir)
+
+
+class DemandStore:
+    """
+    Read-only, memory-mapped view of a compiled demand store
+    """
+    def __init__(self, store_dir="."):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, HEADER_FILENAME)) as f:
+            self.header = json.load(f)
+        self.demand = np.load(os.path.join(store_dir, STORE_FILENAME), mmap_mode="r")
+        self.station_ids = self.header["station_ids"]
+
+    @property
+    def periods(self):
+        return self.demand.shape[-1]
+
+    def window(self, kind, bike_type, S=None, T=None, start=0):
+        """
+        (S, T) counts of one kind and bike type; a view, nothing is copied
+
+        bike_type "all" combines both bike types the way the pivot over
+        rentals.csv / returns.csv in baseline_problem.py does (the mean of
+        the non-empty classic and electric counts); that one is a copy.
+        """
+        stop = None if T is None else start + T
+        k = self.header["kinds"].index(kind)
+        if bike_type == "all":
+            classic = self.demand[k, 0, :S, start:stop].astype(float)
+            electric = self.demand[k, 1, :S, start:stop].astype(float)
+            present = (classic > 0).astype(int) + (electric > 0)
+            return np.divide(classic + electric, present, out=np.zeros_like(classic), where=present > 0)
+        return self.demand[k, self.header["bike_types"].index(bike_type), :S, start:stop]
+
+    def is_current(self, data_dir):
+        """
+        True if every source CSV in data_dir is unchanged since compiling
+        """
+        for filename, stat in self.header["sources"].items():
+            path = os.path.join(data_dir, filename)
+            if not os.path.exists(path) or _stat(path) != stat:
+                return False
+        return True
+
+    def source(self, filepath):
+        """
+        (kind, bike type) stored for one of the CSV files, or None
+
+        A store aggregated straight from trip files (see streaming.py) or
+        generated (see synthetic.py) has no source CSVs and stands in for
+        all of the standard ones.
+        """
+        filename = os.path.basename(filepath)
+        if self.header.get("origin") not in ("trips", "synthetic") and filename not in self.header["sources"]:
+            return None
+        kind, _, bike_type = os.path.splitext(filename)[0].partition("_")
+        if kind not in self.header["kinds"] or bike_type not in self.header["bike_types"] + [""]:
+            return None
+        return kind, bike_type or "all"
+
+
+def open_store(data_dir):
+    """
+    The demand store compiled from the CSVs in data_dir, if it is up to date
+    """
+    if not os.path.exists(os.path.join(data_dir, HEADER_FILENAME)):
+        return None
+    store = DemandStore(data_dir)
+    return store if store.is_current(data_dir) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--out-dir", help="where to write the store (default: the data directory)")
+    args = parser.parse_args()
+    store = compile_demand_store(args.data_dir, args.out_dir)
+    print(f"Compiled {store.demand.shape} demand store in {store.store_dir}")
+
+
+if __name__ == "__main__":
+    main()
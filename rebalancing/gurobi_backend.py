@@ -0,0 +1,314 @@
+"""
+Direct gurobipy backend for the rebalancing problems
+
+Builds the same MIP as rebalancing/model.py without going through cvxpy:
+all variables live in one flattened MVar, simple bounds become variable
+bounds, and every constraint block is a single sparse matrix handed to
+Model.addMConstr. Variables are flattened row-major, so a (n, T) variable
+X has column offset + i*T + t, and (A kron B) @ vec(X) == vec(A @ X @ B.T).
+
+build_baseline_gurobi and build_electric_gurobi are the one- and
+two-commodity cases of build_commodity_gurobi (commodity.py), returned
+under the variable names of each bike type.
+"""
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+from .model import STACKED_VARIABLES, symmetry_order, symmetry_permutation
+
+
+class ColumnLayout:
+    """
+    Column ranges of every variable inside the single flattened MVar
+    """
+    def __init__(self):
+        self.blocks = {}
+        self.size = 0
+
+    def add(self, name, shape):
+        self.blocks[name] = (self.size, shape)
+        self.size += int(np.prod(shape))
+
+    def columns(self, name):
+        start, shape = self.blocks[name]
+        return slice(start, start + int(np.prod(shape)))
+
+    def place(self, name, matrix):
+        """
+        Widen a (rows, size of name) matrix to (rows, all columns)
+        """
+        start, _ = self.blocks[name]
+        matrix = sp.coo_matrix(matrix)
+        return sp.csr_matrix(
+            (matrix.data, (matrix.row, matrix.col + start)), shape=(matrix.shape[0], self.size)
+        )
+
+    def rows(self, *terms):
+        """
+        Sum of (name, matrix) terms as one constraint matrix
+        """
+        return sum(self.place(name, matrix) for name, matrix in terms)
+
+
+def _shift(T):
+    """
+    Column selectors for X[:, :-1] (current) and X[:, 1:] (next)
+    """
+    return sp.eye(T - 1, T, k=0, format="csr"), sp.eye(T - 1, T, k=1, format="csr")
+
+
+class GurobiRebalancingModel:
+    """
+    A rebalancing problem built directly in gurobipy
+
+    value(), solution() and objective_value return results in the same
+    shapes as RebalancingModel, so both backends are interchangeable.
+    After strengthening, x only holds the columns that were not fixed;
+    the fixed ones keep their value in fixed_values.
+    """
+    def __init__(
+        self, model, x, layout, S, T, V, build_time, columns=None, fixed_values=None, reduction=None, pairs=(),
+    ):
+        self.model = model
+        self.x = x
+        self.layout = layout
+        self.S = S
+        self.T = T
+        self.V = V
+        self.build_time = build_time
+        self.variables = list(layout.blocks)
+        self.columns = np.arange(layout.size) if columns is None else columns
+        self.fixed_values = np.zeros(layout.size) if fixed_values is None else fixed_values
+        self.reduction = reduction
+        self.pairs = list(pairs)
+
+    def set_start(self, solution):
+        """
+        MIP start from solution (arrays shaped as returned by value());
+        identical vehicles are renumbered to meet the symmetry rows of a
+        strengthened model
+        """
+        start = np.full(self.layout.size, GRB.UNDEFINED)
+        for name, value in solution.items():
+            start[self.layout.columns(name)] = self._layout_order(name, value)
+        if self.pairs and solution.get("z") is not None:
+            z = start[self.layout.columns("z")].reshape(self.S, self.V, self.T)
+            order = symmetry_permutation(z, self.pairs)
+            for name, (_, shape) in self.layout.blocks.items():
+                cols = self.layout.columns(name)
+                start[cols] = symmetry_order(start[cols].reshape(shape), name, order, self.V).ravel()
+        self.x.Start = start[self.columns]
+
+    def _layout_order(self, name, value):
+        """
+        Values shaped as value(name), flattened in the column order of the layout
+        """
+        value = np.asarray(value, dtype=float)
+        if name in STACKED_VARIABLES:
+            value = value.transpose(1, 2, 0)
+        return np.ravel(value)
+
+    def tighten_bounds(self, name, low=None, high=None):
+        """
+        Tighten the bounds of a variable to low/high (shaped as value(name),
+        or scalars); NaN entries, and columns removed by strengthening, keep
+        their bounds
+        """
+        position = np.full(self.layout.size, -1)
+        position[self.columns] = np.arange(len(self.columns))
+        cols = position[self.layout.columns(name)]
+        self.model.update()
+        lb, ub = self.x.LB, self.x.UB
+        for bound, values, tighter in ((lb, low, np.maximum), (ub, high, np.minimum)):
+            if values is None:
+                continue
+            if np.ndim(values) == 0:
+                values = np.full(cols.shape, float(values))
+            else:
+                values = self._layout_order(name, values)
+            keep = (cols >= 0) & ~np.isnan(values)
+            bound[cols[keep]] = tighter(bound[cols[keep]], values[keep])
+        self.x.LB = lb
+        self.x.UB = ub
+
+    def solve(self, **params):
+        """
+        Optimize with the given Gurobi parameters, e.g. solve(TimeLimit=60, MIPGap=0.01)
+        """
+        for name, value in params.items():
+            self.model.setParam(name, value)
+        self.model.optimize()
+        return self.objective_value
+
+    @property
+    def objective_value(self):
+        if self.model.SolCount == 0:
+            return None
+        return self.model.ObjVal
+
+    @property
+    def mip_gap(self):
+        if self.model.SolCount == 0:
+            return None
+        return self.model.MIPGap
+
+    def _reshape(self, name, values):
+        _, shape = self.layout.blocks[name]
+        value = values[self.layout.columns(name)].reshape(shape)
+        if name in STACKED_VARIABLES:
+            return value.reshape(self.S, self.V, self.T).transpose(2, 0, 1)
+        return value
+
+    def value(self, name):
+        if self.model.SolCount == 0:
+            return None
+        values = self.fixed_values.copy()
+        values[self.columns] = self.x.X
+        return self._reshape(name, values)
+
+    def solution(self):
+        return {name: self.value(name) for name in self.variables}
+
+    def decode(self, x):
+        """
+        Solution arrays, as in solution(), from values of x (e.g. an
+        incumbent read with cbGetSolution in a callback)
+        """
+        values = self.fixed_values.copy()
+        values[self.columns] = x
+        return {name: self._reshape(name, values) for name in self.variables}
+
+
+def _bounds(lb, ub, name, layout, low, high):
+    cols = layout.columns(name)
+    lb[cols] = np.ravel(low)
+    ub[cols] = np.ravel(high)
+
+
+def _presolve(A, sense, b, lb, ub, integer, passes=10):
+    """
+    Bound propagation on the rows A x (sense) b, sense "=" or "<"
+
+    Singleton rows become variable bounds, and rows that can only hold with
+    every variable at one of its bounds (e.g. r_plus + r_minus <= 0 once z
+    is fixed to 0) fix those variables. Returns the rows still needed and
+    the tightened bounds; the caller drops the columns with lb == ub.
+    """
+    A = sp.csr_matrix(A)
+    lb, ub = lb.copy(), ub.copy()
+    active = np.ones(A.shape[0], dtype=bool)
+    for _ in range(passes):
+        fixed = lb == ub
+        free = sp.csr_matrix(A @ sp.diags((~fixed).astype(float)))
+        free.eliminate_zeros()
+        rhs = b - A @ np.where(fixed, lb, 0)
+        count = np.diff(free.indptr)
+        before = (lb.copy(), ub.copy(), active.copy())
+
+        # Singleton rows -> bounds
+        rows = np.nonzero(active & (count == 1))[0]
+        cols = free.indices[free.indptr[rows]]
+        coef = free.data[free.indptr[rows]]
+        bound = rhs[rows] / coef
+        upper = (sense[rows] == "=") | (coef > 0)
+        lower = (sense[rows] == "=") | (coef < 0)
+        np.minimum.at(ub, cols[upper], bound[upper])
+        np.maximum.at(lb, cols[lower], bound[lower])
+        ub[integer] = np.floor(ub[integer] + 1e-9)
+        lb[integer] = np.ceil(lb[integer] - 1e-9)
+        active[rows] = False
+        active[count == 0] = False
+
+        # Forcing rows: the bound side of the row is already met at the bounds
+        low_activity = free.maximum(0) @ lb + free.minimum(0) @ ub
+        high_activity = free.maximum(0) @ ub + free.minimum(0) @ lb
+        at_low = active & np.isclose(low_activity, rhs)
+        at_high = active & (sense == "=") & np.isclose(high_activity, rhs)
+        for rows, positive_to, negative_to in ((at_low, lb, ub), (at_high, ub, lb)):
+            forced = free[rows]
+            positive = np.unique(forced.maximum(0).indices)
+            negative = np.unique((-forced).maximum(0).indices)
+            lb[positive], ub[positive] = positive_to[positive], positive_to[positive]
+            lb[negative], ub[negative] = negative_to[negative], negative_to[negative]
+            active[rows] = False
+
+        if all(np.array_equal(old, new) for old, new in zip(before, (lb, ub, active))):
+            break
+    return active, lb, ub
+
+
+def _strengthen(blocks, lb, ub, vtype):
+    """
+    Presolve the constraint blocks and drop fixed columns and redundant rows
+
+    Returns the reduced (A, sense, b) blocks, the kept columns, the values
+    of all columns (used for the fixed ones) and a report of the reduction.
+    """
+    A = sp.vstack([block for block, _, _ in blocks], format="csr")
+    sense = np.concatenate([np.full(block.shape[0], kind) for block, kind, _ in blocks])
+    b = np.concatenate([rhs for _, _, rhs in blocks])
+    integer = vtype != GRB.CONTINUOUS
+    active, new_lb, new_ub = _presolve(A, sense, b, lb, ub, integer)
+
+    fixed = new_lb == new_ub
+    columns = np.nonzero(~fixed)[0]
+    values = np.where(fixed, new_lb, 0)
+    rhs = b - A @ values
+    reduced = [
+        (A[active & (sense == kind)][:, columns], kind, rhs[active & (sense == kind)])
+        for kind in ("=", "<") if np.any(active & (sense == kind))
+    ]
+    report = {
+        "rows": A.shape[0], "rows_removed": int(A.shape[0] - active.sum()),
+        "columns": A.shape[1], "columns_removed": int(fixed.sum()),
+        "bounds_tightened": int(np.sum((new_lb != lb) | (new_ub != ub))),
+    }
+    return reduced, columns, values, new_lb, new_ub, report
+
+
+def _build_legacy(instance, z_sv_1, arcs, env, strengthen):
+    """
+    A baseline or electric instance built as the K=1 / K=2 commodity model,
+    under the variable names of the bike types
+    """
+    # commodity.py builds on this module, so it is only imported here
+    from .commodity import build_commodity_gurobi, commodity_instance
+
+    inputs = commodity_instance(dict(instance, z_sv_1=z_sv_1, arcs=arcs))
+    return build_commodity_gurobi(**inputs, env=env, strengthen=strengthen).legacy_model()
+
+
+def build_baseline_gurobi(
+    f_plus, f_minus, C_s, C_hat_v, d_s_1, d_hat_v_1, z_sv_1=None, arcs=None, env=None, strengthen=False,
+):
+    """
+    gurobipy counterpart of build_baseline_model
+
+    arcs is the optional (A, 2) array of station pairs a vehicle can drive
+    between in one period (see routing.py); the model then has an
+    (A*V, T-1) arc variable y.
+
+    With strengthen=True the model gets symmetry-breaking rows for identical
+    vehicles and a bound-propagation pass that removes fixed columns and
+    redundant rows before anything is handed to Gurobi; model.reduction
+    reports what was removed.
+    """
+    instance = dict(f_plus=f_plus, f_minus=f_minus, C_s=C_s, C_hat_v=C_hat_v, d_s_1=d_s_1, d_hat_v_1=d_hat_v_1)
+    return _build_legacy(instance, z_sv_1, arcs, env, strengthen)
+
+
+def build_electric_gurobi(
+    f_plus, f_minus, f_bar_plus, f_bar_minus, C_s, C_hat_v, C_tilde_v,
+    d_s_1, d_bar_s_1, d_hat_v_1, d_tilde_v_1, a_classic=1, a_electric=2, w_s=None, z_sv_1=None, arcs=None,
+    env=None, strengthen=False,
+):
+    """
+    gurobipy counterpart of build_electric_model
+    """
+    instance = dict(
+        f_plus=f_plus, f_minus=f_minus, f_bar_plus=f_bar_plus, f_bar_minus=f_bar_minus, C_s=C_s,
+        C_hat_v=C_hat_v, C_tilde_v=C_tilde_v, d_s_1=d_s_1, d_bar_s_1=d_bar_s_1, d_hat_v_1=d_hat_v_1,
+        d_tilde_v_1=d_tilde_v_1, a_classic=a_classic, a_electric=a_electric, w_s=w_s,
+    )
+    return _build_legacy(instance, z_sv_1, arcs, env, strengthen)
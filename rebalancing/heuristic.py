@@ -0,0 +1,211 @@
+"""
+Greedy rebalancing heuristic
+
+Builds a feasible plan for the baseline or e-bike model in one pass over
+the periods, without a solver. In every period each vehicle goes to the
+station whose projected shortfall (rentals it cannot serve in the next
+`lookahead` periods) or overflow (returns that would not fit) it can
+reduce the most, drops off or picks up bikes there, and then as many trips
+are served as the station inventories allow. Lost e-bike demand is
+weighted with a_electric, so e-bike shortfalls are covered first.
+
+The plan has the arrays of model.solution(), so it can be used on its own
+when an answer is needed in well under a second, or as a MIP start:
+
+    plan = greedy_plan(**instance)
+    model = build_electric_gurobi(**instance)
+    model.set_start(plan)
+
+    python -m rebalancing.heuristic --model electric --periods 96 --vehicles 5
+"""
+import argparse
+import time
+
+import numpy as np
+
+from .data import load_baseline_instance, load_electric_instance
+from .results import INPUT_NAMES, Results
+
+# Variable names of the classic and e-bike parts of the plan
+NAMES = (
+    ("d", "d_hat", "x_plus", "x_minus", "r_plus", "r_minus"),
+    ("d_bar", "d_tilde", "x_bar_plus", "x_bar_minus", "r_bar_plus", "r_bar_minus"),
+)
+
+
+def _start_stations(z_sv_1, S, V):
+    """
+    Starting station of each vehicle, -1 where the vehicle may start anywhere
+    """
+    if z_sv_1 is None:
+        return np.full(V, -1)
+    z_sv_1 = np.asarray(z_sv_1).reshape(S, V)
+    return np.where(z_sv_1.any(axis=0), z_sv_1.argmax(axis=0), -1)
+
+
+def greedy_plan(
+    f_plus, f_minus, C_s, C_hat_v, d_s_1, d_hat_v_1, f_bar_plus=None, f_bar_minus=None,
+    C_tilde_v=None, d_bar_s_1=None, d_tilde_v_1=None, a_classic=1, a_electric=2, w_s=None,
+    z_sv_1=None, lookahead=4,
+):
+    """
+    Feasible plan for the inputs of build_baseline_model (or, with the
+    f_bar_* inputs, build_electric_model), shaped like model.solution()
+    """
+    S, T = np.shape(f_plus)
+    V = np.shape(C_hat_v)[0]
+    electric = f_bar_plus is not None
+    K = 2 if electric else 1
+    # One row per bike type: classic, then e-bike; trips are integers
+    rentals = np.floor(np.array([f_plus, f_bar_plus][:K], dtype=float))
+    returns = np.floor(np.array([f_minus, f_bar_minus][:K], dtype=float))
+    loss = np.zeros((K, S, T))
+    if electric and w_s is not None:
+        loss[1] = w_s
+    vehicle_caps = np.array([C_hat_v, C_tilde_v][:K], dtype=float) # (K, V)
+    weights = np.array([a_classic, a_electric][:K], dtype=float)
+    C_s = np.asarray(C_s, dtype=float)
+    net = returns - rentals - loss
+
+    d = np.zeros((K, S, T))
+    load = np.zeros((K, V, T))
+    x_plus = np.zeros((K, S, T))
+    x_minus = np.zeros((K, S, T))
+    r_plus = np.zeros((K, T, S, V))
+    r_minus = np.zeros((K, T, S, V))
+    z = np.zeros((T, S, V))
+    d[:, :, 0] = [d_s_1, d_bar_s_1][:K]
+    load[:, :, 0] = [d_hat_v_1, d_tilde_v_1][:K]
+    start_station = _start_stations(z_sv_1, S, V)
+    position = np.where(start_station >= 0, start_station, 0)
+
+    for t in range(T):
+        inventory = d[:, :, t].copy()
+        vehicle = load[:, :, t].copy()
+        last = t == T - 1
+        # Projected need over the lookahead window if nothing is moved
+        cumulative = np.cumsum(net[:, :, t:t + lookahead], axis=2)
+        projected_low = inventory + np.minimum(cumulative.min(axis=2), 0)
+        shortfall = np.maximum(0, -projected_low)
+        surplus = np.maximum(0, projected_low)
+        overflow = np.maximum(0, inventory.sum(axis=0) + np.maximum(cumulative.sum(axis=0).max(axis=1), 0) - C_s)
+
+        for v in range(V):
+            if not (last or (t == 0 and start_station[v] >= 0)):
+                space = vehicle_caps[:, v] - vehicle[:, v]
+                # Shortfall elsewhere that this vehicle's load cannot cover yet
+                outstanding = np.maximum(shortfall.sum(axis=1) - vehicle[:, v], 0)
+                drop_gain = weights @ np.minimum(shortfall, vehicle[:, v, None])
+                pick_gain = weights.min() * np.minimum(overflow, space.sum())
+                # Spare bikes are worth half: they only pay off at a later stop
+                collect_gain = 0.5 * weights @ np.minimum(surplus, np.minimum(space, outstanding)[:, None])
+                score = drop_gain + pick_gain + collect_gain
+                if score.max() > 0:
+                    position[v] = score.argmax()
+            s = position[v]
+            z[t, s, v] = 1
+            if last:
+                continue
+
+            # Drop off into the shortfall, as far as the dock space allows
+            free = C_s[s] - inventory[:, s].sum()
+            for k in np.argsort(-weights):
+                drop = min(shortfall[k, s], vehicle[k, v], max(free, 0))
+                r_minus[k, t, s, v] = drop
+                vehicle[k, v] -= drop
+                inventory[k, s] += drop
+                shortfall[k, s] -= drop
+                free -= drop
+            # Pick up the overflow, cheapest bike type first, and spare bikes
+            # for the shortfall at other stations
+            for k in np.argsort(weights):
+                if r_minus[k, t, s, v] > 0:
+                    continue
+                outstanding = max(shortfall[k].sum() - vehicle[k, v], 0)
+                available = max(inventory[k, s] - loss[k, s, t], 0)
+                wanted = max(overflow[s], min(surplus[k, s], outstanding))
+                pick = min(wanted, vehicle_caps[k, v] - vehicle[k, v], available)
+                r_plus[k, t, s, v] = pick
+                vehicle[k, v] += pick
+                inventory[k, s] -= pick
+                surplus[k, s] = max(surplus[k, s] - pick, 0)
+                overflow[s] = max(overflow[s] - pick, 0)
+
+        # Serve every return and as many rentals as the bikes allow ...
+        served_returns = returns[:, :, t].copy()
+        served_rentals = np.minimum(rentals[:, :, t], np.maximum(inventory + served_returns - loss[:, :, t], 0))
+        if last:
+            # Nothing constrains the trips of the last period
+            served_rentals = rentals[:, :, t]
+        else:
+            following = inventory - served_rentals + served_returns - loss[:, :, t]
+            # ... then turn away returns that would not fit, cheapest bike type first
+            excess = np.maximum(following.sum(axis=0) - C_s, 0)
+            for k in np.argsort(weights):
+                cut = np.minimum(excess, np.minimum(np.maximum(following[k], 0), served_returns[k]))
+                served_returns[k] -= cut
+                following[k] -= cut
+                excess -= cut
+            d[:, :, t + 1] = following
+            load[:, :, t + 1] = vehicle
+        x_plus[:, :, t] = served_rentals
+        x_minus[:, :, t] = served_returns
+
+    plan = {"z": z}
+    for k in range(K):
+        d_name, load_name, plus, minus, pick, drop = NAMES[k]
+        plan.update({
+            d_name: d[k], load_name: load[k], plus: x_plus[k], minus: x_minus[k],
+            pick: r_plus[k], drop: r_minus[k],
+        })
+    return plan
+
+
+def plan_objective(plan, instance):
+    """
+    Objective of a plan: weighted lost demand, as in the models
+    """
+    lost = np.sum(instance["f_plus"] - plan["x_plus"]) + np.sum(instance["f_minus"] - plan["x_minus"])
+    if "x_bar_plus" not in plan:
+        return lost
+    lost_electric = np.sum(instance["f_bar_plus"] - plan["x_bar_plus"]) + np.sum(instance["f_bar_minus"] - plan["x_bar_minus"])
+    return lost * instance.get("a_classic", 1) + lost_electric * instance.get("a_electric", 2)
+
+
+def warm_start(model, instance, **kwargs):
+    """
+    Set the greedy plan of instance as the start of model; returns the plan
+    """
+    plan = greedy_plan(**instance, **kwargs)
+    model.set_start(plan)
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["baseline", "electric"], default="electric")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--periods", type=int, default=96)
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--lookahead", type=int, default=4)
+    parser.add_argument("--out", help="save the plan as a results file (.npz or .parquet)")
+    args = parser.parse_args()
+
+    load = {"baseline": load_baseline_instance, "electric": load_electric_instance}[args.model]
+    instance = load(S=args.stations, T=args.periods, V=args.vehicles, data_dir=args.data_dir, start=args.start)
+    start = time.perf_counter()
+    plan = greedy_plan(**instance, lookahead=args.lookahead)
+    elapsed = time.perf_counter() - start
+    inputs = {name: instance[name] for name in INPUT_NAMES if instance.get(name) is not None}
+    results = Results(plan, inputs, {
+        "config": vars(args), "objective": float(plan_objective(plan, instance)), "timings": {"heuristic_time": elapsed},
+    })
+    print(results.summary())
+    if args.out:
+        results.save(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Trip ingestion: simu*.json trip files -> rentals/returns CSVs
+
+Importable, parallel version of the input_data.ipynb pipeline. Each
+simu<k>_<day>.json file holds one day of trips as [departure minute,
+departure station, arrival minute, arrival station] rows. The files are
+read in parallel, trips are bucketed into 15-minute periods with integer
+arithmetic and counted on numeric (station, period, bike type) keys.
+
+As in the notebook:
+  - an arrival minute before its departure minute is on the next day and
+    gets 1440 added, and arrivals past the end of the day fall in the
+    day's last period (the notebook's "1425-1440" fallback)
+  - time_period = 96 * day + minute // 15 + 1
+  - a share of the trips (40% by default) is assigned to e-bikes at random;
+    here the draw comes from a generator seeded per day, so the split is
+    reproducible
+
+    python -m rebalancing.ingest --input "ORIE-5213-Spring2023/Bike sharing/Dataset" --out . --seed 0
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .demand_store import PERIODS_PER_DAY, compile_demand_store
+
+MINUTES_PER_DAY = 1440
+MINUTES_PER_PERIOD = MINUTES_PER_DAY // PERIODS_PER_DAY
+BIKE_TYPES = np.array(["classic", "electric"])
+# Labels of the 15-minute ranges as written by the notebook, e.g. "0-15"
+PERIOD_LABELS = np.array([f"{m}-{m + MINUTES_PER_PERIOD}" for m in range(0, MINUTES_PER_DAY, MINUTES_PER_PERIOD)])
+
+
+def trip_files(folder):
+    """
+    simu*.json files in folder with the day encoded in their name
+    """
+    files = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.startswith("simu") and filename.endswith(".json"):
+            day = int(filename.split("_")[1].split(".")[0])
+            files.append((day, os.path.join(folder, filename)))
+    return sorted(files)
+
+
+def read_trip_file(path):
+    """
+    (n, 4) int32 array of [departure minute, departure station, arrival minute, arrival station]
+    """
+    with open(path) as f:
+        trips = np.array(json.load(f), dtype=np.int32)
+    return trips.reshape(-1, 4)
+
+
+def read_trips(folder, workers=None):
+    """
+    All trips of all days as (trips, days), read in parallel
+    """
+    files = trip_files(folder)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        arrays = list(pool.map(read_trip_file, [path for _, path in files], chunksize=8))
+    days = np.concatenate([np.full(len(a), day, dtype=np.int32) for (day, _), a in zip(files, arrays)])
+    return np.concatenate(arrays), days
+
+
+def assign_bike_types(days, seed=0, electric_share=0.4, generators=None):
+    """
+    0 (classic) or 1 (electric) per trip; same 1-in-1000 draw as the notebook
+
+    Each day draws from its own (seed, day) stream, so a day gets the same
+    split whether it is ingested with all the others or appended on its own.
+    Passing the same generators dict across calls continues each day's
+    stream, for days that arrive in several chunks.
+    """
+    if len(days) == 0:
+        return np.zeros(0, dtype=np.int8)
+    generators = {} if generators is None else generators
+    order = np.argsort(days, kind="stable")
+    unique_days, counts = np.unique(days[order], return_counts=True)
+    draws = []
+    for day, n in zip(unique_days.tolist(), counts):
+        if day not in generators:
+            generators[day] = np.random.default_rng([seed, day])
+        draws.append(generators[day].integers(0, 1000, n))
+    bike_types = np.empty(len(days), dtype=np.int8)
+    bike_types[order] = np.concatenate(draws) < 1000 * electric_share
+    return bike_types
+
+
+def trip_periods(trips):
+    """
+    Within-day departure and arrival period (0-95) of each trip
+    """
+    departure, arrival = trips[:, 0], trips[:, 2].copy()
+    arrival[departure > arrival] += MINUTES_PER_DAY
+    last = PERIODS_PER_DAY - 1
+    return np.minimum(departure // MINUTES_PER_PERIOD, last), np.minimum(arrival // MINUTES_PER_PERIOD, last)
+
+
+def count_trips(stations, periods, days, bike_types, column):
+    """
+    One row per (station, period, day, bike type) with its number of trips,
+    in the column layout and row order of the notebook's groupby; no rows
+    when there are no trips
+    """
+    width = int(days.max()) + 1 if len(days) else 1 # an empty selection has no days to size the key with
+    key = ((stations.astype(np.int64) * PERIODS_PER_DAY + periods) * width + days) * 2 + bike_types
+    keys, counts = np.unique(key, return_counts=True)
+    bike = keys % 2
+    keys //= 2
+    day = keys % width
+    keys //= width
+    period = keys % PERIODS_PER_DAY
+    station = keys // PERIODS_PER_DAY
+
+    # The notebook grouped on the string label, so "1005-1020" sorts before "15-30"
+    label_rank = np.argsort(np.argsort(PERIOD_LABELS))
+    order = np.lexsort((bike, day, label_rank[period], station))
+    return pd.DataFrame({
+        "station_id": station[order],
+        column: PERIOD_LABELS[period[order]],
+        "day": day[order],
+        "bike_type": BIKE_TYPES[bike[order]],
+        "counts": counts[order],
+        "time_period": (day * PERIODS_PER_DAY + period + 1)[order],
+    })
+
+
+def demand_tables(trips, days, bike_types):
+    """
+    (rentals, returns) DataFrames as written by the notebook
+    """
+    departure_period, arrival_period = trip_periods(trips)
+    rentals = count_trips(trips[:, 1], departure_period, days, bike_types, "departure_time")
+    returns = count_trips(trips[:, 3], arrival_period, days, bike_types, "arrival_time")
+    return rentals.rename(columns={"counts": "rentals"}), returns.rename(columns={"counts": "returns"})
+
+
+def write_demand_csvs(rentals, returns, out_dir="."):
+    """
+    rentals/returns CSVs, combined and split by bike type
+    """
+    for name, df in (("rentals", rentals), ("returns", returns)):
+        df.to_csv(os.path.join(out_dir, f"{name}.csv"))
+        for bike in BIKE_TYPES:
+            df.loc[df["bike_type"] == bike].to_csv(os.path.join(out_dir, f"{name}_{bike}.csv"))
+
+
+def ingest(folder, out_dir=".", seed=0, electric_share=0.4, workers=None, store=False):
+    """
+    Full rebuild of the demand CSVs (and optionally the demand store) from the trip files
+    """
+    trips, days = read_trips(folder, workers)
+    bike_types = assign_bike_types(days, seed, electric_share)
+    rentals, returns = demand_tables(trips, days, bike_types)
+    write_demand_csvs(rentals, returns, out_dir)
+    if store:
+        compile_demand_store(out_dir)
+    return rentals, returns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="folder with the simu*.json files")
+    parser.add_argument("--out", default=".", help="folder for the rentals/returns CSVs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--electric-share", type=float, default=0.4)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--store", action="store_true", help="also compile the demand store")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rentals, returns = ingest(args.input, args.out, args.seed, args.electric_share, args.workers, args.store)
+    print(f"{rentals['rentals'].sum()} rentals and {returns['returns'].sum()} returns in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Vectorized KPIs and vehicle routes of rebalancing solutions
+
+Everything here works on the arrays of model.solution() / Results: z and
+the r_* moves are (T, S, V), station variables and demand are (S, T).
+Any number of leading batch axes is allowed, so a stack of N solutions of
+the same shape ((N, T, S, V), (N, S, T), ...) is evaluated in one call,
+e.g. all runs of a sweep or the windows of a rolling-horizon plan:
+
+    stations = vehicle_stations(z)       # (T, V) station of each vehicle
+    visited = unique_stations(z)         # (V,) distinct stations per vehicle
+    stops = stop_table(solution)         # one row per vehicle stop
+    table = batch_kpis(solutions, instances)
+"""
+import numpy as np
+import pandas as pd
+
+from .demand_store import PERIODS_PER_DAY
+
+PERIODS_PER_HOUR = 4
+# KPI name -> (served trips, expected demand)
+DEMAND = {
+    "classic_rentals": ("x_plus", "f_plus"),
+    "classic_returns": ("x_minus", "f_minus"),
+    "ebike_rentals": ("x_bar_plus", "f_bar_plus"),
+    "ebike_returns": ("x_bar_minus", "f_bar_minus"),
+}
+# Stop table column -> vehicle move variable
+MOVES = {
+    "bikes_picked_up": "r_plus",
+    "bikes_dropped_off": "r_minus",
+    "ebikes_picked_up": "r_bar_plus",
+    "ebikes_dropped_off": "r_bar_minus",
+}
+
+
+# -----Routes-----
+def vehicle_stations(z):
+    """
+    (..., T, V) station index of every vehicle in every period
+    """
+    return np.argmax(z, axis=-2)
+
+
+def moves(z):
+    """
+    (..., V) number of times each vehicle changes station
+    """
+    return np.count_nonzero(np.diff(vehicle_stations(z), axis=-2), axis=-2)
+
+
+def unique_stations(z):
+    """
+    (..., V) number of distinct stations each vehicle is at over the horizon
+    """
+    return np.count_nonzero(np.max(z, axis=-3), axis=-2)
+
+
+def routes(z):
+    """
+    Station sequence of each vehicle with repeated periods at the same
+    station collapsed, as one array per vehicle (single solution only)
+    """
+    stations = vehicle_stations(z)
+    arrivals = np.ones(stations.shape, dtype=bool)
+    arrivals[1:] = stations[1:] != stations[:-1]
+    return [stations[arrivals[:, v], v] for v in range(stations.shape[1])]
+
+
+def stop_table(solution):
+    """
+    One row per vehicle stop (consecutive periods at one station) with the
+    bikes and e-bikes picked up and dropped off there (single solution)
+    """
+    z = solution["z"]
+    T, _, V = z.shape
+    stations = vehicle_stations(z)
+    arrivals = np.ones((T, V), dtype=bool)
+    arrivals[1:] = stations[1:] != stations[:-1]
+
+    # Number the stops vehicle by vehicle: stop ids are (v, t)-ordered
+    order = arrivals.T.ravel()
+    stop_of = np.cumsum(order).reshape(V, T) - 1 # (V, T)
+    num_stops = int(order.sum())
+    table = {
+        "vehicle": np.repeat(np.arange(V), arrivals.sum(axis=0)),
+        "station": stations.T[arrivals.T],
+        "first_period": np.nonzero(arrivals.T)[1],
+        "periods": np.bincount(stop_of.ravel(), minlength=num_stops),
+    }
+    for column, name in MOVES.items():
+        if name in solution:
+            # Moves only happen at the vehicle's station, so the sum over stations is the stop's move
+            handled = solution[name].sum(axis=1).T # (V, T)
+            table[column] = np.bincount(stop_of.ravel(), weights=handled.ravel(), minlength=num_stops).astype(handled.dtype)
+    table = pd.DataFrame(table)
+    table.insert(1, "stop", table.groupby("vehicle").cumcount())
+    return table
+
+
+def handled(solution):
+    """
+    (..., V) total bikes (and e-bikes) each vehicle picks up plus drops off
+    """
+    return sum(solution[name].sum(axis=(-3, -2)) for name in MOVES.values() if name in solution)
+
+
+# -----Stations and demand-----
+def volatility(solution):
+    """
+    (..., S) max minus min of the bikes (classic + e-bike) at each station
+    """
+    bikes = solution["d"] + solution["d_bar"] if "d_bar" in solution else solution["d"]
+    return bikes.max(axis=-1) - bikes.min(axis=-1)
+
+
+def lost_demand(solution, inputs):
+    """
+    (..., S, T) lost demand of each kind present, e.g. lost_demand(...)["ebike_rentals"]
+    """
+    return {
+        name: np.asarray(inputs[demand]) - solution[trips]
+        for name, (trips, demand) in DEMAND.items()
+        if trips in solution and inputs.get(demand) is not None
+    }
+
+
+def by_hour(values, start=0):
+    """
+    (..., S, T) per-period values summed into (..., 24) hours of the day;
+    start is the data period of column 0
+    """
+    T = values.shape[-1]
+    hours = (start + np.arange(T)) % PERIODS_PER_DAY // PERIODS_PER_HOUR
+    hour_of_period = np.zeros((T, PERIODS_PER_DAY // PERIODS_PER_HOUR))
+    hour_of_period[np.arange(T), hours] = 1
+    return values.sum(axis=-2) @ hour_of_period
+
+
+def lost_demand_breakdown(solution, inputs, start=0):
+    """
+    Lost demand of a single solution by station, by hour of day and by bike
+    type, as (by_station, by_hour, by_type) DataFrames
+    """
+    lost = lost_demand(solution, inputs)
+    by_station = pd.DataFrame({name: value.sum(axis=-1) for name, value in lost.items()})
+    by_station.index.name = "station"
+    by_hour_table = pd.DataFrame({name: by_hour(value, start) for name, value in lost.items()})
+    by_hour_table.index.name = "hour"
+    totals = pd.Series({name: value.sum() for name, value in lost.items()})
+    bike_type, direction = zip(*(name.split("_") for name in totals.index))
+    by_type = totals.set_axis(pd.MultiIndex.from_arrays([bike_type, direction])).unstack()
+    return by_station, by_hour_table, by_type
+
+
+# -----Summaries-----
+def summary_kpis(solution, inputs):
+    """
+    Totals of one solution, or (N,) arrays of them for stacked solutions
+
+    unique_stations_visited, moves and handled stay per vehicle (..., V).
+    """
+    kpis = {}
+    for name, (trips, _) in DEMAND.items():
+        if trips in solution:
+            kpis[f"successful_{name}"] = solution[trips].sum(axis=(-2, -1))
+    for name, lost in lost_demand(solution, inputs).items():
+        kpis[f"lost_{name}"] = lost.sum(axis=(-2, -1))
+    kpis["volatility"] = volatility(solution).sum(axis=-1)
+    kpis["unique_stations_visited"] = unique_stations(solution["z"])
+    kpis["moves"] = moves(solution["z"])
+    kpis["handled"] = handled(solution)
+    return kpis
+
+
+def stack(items, names=None):
+    """
+    Stack a list of same-shaped solution (or input) dicts along a new first axis
+    """
+    names = names if names is not None else list(items[0])
+    return {name: np.stack([np.asarray(item[name]) for item in items]) for name in names if name in items[0]}
+
+
+def batch_kpis(solutions, inputs):
+    """
+    One row of summary KPIs per solution, with per-vehicle KPIs summed over vehicles
+
+    Solutions are grouped by shape and every group is evaluated as one
+    stacked array, so thousands of sweep results cost a few numpy calls.
+    """
+    rows = [None] * len(solutions)
+    groups = {}
+    for i, solution in enumerate(solutions):
+        key = tuple(sorted((name, np.shape(value)) for name, value in solution.items()))
+        groups.setdefault(key, []).append(i)
+    demand_names = [demand for _, demand in DEMAND.values()]
+    for indices in groups.values():
+        group_inputs = [{name: inputs[i].get(name) for name in demand_names if inputs[i].get(name) is not None} for i in indices]
+        kpis = summary_kpis(stack([solutions[i] for i in indices]), stack(group_inputs))
+        for j, i in enumerate(indices):
+            rows[i] = {name: value[j].sum() for name, value in kpis.items()}
+    return pd.DataFrame(rows)
@@ -0,0 +1,441 @@
+"""
+Vectorized builders for the baseline and e-bike rebalancing problems
+
+The per-vehicle variables (r_plus, r_minus, r_bar_*, z) are stacked into
+single (S*V, T) variables instead of a dict of (S, V) variables per time
+period. Row s*V + v holds station s and vehicle v, and the sums over
+stations or vehicles become products with sparse aggregation matrices, so
+every constraint block below is one whole-tensor constraint.
+"""
+import cvxpy as cp
+import numpy as np
+import scipy.sparse as sp
+
+from .routing import arc_incidence
+
+# Variables stacked as (S*V, T); everything else is (S, T) or (V, T)
+STACKED_VARIABLES = ("r_plus", "r_minus", "r_bar_plus", "r_bar_minus", "z")
+# Variables (of any builder) whose rows end with the vehicle: row i*V + v
+VEHICLE_ROWS = ("d_hat", "d_tilde", "r_plus", "r_minus", "r_bar_plus", "r_bar_minus", "swap", "batteries", "z", "y")
+
+
+def aggregation_matrices(S, V):
+    """
+    Sparse matrices that sum a stacked (S*V, T) variable over vehicles or stations
+
+    station_sum @ r is (S, T): total over vehicles at each station
+    vehicle_sum @ r is (V, T): total over stations for each vehicle
+    """
+    station_sum = sp.kron(sp.eye(S), np.ones((1, V)), format="csr")
+    vehicle_sum = sp.kron(np.ones((1, S)), sp.eye(V), format="csr")
+    return station_sum, vehicle_sum
+
+
+def identical_vehicles(vehicle_caps, vehicle_1, z_sv_1, S, V):
+    """
+    Consecutive pairs (v, w) of interchangeable vehicles: same capacity and
+    initial load of every bike type and the same starting station (or both
+    free to start anywhere)
+    """
+    starts = np.zeros((S, V)) if z_sv_1 is None else np.asarray(z_sv_1, dtype=float).reshape(S, V)
+    groups = {}
+    for v in range(V):
+        signature = (
+            tuple(float(np.asarray(caps)[v]) for caps in vehicle_caps),
+            tuple(float(np.asarray(initial)[v]) for initial in vehicle_1),
+            tuple(starts[:, v]),
+        )
+        groups.setdefault(signature, []).append(v)
+    return [(v, w) for members in groups.values() for v, w in zip(members, members[1:])]
+
+
+def symmetry_matrix(pairs, S, V):
+    """
+    (pairs, S*V) matrix M with M @ z summed over time <= 0 ordering each
+    pair of identical vehicles by the sum of the station indices they visit
+    """
+    order = sp.lil_matrix((len(pairs), V))
+    for row, (v, w) in enumerate(pairs):
+        order[row, v] = 1
+        order[row, w] = -1
+    return sp.kron(np.arange(S)[None, :], order.tocsr(), format="csr")
+
+
+def symmetry_permutation(z, pairs):
+    """
+    (V,) vehicle order that makes a plan with positions z (S, V, T) meet the
+    symmetry_matrix rows of pairs: vehicle v takes the plan of order[v],
+    so that the vehicles of every chain of pairs are sorted by the sum of
+    the station indices they visit
+    """
+    S, V, _ = np.shape(z)
+    visits = np.arange(S) @ np.sum(z, axis=2)
+    chains = []
+    for v, w in pairs:
+        if chains and chains[-1][-1] == v:
+            chains[-1].append(w)
+        else:
+            chains.append([v, w])
+    order = np.arange(V)
+    for chain in chains:
+        order[chain] = np.array(chain)[np.argsort(visits[chain], kind="stable")]
+    return order
+
+
+def symmetry_order(rows, name, order, V):
+    """
+    Values of a variable in its (rows, T) layout with the vehicles reordered
+    by symmetry_permutation; variables without a vehicle are unchanged
+    """
+    if name not in VEHICLE_ROWS:
+        return rows
+    rows = np.asarray(rows)
+    return rows.reshape(-1, V, rows.shape[-1])[:, order].reshape(rows.shape)
+
+
+def repeat_columns(values, T):
+    """
+    Broadcast a per-row vector (array or cvxpy expression) across T columns
+    """
+    if isinstance(values, cp.Expression):
+        return cp.reshape(values, (values.size, 1), order="C") @ np.ones((1, T))
+    return np.outer(values, np.ones(T))
+
+
+class RebalancingModel:
+    """
+    A built rebalancing problem together with its variables
+    """
+    def __init__(self, problem, variables, S, T, V, pairs=()):
+        self.problem = problem
+        self.objective = problem.objective
+        self.variables = variables
+        self.S = S
+        self.T = T
+        self.V = V
+        self.pairs = list(pairs)
+        self.has_start = False
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def solve(self, **kwargs):
+        kwargs.setdefault("warm_start", self.has_start)
+        return self.problem.solve(**kwargs)
+
+    def set_start(self, solution):
+        """
+        Use solution (arrays shaped as returned by value()) as the solver's
+        starting point; identical vehicles are renumbered to meet the
+        symmetry rows of a strengthened model
+        """
+        order = np.arange(self.V)
+        if self.pairs and solution.get("z") is not None:
+            order = symmetry_permutation(np.asarray(solution["z"]).transpose(1, 2, 0), self.pairs)
+        for name, value in solution.items():
+            if name in STACKED_VARIABLES:
+                value = value.transpose(1, 2, 0).reshape(self.S * self.V, self.T)
+            self.variables[name].value = symmetry_order(value, name, order, self.V)
+        self.has_start = True
+
+    @property
+    def objective_value(self):
+        return self.problem.value
+
+    @property
+    def mip_gap(self):
+        """
+        Relative MIP gap reported by the solver (Gurobi or HiGHS), else None
+        """
+        stats = self.problem.solver_stats
+        extra = getattr(stats, "extra_stats", None) if stats is not None else None
+        for attribute in ("MIPGap", "mip_gap"):
+            try:
+                return float(getattr(extra, attribute))
+            except (AttributeError, TypeError, ValueError):
+                continue
+        return None
+
+    def value(self, name):
+        """
+        Solution value of a variable; stacked variables come back as (T, S, V)
+        so that value("z")[t] matches the old per-period z[t].value
+        """
+        value = self.variables[name].value
+        if value is None:
+            return None
+        if name in STACKED_VARIABLES:
+            return value.reshape(self.S, self.V, self.T).transpose(2, 0, 1)
+        return value
+
+    def solution(self):
+        return {name: self.value(name) for name in self.variables}
+
+
+def _station_flow(d, r_plus, r_minus, x_plus, x_minus, d_s_1, station_sum, loss=None, bounded=False):
+    """
+    Initial condition and inventory balance for bikes at the stations
+    """
+    change = -station_sum @ (r_plus[:, :-1] - r_minus[:, :-1]) - x_plus[:, :-1] + x_minus[:, :-1]
+    if loss is not None:
+        change = change - loss[:, :-1]
+    initial = [] if bounded else [d[:, 0] == d_s_1]
+    return initial + [d[:, 1:] == d[:, :-1] + change]
+
+
+def _vehicle_flow(d_hat, r_plus, r_minus, d_hat_v_1, vehicle_sum, bounded=False):
+    """
+    Initial condition and inventory balance for bikes in the vehicles
+    """
+    initial = [] if bounded else [d_hat[:, 0] == d_hat_v_1]
+    return initial + [d_hat[:, 1:] == d_hat[:, :-1] + vehicle_sum @ (r_plus[:, :-1] - r_minus[:, :-1])]
+
+
+def _vehicle_limits(d_hat, r_plus, r_minus, z, C_v, vehicle_sum, T, bounded=False):
+    """
+    Vehicle load and pickup/drop-off limits; moves only at the vehicle's station
+    """
+    load_cap = repeat_columns(C_v, T)
+    move_cap = repeat_columns(vehicle_sum.T @ C_v, T)
+    if bounded:
+        return [r_plus + r_minus <= cp.multiply(move_cap, z)]
+    return [
+        r_plus + r_minus <= cp.multiply(move_cap, z),
+        d_hat >= 0,
+        d_hat <= load_cap,
+        r_plus >= 0,
+        r_plus <= move_cap,
+        r_minus >= 0,
+        r_minus <= move_cap,
+    ]
+
+
+def _trip_limits(x_plus, x_minus, f_plus, f_minus):
+    return [
+        x_plus >= 0,
+        x_plus <= f_plus,
+        x_minus >= 0,
+        x_minus <= f_minus,
+    ]
+
+
+def _state_bounds(cap, initial, T):
+    """
+    [0, cap] bounds of a station or vehicle inventory, fixed to initial in the first period
+    """
+    low, high = np.zeros((len(initial), T)), repeat_columns(np.asarray(cap, dtype=float), T)
+    low[:, 0] = high[:, 0] = initial
+    return [low, high]
+
+
+def _trip_bounds(f):
+    """
+    [0, f] bounds of served trips; trips of the last period only appear in
+    the objective, so they are fixed to the (integer) demand
+    """
+    high = np.floor(np.asarray(f, dtype=float))
+    low = np.zeros_like(high)
+    low[:, -1] = high[:, -1]
+    return [low, high]
+
+
+def _move_bounds(C_v, S, T):
+    """
+    [0, C_v] bounds of pickups / drop-offs; moves in the last period change
+    no inventory, so they are fixed to zero
+    """
+    high = repeat_columns(np.tile(np.asarray(C_v, dtype=float), S), T)
+    high[:, -1] = 0
+    return [np.zeros_like(high), high]
+
+
+def _symmetry(z, pairs, S, V, T):
+    """
+    Order identical vehicles by the sum of the station indices they visit
+    """
+    if not pairs:
+        return []
+    return [symmetry_matrix(pairs, S, V) @ z @ np.ones(T) <= 0]
+
+
+def _initial_position(z, z_sv_1, S, V):
+    """
+    z_sv_1 (S, V) is 1 where a vehicle starts; z[:, 0] >= z_sv_1 fixes those
+    vehicles and leaves vehicles with an all-zero column free to start anywhere
+    """
+    if z_sv_1 is None:
+        return []
+    return [z[:, 0] >= cp.reshape(z_sv_1, (S * V,), order="C")]
+
+
+def _routes(z, arcs, S, V, T):
+    """
+    (A*V, T-1) arc variable y and the constraints moving every vehicle
+    along one reachable arc per period (see routing.py)
+    """
+    arcs = np.asarray(arcs, dtype=np.int64).reshape(-1, 2)
+    tail_sum, head_sum = arc_incidence(arcs, S, V)
+    y = cp.Variable((len(arcs) * V, T - 1), nonneg=True) # 1 if vehicle v drives arc a after period t
+    return y, [y <= 1, z[:, :-1] == tail_sum @ y, z[:, 1:] == head_sum @ y]
+
+
+def build_baseline_model(
+    f_plus, f_minus, C_s, C_hat_v, d_s_1, d_hat_v_1, z_sv_1=None, arcs=None, strengthen=False,
+):
+    """
+    Baseline rebalancing problem (classic bikes only)
+
+    f_plus, f_minus: (S, T) expected rental / return demand
+    C_s: (S,) station capacity, C_hat_v: (V,) vehicle capacity
+    d_s_1: (S,) initial station inventory, d_hat_v_1: (V,) initial vehicle load
+    z_sv_1: optional (S, V) initial vehicle positions
+    arcs: optional (A, 2) station pairs a vehicle can drive between in one
+    period (see routing.py); adds the (A*V, T-1) arc variable y
+    strengthen: use variable bounds instead of simple constraints, fix
+    variables of the last period and order identical vehicles (needs
+    numeric inputs, not cp.Parameters)
+    """
+    S, T = f_plus.shape
+    V = np.shape(C_hat_v)[0]
+    station_sum, vehicle_sum = aggregation_matrices(S, V)
+    limits = {}
+    if strengthen:
+        limits = {
+            "d": _state_bounds(C_s, d_s_1, T),
+            "d_hat": _state_bounds(C_hat_v, d_hat_v_1, T),
+            "x_plus": _trip_bounds(f_plus),
+            "x_minus": _trip_bounds(f_minus),
+            "r_plus": _move_bounds(C_hat_v, S, T),
+            "r_minus": _move_bounds(C_hat_v, S, T),
+        }
+    bounds = lambda name: {"bounds": limits[name]} if name in limits else {}
+
+    # -----Variables-----
+    d = cp.Variable((S, T), integer=True, **bounds("d")) # Num bikes at station s at time t
+    d_hat = cp.Variable((V, T), integer=True, **bounds("d_hat")) # Num bikes in vehicle v at time t
+    x_plus = cp.Variable((S, T), integer=True, **bounds("x_plus")) # Num of successful bike trips starting at stations s at time t
+    x_minus = cp.Variable((S, T), integer=True, **bounds("x_minus")) # Num of successful returns at stations s at time t
+    r_plus = cp.Variable((S * V, T), integer=True, **bounds("r_plus")) # Num of bikes vehicle v picks up at station s at time t
+    r_minus = cp.Variable((S * V, T), integer=True, **bounds("r_minus")) # Num of bikes vehicle v unloads at station s at time t
+    z = cp.Variable((S * V, T), boolean=True) # 1 if vehicle v is at station s at time t
+
+    # -----Constraints-----
+    constraints = (
+        _vehicle_flow(d_hat, r_plus, r_minus, d_hat_v_1, vehicle_sum, strengthen)
+        + _station_flow(d, r_plus, r_minus, x_plus, x_minus, d_s_1, station_sum, bounded=strengthen)
+        + [vehicle_sum @ z == 1] # each vehicle can only be in one location at a time
+        + _initial_position(z, z_sv_1, S, V)
+        + _vehicle_limits(d_hat, r_plus, r_minus, z, C_hat_v, vehicle_sum, T, strengthen)
+    )
+    pairs = []
+    if strengthen:
+        pairs = identical_vehicles([C_hat_v], [d_hat_v_1], z_sv_1, S, V)
+        constraints += _symmetry(z, pairs, S, V, T)
+    else:
+        constraints += [d >= 0, d <= repeat_columns(C_s, T)] + _trip_limits(x_plus, x_minus, f_plus, f_minus)
+
+    # -----Objective-----
+    objective = cp.Minimize(cp.sum(f_plus - x_plus) + cp.sum(f_minus - x_minus))
+
+    variables = {
+        "d": d, "d_hat": d_hat, "x_plus": x_plus, "x_minus": x_minus,
+        "r_plus": r_plus, "r_minus": r_minus, "z": z,
+    }
+    if arcs is not None:
+        variables["y"], routes = _routes(z, arcs, S, V, T)
+        constraints += routes
+    return RebalancingModel(cp.Problem(objective, constraints), variables, S, T, V, pairs)
+
+
+def build_electric_model(
+    f_plus, f_minus, f_bar_plus, f_bar_minus, C_s, C_hat_v, C_tilde_v,
+    d_s_1, d_bar_s_1, d_hat_v_1, d_tilde_v_1, a_classic=1, a_electric=2, w_s=None, z_sv_1=None, arcs=None,
+    strengthen=False,
+):
+    """
+    Rebalancing problem with classic bikes and e-bikes
+
+    The f_bar_*, d_bar_s_1, d_tilde_v_1 and C_tilde_v inputs are the e-bike
+    counterparts of the classic inputs of build_baseline_model; a_classic and
+    a_electric weight lost classic and e-bike demand, and w_s (S, T) is the
+    number of e-bikes leaving the station inventory as "dead" bikes.
+    z_sv_1 is the optional (S, V) matrix of initial vehicle positions;
+    arcs and strengthen work as in build_baseline_model.
+    """
+    S, T = f_plus.shape
+    V = np.shape(C_hat_v)[0]
+    station_sum, vehicle_sum = aggregation_matrices(S, V)
+    limits = {}
+    if strengthen:
+        limits = {
+            "d": _state_bounds(C_s, d_s_1, T),
+            "d_bar": _state_bounds(C_s, d_bar_s_1, T),
+            "d_hat": _state_bounds(C_hat_v, d_hat_v_1, T),
+            "d_tilde": _state_bounds(C_tilde_v, d_tilde_v_1, T),
+            "x_plus": _trip_bounds(f_plus),
+            "x_minus": _trip_bounds(f_minus),
+            "x_bar_plus": _trip_bounds(f_bar_plus),
+            "x_bar_minus": _trip_bounds(f_bar_minus),
+            "r_plus": _move_bounds(C_hat_v, S, T),
+            "r_minus": _move_bounds(C_hat_v, S, T),
+            "r_bar_plus": _move_bounds(C_tilde_v, S, T),
+            "r_bar_minus": _move_bounds(C_tilde_v, S, T),
+        }
+    bounds = lambda name: {"bounds": limits[name]} if name in limits else {}
+
+    # -----Variables-----
+    d = cp.Variable((S, T), integer=True, **bounds("d")) # Num classic bikes at station s at time t
+    d_bar = cp.Variable((S, T), integer=True, **bounds("d_bar")) # Num e-bikes at s at t
+    d_hat = cp.Variable((V, T), integer=True, **bounds("d_hat")) # Num classic bikes in vehicle v at time t
+    d_tilde = cp.Variable((V, T), integer=True, **bounds("d_tilde")) # Num e-bikes in v at t
+
+    x_plus = cp.Variable((S, T), integer=True, **bounds("x_plus")) # Num of successful classic bike trips starting at stations s at time t
+    x_minus = cp.Variable((S, T), integer=True, **bounds("x_minus")) # Num of successful classic returns at stations s at time t
+    x_bar_plus = cp.Variable((S, T), integer=True, **bounds("x_bar_plus")) # Num of successful e-bike trips starting at stations s at time t
+    x_bar_minus = cp.Variable((S, T), integer=True, **bounds("x_bar_minus")) # Num of successful e-bike returns at stations s at time t
+
+    r_plus = cp.Variable((S * V, T), integer=True, **bounds("r_plus")) # Num of bikes vehicle v picks up at station s at time t
+    r_minus = cp.Variable((S * V, T), integer=True, **bounds("r_minus")) # Num of bikes vehicle v unloads at station s at time t
+    r_bar_plus = cp.Variable((S * V, T), integer=True, **bounds("r_bar_plus")) # Num e-bikes vehicle v picks up at s at t
+    r_bar_minus = cp.Variable((S * V, T), integer=True, **bounds("r_bar_minus")) # Num e-bikes vehicle v drops off at s at t
+    z = cp.Variable((S * V, T), boolean=True) # 1 if vehicle v is at station s at time t
+
+    # -----Constraints-----
+    constraints = (
+        _vehicle_flow(d_hat, r_plus, r_minus, d_hat_v_1, vehicle_sum, strengthen)
+        + _vehicle_flow(d_tilde, r_bar_plus, r_bar_minus, d_tilde_v_1, vehicle_sum, strengthen)
+        + _station_flow(d, r_plus, r_minus, x_plus, x_minus, d_s_1, station_sum, bounded=strengthen)
+        + _station_flow(d_bar, r_bar_plus, r_bar_minus, x_bar_plus, x_bar_minus, d_bar_s_1, station_sum, loss=w_s, bounded=strengthen)
+        + [vehicle_sum @ z == 1] # each vehicle can only be in one location at a time
+        + _initial_position(z, z_sv_1, S, V)
+        + _vehicle_limits(d_hat, r_plus, r_minus, z, C_hat_v, vehicle_sum, T, strengthen)
+        + _vehicle_limits(d_tilde, r_bar_plus, r_bar_minus, z, C_tilde_v, vehicle_sum, T, strengthen)
+        + [d + d_bar <= repeat_columns(C_s, T)]
+    )
+    pairs = []
+    if strengthen:
+        pairs = identical_vehicles([C_hat_v, C_tilde_v], [d_hat_v_1, d_tilde_v_1], z_sv_1, S, V)
+        constraints += _symmetry(z, pairs, S, V, T)
+    else:
+        constraints += (
+            [d >= 0, d_bar >= 0]
+            + _trip_limits(x_plus, x_minus, f_plus, f_minus)
+            + _trip_limits(x_bar_plus, x_bar_minus, f_bar_plus, f_bar_minus)
+        )
+
+    # -----Objective-----
+    objective = cp.Minimize(
+        (cp.sum(f_plus - x_plus) + cp.sum(f_minus - x_minus)) * a_classic
+        + (cp.sum(f_bar_plus - x_bar_plus) + cp.sum(f_bar_minus - x_bar_minus)) * a_electric
+    )
+
+    variables = {
+        "d": d, "d_bar": d_bar, "d_hat": d_hat, "d_tilde": d_tilde,
+        "x_plus": x_plus, "x_minus": x_minus, "x_bar_plus": x_bar_plus, "x_bar_minus": x_bar_minus,
+        "r_plus": r_plus, "r_minus": r_minus, "r_bar_plus": r_bar_plus, "r_bar_minus": r_bar_minus,
+        "z": z,
+    }
+    if arcs is not None:
+        variables["y"], routes = _routes(z, arcs, S, V, T)
+        constraints += routes
+    return RebalancingModel(cp.Problem(objective, constraints), variables, S, T, V, pairs)
@@ -0,0 +1,206 @@
+"""
+Coarse-to-fine time aggregation
+
+At 15-minute resolution a day is T=96, and r_plus, r_minus and z (and
+r_bar_* in the e-bike model) grow as S*T*V. coarse_to_fine first solves
+the model with the demand summed into buckets of `factor` periods (4 is an
+hour, 8 two hours), built from the same per-period demand, where every
+vehicle makes one stop per bucket. It then solves the 15-minute model
+again, guided by the coarse plan:
+
+    mode="fix"    every vehicle stays at its coarse station for the whole
+                  bucket; only the moves and trips are re-optimized
+    mode="bound"  every vehicle is at its coarse station in the first period
+                  of each bucket and free in between, and station inventories
+                  at bucket boundaries stay within `slack` bikes of the coarse
+                  targets (dropped if that makes the fine model infeasible)
+
+compare_resolutions reports the quality loss of each resolution and mode
+against the full 15-minute solve together with the speedup:
+
+    plan, report = coarse_to_fine(build_electric_gurobi, instance, factor=4, mode="bound")
+
+    python -m rebalancing.multiresolution --model electric --periods 96 --factors 4 8 --modes fix bound
+"""
+import argparse
+import time
+
+import numpy as np
+from gurobipy import GRB
+
+from .data import load_baseline_instance, load_electric_instance
+from .gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+from .rolling import PERIOD_INPUTS
+
+# Station inventories guided by the coarse targets in mode="bound"
+INVENTORIES = ("d", "d_bar")
+MODES = ("fix", "bound")
+
+
+def aggregate_instance(instance, factor):
+    """
+    Inputs with every per-period demand summed into buckets of `factor`
+    periods; a shorter last bucket holds the remaining periods
+    """
+    coarse = dict(instance)
+    for name in PERIOD_INPUTS:
+        if instance.get(name) is None:
+            continue
+        values = np.asarray(instance[name], dtype=float)
+        starts = np.arange(0, values.shape[1], factor)
+        coarse[name] = np.add.reduceat(values, starts, axis=1)
+    return coarse
+
+
+def bucket_of(T, factor):
+    """
+    (T,) coarse bucket of every fine period
+    """
+    return np.arange(T) // factor
+
+
+def _solve(model, **solve_kwargs):
+    start = time.perf_counter()
+    model.solve(**solve_kwargs)
+    return time.perf_counter() - start
+
+
+def guided_model(build, instance, coarse, factor, mode, slack=2):
+    """
+    Full-resolution model restricted by a coarse plan (see the module
+    docstring); slack=None leaves the inventories free in mode="bound"
+    """
+    model = build(**instance)
+    T = np.shape(instance["f_plus"])[1]
+    buckets = bucket_of(T, factor)
+    if mode == "fix":
+        model.tighten_bounds("z", coarse["z"][buckets], coarse["z"][buckets])
+        return model
+    first = np.full(T, False)
+    first[::factor] = True
+    z = np.where(first[:, None, None], coarse["z"][buckets], np.nan)
+    model.tighten_bounds("z", z, z)
+    if slack is not None:
+        for name in INVENTORIES:
+            if name in coarse:
+                target = np.where(first, coarse[name][:, buckets], np.nan)
+                model.tighten_bounds(name, target - slack, target + slack)
+    return model
+
+
+def coarse_to_fine(build, instance, factor=4, mode="bound", slack=2, **solve_kwargs):
+    """
+    Solve on buckets of `factor` periods, then at full resolution guided by
+    the coarse plan; build is a gurobipy builder (gurobi_backend.py)
+
+    Returns the fine plan, shaped as model.solution(), and a report with
+    both objectives and the build and solve times.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    report = {"factor": factor, "mode": mode}
+
+    start = time.perf_counter()
+    coarse_model = build(**aggregate_instance(instance, factor))
+    report["coarse_solve_time"] = _solve(coarse_model, **solve_kwargs)
+    if coarse_model.objective_value is None:
+        raise RuntimeError(f"no solution of the coarse model (factor {factor})")
+    coarse = {name: np.rint(value) for name, value in coarse_model.solution().items()}
+    report["coarse_objective"] = coarse_model.objective_value
+
+    model = guided_model(build, instance, coarse, factor, mode, slack)
+    report["fine_solve_time"] = _solve(model, **solve_kwargs)
+    report["relaxed"] = False
+    if mode == "bound" and model.model.Status == GRB.INFEASIBLE:
+        # The coarse targets cannot be met at 15 minutes; keep the vehicle positions only
+        report["relaxed"] = True
+        model = guided_model(build, instance, coarse, factor, mode, slack=None)
+        report["fine_solve_time"] += _solve(model, **solve_kwargs)
+    if model.objective_value is None:
+        raise RuntimeError(f"no solution of the guided fine model (factor {factor}, mode {mode})")
+    report["total_time"] = time.perf_counter() - start
+    report["objective"] = model.objective_value
+    report["mip_gap"] = model.mip_gap
+    return model.solution(), report
+
+
+def weighted_demand(instance):
+    """
+    Total demand weighted as in the objective (every trip lost costs its weight)
+    """
+    total = instance.get("a_classic", 1) * (np.sum(instance["f_plus"]) + np.sum(instance["f_minus"]))
+    if instance.get("f_bar_plus") is not None:
+        total += instance.get("a_electric", 2) * (np.sum(instance["f_bar_plus"]) + np.sum(instance["f_bar_minus"]))
+    return float(total)
+
+
+def compare_resolutions(build, instance, factors=(4, 8), modes=MODES, slack=2, **solve_kwargs):
+    """
+    One row for the full 15-minute solve and one per factor and mode, with
+    the objective difference against the full solve (weighted trips lost
+    on top of it), that difference as a share of the weighted demand, and
+    the speedup
+    """
+    start = time.perf_counter()
+    model = build(**instance)
+    model.solve(**solve_kwargs)
+    full_time = time.perf_counter() - start
+    full = model.objective_value
+    rows = [{
+        "factor": 1, "mode": "full", "objective": full, "mip_gap": model.mip_gap,
+        "total_time": full_time, "difference": None, "loss": None, "speedup": 1.0,
+    }]
+    if full is not None:
+        rows[0].update(difference=0.0, loss=0.0)
+    demand = max(weighted_demand(instance), 1.0)
+    for factor in factors:
+        for mode in modes:
+            _, report = coarse_to_fine(build, instance, factor, mode, slack, **solve_kwargs)
+            report["difference"], report["loss"] = None, None
+            if full is not None and report["objective"] is not None:
+                report["difference"] = report["objective"] - full
+                report["loss"] = report["difference"] / demand
+            report["speedup"] = full_time / report["total_time"]
+            rows.append(report)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["baseline", "electric"], default="electric")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--periods", type=int, default=96)
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--factors", type=int, nargs="+", default=[4, 8], help="periods per coarse bucket")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--slack", type=float, default=2, help="bikes a bucket-boundary inventory may differ from the coarse target")
+    parser.add_argument("--time-limit", type=float, default=300, help="Gurobi time limit per solve")
+    args = parser.parse_args()
+
+    load, build = {
+        "baseline": (load_baseline_instance, build_baseline_gurobi),
+        "electric": (load_electric_instance, build_electric_gurobi),
+    }[args.model]
+    instance = load(S=args.stations, T=args.periods, V=args.vehicles, data_dir=args.data_dir, start=args.start)
+    rows = compare_resolutions(
+        build, instance, args.factors, args.modes, args.slack, OutputFlag=0, TimeLimit=args.time_limit,
+    )
+    print(f"{'minutes':>8}  {'mode':<6}{'objective':>11}{'diff':>9}{'loss':>9}{'time':>9}{'speedup':>9}")
+    for row in rows:
+        mode = row["mode"] + ("*" if row.get("relaxed") else "")
+        objective = f"{row['objective']:>11.2f}" if row["objective"] is not None else f"{'-':>11}"
+        difference = f"{row['difference']:>9.2f}" if row["difference"] is not None else f"{'-':>9}"
+        loss = f"{row['loss']:>9.2%}" if row["loss"] is not None else f"{'-':>9}"
+        print(
+            f"{row['factor'] * 15:>8}  {mode:<6}{objective}{difference}{loss}"
+            f"{row['total_time']:>9.3f}{row['speedup']:>9.2f}"
+        )
+    if any(row.get("relaxed") for row in rows):
+        print("* inventory targets dropped: the guided model was infeasible with them")
+    print("diff: weighted trips lost on top of the full solve; loss: diff as a share of the weighted demand")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Persistent, parameterized rebalancing models for sensitivity sweeps
+
+The sweep inputs (vehicle capacities, ride values, initial inventories and
+the number of active vehicles) are cp.Parameters, so the problem is DPP:
+cvxpy canonicalizes it once on the first solve and later solves only
+refill the parameter values. Each re-solve is warm-started from the
+previous solution.
+
+    instance = load_electric_instance(V=5)
+    model = ParametricModel(build_electric_model, instance)
+    rows = capacity_split_sweep(model, 80, np.linspace(0, 1, 50), solver=cp.GUROBI)
+"""
+import time
+
+import cvxpy as cp
+import numpy as np
+
+# Inputs that become cp.Parameters when present in the instance
+SWEEP_PARAMETERS = (
+    "C_hat_v", "C_tilde_v", "a_classic", "a_electric",
+    "d_s_1", "d_bar_s_1", "d_hat_v_1", "d_tilde_v_1",
+)
+# Inputs with one entry per vehicle; zeroed for inactive vehicles
+VEHICLE_PARAMETERS = ("C_hat_v", "C_tilde_v", "d_hat_v_1", "d_tilde_v_1")
+
+
+class ParametricModel:
+    """
+    A model built once from `build` whose sweep inputs can be updated in place
+
+    The fleet is built with len(C_hat_v) vehicles; set_fleet_size(n) parks
+    the vehicles beyond the first n by giving them zero capacity and load.
+    """
+    def __init__(self, build, instance, parameters=SWEEP_PARAMETERS):
+        self.inputs = dict(instance)
+        self.parameters = {}
+        build_inputs = dict(instance)
+        for name in parameters:
+            if name not in instance:
+                continue
+            value = np.asarray(instance[name], dtype=float)
+            self.parameters[name] = cp.Parameter(value.shape, name=name, value=value)
+            build_inputs[name] = self.parameters[name]
+        self.fleet_size = len(instance["C_hat_v"])
+        self.model = build(**build_inputs)
+        self.problem = self.model.problem
+        self.solve_count = 0
+
+    def __getitem__(self, name):
+        return self.model[name]
+
+    def update(self, **values):
+        """
+        Set new values for any of the parameterized inputs
+        """
+        for name, value in values.items():
+            if name not in self.parameters:
+                raise KeyError(f"{name} is not a parameter of this model")
+            self.inputs[name] = value
+        self._refresh()
+
+    def set_fleet_size(self, fleet_size):
+        if not 0 < fleet_size <= len(self.inputs["C_hat_v"]):
+            raise ValueError(f"fleet size must be between 1 and {len(self.inputs['C_hat_v'])}")
+        self.fleet_size = fleet_size
+        self._refresh()
+
+    def _refresh(self):
+        active = np.arange(len(self.inputs["C_hat_v"])) < self.fleet_size
+        for name, parameter in self.parameters.items():
+            value = np.asarray(self.inputs[name], dtype=float)
+            if name in VEHICLE_PARAMETERS:
+                value = np.where(active, value, 0)
+            parameter.value = value
+
+    def solve(self, **kwargs):
+        """
+        Solve with the current parameter values, warm-started from the last solution
+        """
+        kwargs.setdefault("warm_start", self.solve_count > 0)
+        value = self.model.solve(**kwargs)
+        self.solve_count += 1
+        return value
+
+    @property
+    def objective_value(self):
+        return self.model.objective_value
+
+    def value(self, name):
+        return self.model.value(name)
+
+    def solution(self):
+        return self.model.solution()
+
+
+def capacity_split_sweep(model, truck_space, bike_shares, **solve_kwargs):
+    """
+    Re-solve model for every split of truck_space between bikes and batteries
+
+    bike_shares are the fractions of each vehicle's space given to classic
+    bikes (C_hat_v); the rest goes to e-bikes/batteries (C_tilde_v).
+    Returns one row per split with the objective and solve times.
+    """
+    V = len(model.inputs["C_hat_v"])
+    rows = []
+    for share in bike_shares:
+        C_hat_v = np.full(V, np.round(share * truck_space))
+        model.update(C_hat_v=C_hat_v, C_tilde_v=truck_space - C_hat_v)
+        start = time.perf_counter()
+        model.solve(**solve_kwargs)
+        rows.append({
+            "bike_share": share,
+            "C_hat_v": C_hat_v[0],
+            "C_tilde_v": truck_space - C_hat_v[0],
+            "objective": model.objective_value,
+            "wall_time": time.perf_counter() - start,
+            "compilation_time": model.problem.compilation_time,
+            "status": model.problem.status,
+        })
+    return rows
@@ -0,0 +1,181 @@
+"""
+Solution results as typed arrays with their metadata
+
+Results holds every solution array of a solved model (d, d_bar, d_hat,
+d_tilde, x_*, r_*, z) in the shapes of model.solution(), the demand
+inputs needed to evaluate it, and a metadata dict (configuration,
+objective, MIP gap, timings). It is written to a single compressed .npz
+file, or a Parquet file with one row per array if pyarrow is installed,
+and the KPIs the scripts print in visualize() are computed from it:
+
+    results = Results.from_model(model, instance, config={"S": 30, "T": 96})
+    results.save("electric_results.npz")
+    print(results.summary())
+
+    results = Results.load("electric_results.npz")
+"""
+import json
+import os
+
+import numpy as np
+
+from .kpis import DEMAND, lost_demand, summary_kpis
+
+# Solution arrays whose values are 0/1
+BINARY_VARIABLES = ("z", "y")
+# Inputs kept with the solution: the demand it is evaluated against
+INPUT_NAMES = tuple(demand for _, demand in DEMAND.values()) + ("C_s", "w_s")
+
+
+def _typed(name, value):
+    """
+    Integer solution values as compact integer arrays
+    """
+    value = np.rint(np.asarray(value, dtype=float))
+    return value.astype(np.int8 if name in BINARY_VARIABLES else np.int32)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+class Results:
+    """
+    Solution arrays, the demand inputs and metadata of one solve (or rolling-horizon plan)
+    """
+    def __init__(self, solution, inputs=None, metadata=None):
+        self.solution = {name: _typed(name, value) for name, value in solution.items()}
+        self.inputs = {name: np.asarray(value) for name, value in (inputs or {}).items()}
+        self.metadata = dict(metadata or {})
+
+    @classmethod
+    def from_model(cls, model, instance=None, config=None, timings=None):
+        """
+        Results of a solved RebalancingModel or GurobiRebalancingModel
+
+        instance is the dict of builder inputs; only the demand and capacity
+        inputs are kept. timings are added to the ones the model records
+        itself (cvxpy compile and solve time, gurobipy build and solve time).
+        """
+        if model.objective_value is None:
+            raise ValueError("the model has no solution")
+        timings = dict(timings or {})
+        if hasattr(model, "problem"):
+            timings.setdefault("compile_time", model.problem.compilation_time)
+            timings.setdefault("solve_time", model.problem.solver_stats.solve_time)
+        else:
+            timings.setdefault("build_time", model.build_time)
+            timings.setdefault("solve_time", model.model.Runtime)
+        timings = {name: seconds for name, seconds in timings.items() if seconds is not None}
+        inputs = {name: value for name, value in (instance or {}).items() if name in INPUT_NAMES and value is not None}
+        metadata = {
+            "config": config or {},
+            "objective": float(model.objective_value),
+            "mip_gap": model.mip_gap,
+            "timings": timings,
+            "shape": {"S": model.S, "T": model.T, "V": model.V},
+        }
+        return cls(model.solution(), inputs, metadata)
+
+    def __getitem__(self, name):
+        return self.solution[name]
+
+    def __contains__(self, name):
+        return name in self.solution
+
+    @property
+    def electric(self):
+        return "d_bar" in self.solution
+
+    @property
+    def objective(self):
+        return self.metadata.get("objective")
+
+    @property
+    def mip_gap(self):
+        return self.metadata.get("mip_gap")
+
+    # -----Export-----
+    def save(self, path):
+        """
+        Write to path; .parquet writes a Parquet table, anything else a compressed .npz
+        """
+        if path.endswith(".parquet"):
+            return self._save_parquet(path)
+        arrays = {f"solution/{name}": value for name, value in self.solution.items()}
+        arrays.update({f"input/{name}": value for name, value in self.inputs.items()})
+        arrays["metadata"] = np.array(json.dumps(self.metadata, default=_json_default))
+        np.savez_compressed(path, **arrays)
+
+    def _save_parquet(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = [("solution", name, value) for name, value in self.solution.items()]
+        rows += [("input", name, value) for name, value in self.inputs.items()]
+        table = pa.table({
+            "group": [group for group, _, _ in rows],
+            "name": [name for _, name, _ in rows],
+            "dtype": [str(value.dtype) for _, _, value in rows],
+            "shape": [list(value.shape) for _, _, value in rows],
+            "values": [value.ravel().astype(float).tolist() for _, _, value in rows],
+        })
+        metadata = {b"rebalancing": json.dumps(self.metadata, default=_json_default).encode()}
+        pq.write_table(table.replace_schema_metadata(metadata), path, compression="zstd")
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(".parquet"):
+            return cls._load_parquet(path)
+        if not os.path.exists(path) and os.path.exists(path + ".npz"):
+            path += ".npz"
+        with np.load(path) as archive:
+            solution = {key.split("/", 1)[1]: archive[key] for key in archive.files if key.startswith("solution/")}
+            inputs = {key.split("/", 1)[1]: archive[key] for key in archive.files if key.startswith("input/")}
+            metadata = json.loads(archive["metadata"].item())
+        return cls(solution, inputs, metadata)
+
+    @classmethod
+    def _load_parquet(cls, path):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        groups = {"solution": {}, "input": {}}
+        for row in table.to_pylist():
+            value = np.array(row["values"], dtype=row["dtype"]).reshape(row["shape"])
+            groups[row["group"]][row["name"]] = value
+        metadata = json.loads(table.schema.metadata[b"rebalancing"])
+        return cls(groups["solution"], groups["input"], metadata)
+
+    # -----KPIs-----
+    def lost_demand(self):
+        """
+        (S, T) lost demand of each kind, e.g. lost_demand()["ebike_rentals"]
+        """
+        return lost_demand(self.solution, self.inputs)
+
+    def kpis(self):
+        """
+        The totals printed by visualize() in the scripts; see rebalancing/kpis.py
+        """
+        kpis = {}
+        for name, value in summary_kpis(self.solution, self.inputs).items():
+            kpis[name] = value.tolist() if np.ndim(value) else value.item()
+        return kpis
+
+    def summary(self):
+        """
+        Short text summary: metadata and KPIs, no per-period matrices
+        """
+        lines = [f"Objective value: {self.objective}"]
+        if self.mip_gap is not None:
+            lines.append(f"MIP gap: {self.mip_gap:.4%}")
+        for name, seconds in self.metadata.get("timings", {}).items():
+            lines.append(f"{name}: {seconds:.3f}s")
+        for name, value in self.kpis().items():
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
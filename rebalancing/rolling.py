@@ -0,0 +1,194 @@
+"""
+Rolling-horizon solves over long demand series
+
+Instead of one MIP over the whole horizon, solve a window of W periods,
+commit its first K periods, and start the next window K periods later from
+the committed end state: station inventories (d, d_bar), vehicle loads
+(d_hat, d_tilde) and vehicle positions (z). Each window is warm-started
+with the previous window's plan shifted by K periods, so memory and time
+per step are bounded by the window size, not the horizon.
+
+    instance = load_electric_instance(T=96 * 7)
+    plan, windows = rolling_horizon(build_electric_gurobi, instance, window=16, commit=4, OutputFlag=0)
+
+    python -m rebalancing.rolling --model electric --periods 672 --window 16 --commit 4
+"""
+import argparse
+import contextlib
+import time
+
+import numpy as np
+
+from .data import load_baseline_instance, load_electric_instance
+from .gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+from .model import STACKED_VARIABLES
+from .telemetry import Trace, model_size
+
+# End-of-window state -> initial condition of the next window
+CARRIED_STATE = {"d": "d_s_1", "d_bar": "d_bar_s_1", "d_hat": "d_hat_v_1", "d_tilde": "d_tilde_v_1"}
+# Per-period inputs that are sliced to the window
+PERIOD_INPUTS = ("f_plus", "f_minus", "f_bar_plus", "f_bar_minus", "w_s")
+# Decisions that are set to zero in the idle tail of a shifted start
+FLOWS = ("x_plus", "x_minus", "x_bar_plus", "x_bar_minus", "r_plus", "r_minus", "r_bar_plus", "r_bar_minus")
+# Variables with T-1 columns, one per pair of consecutive periods (routing arcs)
+TRANSITIONS = ("y",)
+
+
+def _time_axis(name):
+    return 0 if name in STACKED_VARIABLES else 1
+
+
+def window_instance(instance, start, length):
+    """
+    Inputs of the window of `length` periods starting at period `start`
+    """
+    window = dict(instance)
+    for name in PERIOD_INPUTS:
+        if name in instance and instance[name] is not None:
+            window[name] = instance[name][:, start:start + length]
+    return window
+
+
+def shifted_start(solution, shift, length):
+    """
+    Previous window's plan moved `shift` periods earlier and padded to `length`
+
+    The padding is an idle plan (no trips, no pickups or drop-offs, vehicles
+    parked, inventories constant), and the last period of the previous
+    window is made idle too because nothing constrained its flows, so the
+    result is a feasible start for the next window. Arc variables are left
+    out (Gurobi completes them from z), and nothing is returned when the
+    shift leaves no period of the previous plan.
+    """
+    start = {}
+    for name, value in solution.items():
+        axis = _time_axis(name)
+        if name in TRANSITIONS:
+            continue
+        if shift >= value.shape[axis]:
+            return {}
+        kept = np.take(value, np.arange(shift, value.shape[axis]), axis=axis)
+        if name in FLOWS:
+            kept = kept.copy()
+            np.moveaxis(kept, axis, 0)[-1] = 0
+        last = np.take(kept, [-1], axis=axis)
+        if name in FLOWS:
+            last = np.zeros_like(last)
+        padding = np.repeat(last, max(0, length - kept.shape[axis]), axis=axis)
+        start[name] = np.take(np.concatenate([kept, padding], axis=axis), np.arange(length), axis=axis)
+    return start
+
+
+@contextlib.contextmanager
+def _untraced(name, **info):
+    yield {}
+
+
+def rolling_horizon(build, instance, window, commit, trace=None, **solve_kwargs):
+    """
+    Solve instance window by window with build (any model builder)
+
+    Returns the committed plan for the whole horizon, in the same shapes as
+    model.solution(), and one row of statistics per window. commit must be
+    shorter than the window: the state after the last period of a window
+    is not constrained by the model, so it cannot start the next one. With a
+    telemetry.Trace, the build, solve and extract phases of every window
+    are recorded in it, tagged with the window's first period.
+    """
+    if not 0 < commit < window:
+        raise ValueError("commit must be between 1 and the window length minus 1")
+    horizon = instance["f_plus"].shape[1]
+    inputs = dict(instance)
+    plan = {}
+    windows = []
+    start_values = None
+    first = 0
+    while first < horizon:
+        length = min(window, horizon - first)
+        # The last window commits everything it solves
+        last = first + length >= horizon
+        committed = length if last else commit
+
+        phase = trace.phase if trace is not None else _untraced
+        build_start = time.perf_counter()
+        with phase("build", first_period=first) as record:
+            model = build(**window_instance(inputs, first, length))
+            if trace is not None:
+                record.update(model_size(model))
+        built = time.perf_counter()
+        if start_values is not None:
+            model.set_start(shifted_start(start_values, commit, length))
+        if trace is not None:
+            trace.solve(model, info={"first_period": first}, **solve_kwargs)
+        else:
+            model.solve(**solve_kwargs)
+        solved = time.perf_counter()
+
+        with phase("extract", first_period=first):
+            solution = model.solution()
+        if model.objective_value is None:
+            raise RuntimeError(f"no solution for the window starting at period {first}")
+        solution = {name: np.round(value) for name, value in solution.items()}
+        for name, value in solution.items():
+            # Committed arcs include the move into the next window's first period, except in the last window
+            periods = committed - 1 if name in TRANSITIONS and last else committed
+            kept = np.take(value, np.arange(periods), axis=_time_axis(name))
+            plan.setdefault(name, []).append(kept)
+        windows.append({
+            "first_period": first, "periods": length, "committed": committed,
+            "objective": model.objective_value, "build_time": built - build_start,
+            "solve_time": solved - built,
+        })
+
+        # Carry the state at the first uncommitted period into the next window
+        if not last:
+            for state, initial in CARRIED_STATE.items():
+                if state in solution:
+                    inputs[initial] = solution[state][:, committed]
+            inputs["z_sv_1"] = solution["z"][committed]
+        start_values = solution
+        first += committed
+
+    plan = {name: np.concatenate(parts, axis=_time_axis(name)) for name, parts in plan.items()}
+    return plan, windows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["baseline", "electric"], default="electric")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--periods", type=int, default=96, help="length of the whole horizon")
+    parser.add_argument("--window", type=int, default=16)
+    parser.add_argument("--commit", type=int, default=4)
+    parser.add_argument("--time-limit", type=float, default=60, help="Gurobi time limit per window")
+    parser.add_argument("--trace", help="write the phase and solver telemetry of every window to this file (.json or .csv)")
+    args = parser.parse_args()
+
+    load, build = {
+        "baseline": (load_baseline_instance, build_baseline_gurobi),
+        "electric": (load_electric_instance, build_electric_gurobi),
+    }[args.model]
+    instance = load(S=args.stations, T=args.periods, V=args.vehicles, data_dir=args.data_dir, start=args.start)
+    trace = Trace(model=args.model, window=args.window, commit=args.commit) if args.trace else None
+    plan, windows = rolling_horizon(
+        build, instance, args.window, args.commit, trace=trace, OutputFlag=0, TimeLimit=args.time_limit,
+    )
+    if trace is not None:
+        trace.save(args.trace)
+    for row in windows:
+        print(
+            f"periods {row['first_period']:>5}-{row['first_period'] + row['periods'] - 1:<5} "
+            f"objective {row['objective']:>9.2f}  build {row['build_time']:.3f}s  solve {row['solve_time']:.3f}s"
+        )
+    lost = np.sum(instance["f_plus"] - plan["x_plus"]) + np.sum(instance["f_minus"] - plan["x_minus"])
+    print(f"Lost classic demand over {args.periods} periods: {lost}")
+    if "x_bar_plus" in plan:
+        lost = np.sum(instance["f_bar_plus"] - plan["x_bar_plus"]) + np.sum(instance["f_bar_minus"] - plan["x_bar_minus"])
+        print(f"Lost e-bike demand over {args.periods} periods: {lost}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Travel-time-aware vehicle routes
+
+Without routing, z lets a vehicle be at any station in the next period.
+With the D_ij distances and the period length L_t, a vehicle can only
+move from i to j between two periods if it can drive there in L_t
+minutes, less the time spent loading and unloading at the stop. The
+builders then get arc variables y for the reachable pairs only, one per
+arc, vehicle and period, tied to the positions by
+
+    z[i, v, t] == sum of y[(i, j), v, t] over the arcs leaving i
+    z[j, v, t + 1] == sum of y[(i, j), v, t] over the arcs entering j
+
+Staying put (i, i) is always an arc. The y can be continuous: with
+binary z every vehicle takes exactly one arc.
+
+reachability() is the sparse (S, S) reachability index. It is computed
+block of rows by block of rows, so it also runs on a memory-mapped
+distances.npy of thousands of stations, and the model grows with the
+number of reachable arcs instead of S^2:
+
+    arcs = reachable_arcs(station_distances(data_dir, S), L_t=15, speed=15, service=10)
+    model = build_electric_gurobi(**instance, arcs=arcs)
+
+    python -m rebalancing.routing --data-dir synthetic --stations 300 --minutes 15 --speed 15 --service 10
+"""
+import argparse
+
+import numpy as np
+import scipy.sparse as sp
+
+from .data import station_distances
+
+L_T = 15 # Minutes per period
+SPEED = 15 # Average driving speed in city traffic, km/h
+SERVICE = 10 # Minutes of every period spent loading and unloading at the station
+BLOCK = 1024 # Rows of the distance matrix read at a time
+
+
+def reach_km(L_t=L_T, speed=SPEED, service=SERVICE):
+    """
+    Distance a vehicle covers in what is left of a period after the stop
+    """
+    return speed * max(L_t - service, 0) / 60
+
+
+def reachability(D_ij, L_t=L_T, speed=SPEED, service=SERVICE, block=BLOCK):
+    """
+    Boolean (S, S) CSR matrix, True where station j can be reached from i
+    within one period (always on the diagonal)
+    """
+    S = D_ij.shape[0]
+    limit = reach_km(L_t, speed, service)
+    rows, cols = [], []
+    for first in range(0, S, block):
+        tails, heads = np.nonzero(np.asarray(D_ij[first:first + block]) <= limit)
+        rows.append(tails + first)
+        cols.append(heads)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    reach = sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(S, S))
+    return reach + sp.eye(S, dtype=bool, format="csr")
+
+
+def arc_list(reach):
+    """
+    (A, 2) array of the (tail, head) station pairs of a reachability
+    matrix, sorted by tail
+    """
+    reach = sp.csr_matrix(reach)
+    reach.sort_indices()
+    tails = np.repeat(np.arange(reach.shape[0]), np.diff(reach.indptr))
+    return np.column_stack([tails, reach.indices]).astype(np.int64)
+
+
+def reachable_arcs(D_ij, L_t=L_T, speed=SPEED, service=SERVICE):
+    return arc_list(reachability(D_ij, L_t, speed, service))
+
+
+def dense_arcs(S):
+    """
+    All S^2 arcs, for comparison with the pruned ones
+    """
+    return arc_list(np.ones((S, S), dtype=bool))
+
+
+def arc_incidence(arcs, S, V):
+    """
+    (S*V, A*V) matrices summing the stacked arc rows a*V + v into the
+    stacked station rows s*V + v of their tail / head
+    """
+    A = len(arcs)
+    ones = np.ones(A)
+    tail = sp.csr_matrix((ones, (arcs[:, 0], np.arange(A))), shape=(S, A))
+    head = sp.csr_matrix((ones, (arcs[:, 1], np.arange(A))), shape=(S, A))
+    return sp.kron(tail, sp.eye(V), format="csr"), sp.kron(head, sp.eye(V), format="csr")
+
+
+def route_lengths(z, D_ij):
+    """
+    Kilometres driven by every vehicle, from z shaped as in
+    model.solution() (T, S, V)
+    """
+    stations = np.argmax(np.asarray(z), axis=1) # (T, V)
+    return np.asarray(D_ij)[stations[:-1], stations[1:]].sum(axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int)
+    parser.add_argument("--minutes", type=float, default=L_T, help="period length L_t")
+    parser.add_argument("--speed", type=float, default=SPEED, help="km/h")
+    parser.add_argument("--service", type=float, default=SERVICE, help="minutes per period spent at the station")
+    args = parser.parse_args()
+
+    D_ij = station_distances(args.data_dir, args.stations)
+    if D_ij is None:
+        parser.error(f"no distance matrix in {args.data_dir}; write one with rebalancing.synthetic --distances")
+    reach = reachability(D_ij, args.minutes, args.speed, args.service)
+    S = reach.shape[0]
+    degree = np.diff(reach.indptr)
+    print(
+        f"{S} stations, {reach.nnz} reachable arcs within {reach_km(args.minutes, args.speed, args.service):.2f} km "
+        f"({reach.nnz / S**2:.1%} of {S**2}); stations reachable per station: "
+        f"min {degree.min()}, mean {degree.mean():.1f}, max {degree.max()}"
+    )
+
+
+if __name__ == "__main__":
+    main()
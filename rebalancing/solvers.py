@@ -0,0 +1,137 @@
+"""
+Solver selection and tuning presets
+
+The cvxpy models can be solved with any MIP solver cvxpy knows, not only
+Gurobi: HiGHS (highspy), SCIP (pyscipopt), CBC (cylp) and SciPy's HiGHS
+build. solver_options translates a time limit, target gap, thread count
+and a named tuning preset into the option names each solver expects, and
+solve() picks the best installed solver when none is given, so the same
+code runs on licensed and unlicensed machines:
+
+    model = build_electric_model(**instance)
+    solve(model, "HIGHS", time_limit=60, mip_gap=0.01, preset="feasibility")
+
+The REBALANCING_SOLVER environment variable overrides the default choice.
+gurobipy models (gurobi_backend.py) always use Gurobi; solve() passes the
+Gurobi options to them directly.
+
+Presets:
+    default      the solver's own defaults
+    feasibility  find good plans early (heuristics, MIP focus on feasibility)
+    optimality   spend effort on the bound (cuts, MIP focus on proving)
+"""
+import os
+
+import cvxpy as cp
+
+# MIP-capable cvxpy solvers, most preferred first
+MIP_SOLVERS = ("GUROBI", "HIGHS", "SCIP", "CBC", "SCIPY")
+SOLVER_ENV = "REBALANCING_SOLVER"
+
+PRESETS = {
+    "GUROBI": {
+        "default": {},
+        "feasibility": {"MIPFocus": 1, "Heuristics": 0.2},
+        "optimality": {"MIPFocus": 2, "Cuts": 2},
+    },
+    "HIGHS": {
+        "default": {},
+        "feasibility": {"mip_heuristic_effort": 0.3},
+        "optimality": {"mip_heuristic_effort": 0.01, "mip_pool_soft_limit": 100},
+    },
+    "SCIP": {
+        "default": {},
+        "feasibility": {"scip_params": {"heuristics/rins/freq": 5, "heuristics/localbranching/freq": 10}},
+        "optimality": {"scip_params": {"separating/maxrounds": -1, "separating/maxroundsroot": -1}},
+    },
+    "CBC": {
+        "default": {},
+        "feasibility": {},
+        "optimality": {"GomoryCuts": True, "MIRCuts": True, "FlowCoverCuts": True},
+    },
+    "SCIPY": {
+        "default": {},
+        "feasibility": {},
+        "optimality": {},
+    },
+}
+
+
+def available_solvers():
+    """
+    Installed MIP solvers in order of preference
+    """
+    installed = set(cp.installed_solvers())
+    return [solver for solver in MIP_SOLVERS if solver in installed]
+
+
+def default_solver():
+    """
+    REBALANCING_SOLVER if set, else the most preferred installed MIP solver
+    """
+    if os.environ.get(SOLVER_ENV):
+        return os.environ[SOLVER_ENV].upper()
+    solvers = available_solvers()
+    if not solvers:
+        raise RuntimeError(f"no MIP solver installed; install one of {', '.join(MIP_SOLVERS)}")
+    return solvers[0]
+
+
+def _merge(options, extra):
+    """
+    Merge solver options, combining the nested scip_params / scipy_options dicts
+    """
+    merged = dict(options)
+    for name, value in extra.items():
+        if isinstance(value, dict) and isinstance(merged.get(name), dict):
+            merged[name] = {**merged[name], **value}
+        else:
+            merged[name] = value
+    return merged
+
+
+def solver_options(solver=None, time_limit=None, mip_gap=None, threads=None, preset="default", **options):
+    """
+    Keyword arguments for problem.solve(): the solver, its preset and the
+    limits under the solver's own option names; options are passed through
+    """
+    solver = (solver or default_solver()).upper()
+    if solver not in PRESETS:
+        raise ValueError(f"unknown solver {solver}; choose one of {', '.join(PRESETS)}")
+    limits = {}
+    if solver == "GUROBI":
+        names = {"time_limit": "TimeLimit", "mip_gap": "MIPGap", "threads": "Threads"}
+    elif solver == "HIGHS":
+        names = {"time_limit": "time_limit", "mip_gap": "mip_rel_gap", "threads": "threads"}
+    elif solver == "CBC":
+        names = {"time_limit": "maximumSeconds", "mip_gap": "allowableFractionGap", "threads": "numberThreads"}
+    elif solver == "SCIP":
+        names = {"time_limit": "limits/time", "mip_gap": "limits/gap", "threads": "parallel/maxnthreads"}
+    else:
+        names = {"time_limit": "time_limit", "mip_gap": "mip_rel_gap"}
+    for name, value in (("time_limit", time_limit), ("mip_gap", mip_gap), ("threads", threads)):
+        if value is not None and name in names:
+            limits[names[name]] = value
+    if solver == "SCIP":
+        limits = {"scip_params": limits} if limits else {}
+    elif solver == "SCIPY":
+        # SciPy only solves MIPs with its HiGHS method, and takes every option in one dict
+        limits = {"scipy_options": {"method": "highs", **limits}}
+    kwargs = _merge(_merge(PRESETS[solver][preset], limits), options)
+    return {"solver": solver, **kwargs}
+
+
+def solve(model, solver=None, time_limit=None, mip_gap=None, threads=None, preset="default", **options):
+    """
+    Solve a model of either backend; returns the objective value
+
+    gurobipy models take the Gurobi options whatever solver is asked for,
+    since they are built for Gurobi.
+    """
+    if not hasattr(model, "problem"):
+        if solver is not None and solver.upper() != "GUROBI":
+            raise ValueError(f"gurobipy models can only be solved with Gurobi, not {solver}")
+        kwargs = solver_options("GUROBI", time_limit, mip_gap, threads, preset, **options)
+        kwargs.pop("solver")
+        return model.solve(**kwargs)
+    return model.solve(**solver_options(solver, time_limit, mip_gap, threads, preset, **options))
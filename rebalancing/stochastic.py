@@ -0,0 +1,340 @@
+"""
+Two-stage stochastic model over the simulated demand days
+
+Both scripts plan against one deterministic demand window. Here the
+vehicle routes z are first-stage decisions, taken before the day is
+known, and the station inventories and served trips x_* are the recourse
+of every sampled day (sample average approximation over the days in the
+demand store, see simulator.day_scenarios). By default the pickups and
+drop-offs r_* are recourse too, as the crew counts the bikes to move at
+the station: a day that has fewer bikes at a station than the others
+cannot make the same pickups, so with first_stage=FIRST_STAGE + the r_*
+names the days may never agree. A small move_cost per bike keeps moves
+that change nothing out of the days' solutions.
+
+The extensive form has one copy of the recourse per day, so it is solved
+by progressive hedging: every day is its own model (the deterministic
+model with that day's demand), solved in parallel threads, and a
+multiplier plus a proximal term on the first-stage variables pull the
+days towards their average x_bar until they agree. The proximal term is
+rho / 2 * (z - z_bar)^2 for the binary z, which is linear, and
+rho * |r - r_bar| for shared integer moves, so every day stays a MILP.
+Vehicle positions every day agrees on for fix_after iterations are
+fixed. The mean of the first solves, made before the move costs are
+added, is the wait-and-see lower bound of the SAA problem.
+
+    rentals, returns = day_scenarios(".", S=30, T=32, start=0, days=range(100))
+    plan, report = progressive_hedging(build_electric_gurobi, instance, rentals, returns, rho=1.0)
+
+The plan is the consensus of the days (each vehicle at the station most
+days put it, the average moves of the days rounded), and compare_deterministic
+scores it and the deterministic plan with the trip replay, on the
+sampled days and on held-out ones:
+
+    python -m rebalancing.stochastic --stations 10 --periods 16 --scenarios 100 --data-dir data
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import gurobipy as gp
+import numpy as np
+from gurobipy import GRB
+
+from .data import load_baseline_instance, load_electric_instance
+from .gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+from .model import STACKED_VARIABLES
+from .simulator import day_scenarios, simulate
+
+# Demand inputs of each bike type: classic, then e-bike
+DEMAND_INPUTS = (("f_plus", "f_minus"), ("f_bar_plus", "f_bar_minus"))
+# Decisions every day has to share: the vehicle routes (add the r_* to also share the moves)
+FIRST_STAGE = ("z",)
+
+
+def scenario_instances(instance, rentals, returns):
+    """
+    One instance per day: instance with the demand replaced by that day's
+    (N, K, S, T) rentals and returns
+    """
+    scenarios = []
+    for day_rentals, day_returns in zip(rentals, returns):
+        scenario = dict(instance)
+        for (plus, minus), f_plus, f_minus in zip(DEMAND_INPUTS, day_rentals, day_returns):
+            scenario[plus] = np.asarray(f_plus, dtype=float)
+            scenario[minus] = np.asarray(f_minus, dtype=float)
+        scenarios.append(scenario)
+    return scenarios
+
+
+class ScenarioModel:
+    """
+    The model of one day, with its own Gurobi environment so that the days
+    can be solved in parallel threads; columns are the first-stage columns
+    (of the variables in first_stage), moves the columns of every r_*
+    """
+    def __init__(self, build, instance, first_stage=FIRST_STAGE, move_cost=0.0):
+        self.env = gp.Env(params={"OutputFlag": 0})
+        self.model = build(**instance, env=self.env)
+        if self.model.reduction is not None:
+            raise ValueError("progressive hedging needs models built without strengthen")
+        layout = self.model.layout
+        columns = lambda names: np.concatenate([
+            np.arange(layout.size)[layout.columns(name)] for name in names if name in layout.blocks
+        ]).astype(int)
+        self.columns = columns(first_stage)
+        self.binary = np.isin(self.columns, columns(["z"]))
+        self.moves = columns([name for name in STACKED_VARIABLES if name != "z"])
+        self.model.model.update()
+        self.c = np.array(self.model.x.Obj)
+        self.constant = self.model.model.ObjCon
+        # Moves that change nothing cost nothing; a small cost keeps the days from disagreeing on them
+        self.move_cost = np.zeros(len(self.c))
+        self.move_cost[self.moves] = move_cost
+        self.distance = None
+
+    def price_moves(self):
+        """
+        Add the move costs to the objective (the model is built without them)
+        """
+        self.model.model.setMObjective(None, self.c + self.move_cost, self.constant, sense=GRB.MINIMIZE)
+
+    def _add_distance(self):
+        """
+        distance >= |r - r_bar| for the integer first-stage columns, with
+        r_bar in the right-hand sides
+        """
+        grb, x = self.model.model, self.model.x
+        moves = x[self.columns[~self.binary]]
+        self.distance = grb.addMVar(moves.shape, lb=0)
+        self.above = grb.addConstr(self.distance - moves >= 0)
+        self.below = grb.addConstr(self.distance + moves >= 0)
+
+    def penalize(self, w, x_bar, rho):
+        """
+        Objective plus w @ x1 and the proximal term to x_bar over the
+        first-stage columns x1
+        """
+        c = self.c + self.move_cost
+        c[self.columns] += w
+        # (z - z_bar)^2 == z * (1 - 2 * z_bar) + z_bar^2 for binary z
+        c[self.columns[self.binary]] += rho / 2 * (1 - 2 * x_bar[self.binary])
+        objective = c @ self.model.x + self.constant + rho / 2 * np.sum(x_bar[self.binary] ** 2)
+        integer = ~self.binary
+        if integer.any():
+            if self.distance is None:
+                self._add_distance()
+            self.above.RHS = -x_bar[integer]
+            self.below.RHS = x_bar[integer]
+            objective = objective + np.full(integer.sum(), rho) @ self.distance
+        self.model.model.setObjective(objective, GRB.MINIMIZE)
+
+    def fix(self, positions, values):
+        """
+        Fix first-stage columns (positions into x1) to values
+        """
+        lb, ub = self.model.x.LB, self.model.x.UB
+        lb[self.columns[positions]] = ub[self.columns[positions]] = values
+        self.model.x.LB = lb
+        self.model.x.UB = ub
+
+    def solve(self, solve_kwargs):
+        start = time.perf_counter()
+        self.model.solve(**solve_kwargs)
+        if self.model.objective_value is None:
+            raise RuntimeError("no solution of a scenario subproblem")
+        x = self.model.x.X
+        return {
+            "first_stage": x[self.columns],
+            "moves": x[self.moves],
+            "objective": self.c @ x + self.constant, # without move costs and hedging terms
+            "bound": self.model.model.ObjBound,
+            "time": time.perf_counter() - start,
+        }
+
+    def close(self):
+        self.model.model.dispose()
+        self.env.dispose()
+
+
+def consensus_plan(model, x_bar, moves):
+    """
+    z and r_* of the average first stage x_bar and the (N, move columns)
+    moves of the days: every vehicle at the station with the largest
+    average z, and there the average moves of the days, rounded
+    """
+    values = np.zeros(model.model.layout.size)
+    values[model.columns] = x_bar
+    values[model.moves] = moves.mean(axis=0)
+    average = model.model.decode(values)
+    z = np.zeros_like(average["z"])
+    T, _, V = z.shape
+    stations = np.argmax(average["z"], axis=1) # (T, V)
+    z[np.arange(T)[:, None], stations, np.arange(V)[None, :]] = 1
+    plan = {"z": z}
+    for name in STACKED_VARIABLES:
+        if name != "z" and name in average:
+            plan[name] = np.round(average[name]) * z
+    return plan
+
+
+def _solve_all(pool, models, solve_kwargs):
+    return list(pool.map(lambda model: model.solve(solve_kwargs), models))
+
+
+def progressive_hedging(
+    build, instance, rentals, returns, first_stage=FIRST_STAGE, rho=1.0, move_cost=0.01, max_iterations=30,
+    tol=1e-3, fix_after=3, workers=None, **solve_kwargs
+):
+    """
+    Progressive hedging over the days of rentals / returns (equally likely);
+    returns the consensus plan and a report with the wait-and-see bound and
+    every iteration's mean deviation from x_bar, number of undecided vehicle
+    positions and mean day objective
+
+    build is a gurobipy builder (build_baseline_gurobi / build_electric_gurobi);
+    solve_kwargs are Gurobi parameters of every subproblem solve (Threads
+    defaults to 1, as the days are solved in parallel).
+    """
+    start = time.perf_counter()
+    solve_kwargs = {"Threads": 1, **solve_kwargs}
+    models = [ScenarioModel(build, scenario, first_stage, move_cost) for scenario in scenario_instances(instance, rentals, returns)]
+    build_time = time.perf_counter() - start
+    binary = models[0].binary
+    fixed = np.zeros(len(binary), dtype=bool)
+    agreed = np.zeros(len(binary), dtype=int)
+    iterations = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Bound pass on the day models alone; move costs would lift it above the SAA optimum
+            results = _solve_all(pool, models, solve_kwargs)
+            wait_and_see = np.mean([result["bound"] for result in results])
+            if move_cost:
+                for model in models:
+                    model.price_moves()
+                results = _solve_all(pool, models, solve_kwargs)
+            for iteration in range(max_iterations + 1):
+                x = np.array([result["first_stage"] for result in results]) # (N, first-stage columns)
+                x_bar = x.mean(axis=0)
+                deviation = np.abs(x - x_bar).sum(axis=1).mean()
+                unanimous = binary & (x.min(axis=0) == x.max(axis=0))
+                agreed = np.where(unanimous, agreed + 1, 0)
+                iterations.append({
+                    "deviation": deviation,
+                    "undecided": int(np.sum(binary & ~unanimous)),
+                    "objective": np.mean([result["objective"] for result in results]),
+                    "time": max(result["time"] for result in results),
+                })
+                if deviation <= tol or iteration == max_iterations:
+                    break
+                if iteration == 0:
+                    w = rho * (x - x_bar)
+                else:
+                    w += rho * (x - x_bar)
+                # Vehicle positions all days agreed on for fix_after iterations are fixed
+                newly = (agreed >= fix_after) & ~fixed
+                if fix_after and newly.any():
+                    for model in models:
+                        model.fix(np.flatnonzero(newly), x_bar[newly])
+                    fixed |= newly
+                for model, w_day in zip(models, w):
+                    model.penalize(w_day, x_bar, rho)
+                results = _solve_all(pool, models, solve_kwargs)
+        plan = consensus_plan(models[0], x_bar, np.array([result["moves"] for result in results]))
+    finally:
+        for model in models:
+            model.close()
+    report = {
+        "scenarios": len(models),
+        "wait_and_see_bound": wait_and_see,
+        "iterations": iterations,
+        "converged": iterations[-1]["deviation"] <= tol,
+        "fixed_positions": int(fixed.sum()),
+        "build_time": build_time,
+        "total_time": time.perf_counter() - start,
+    }
+    return plan, report
+
+
+def compare_deterministic(
+    build, instance, data_dir=".", start=0, scenarios=100, seed=0, electric=True, first_stage=FIRST_STAGE,
+    rho=1.0, move_cost=0.01, max_iterations=30, fix_after=3, workers=None, **solve_kwargs
+):
+    """
+    Progressive hedging on a random draw of scenarios days versus the
+    deterministic model of instance, both scored with the trip replay on
+    the drawn days and on all other days
+    """
+    S, T = np.shape(instance["f_plus"])
+    rentals, returns = day_scenarios(data_dir, S, T, start, electric)
+    days = np.random.default_rng(seed).permutation(len(rentals))
+    sampled, held_out = days[:scenarios], days[scenarios:]
+    plan, report = progressive_hedging(
+        build, instance, rentals[sampled], returns[sampled], first_stage=first_stage, rho=rho,
+        move_cost=move_cost, max_iterations=max_iterations, fix_after=fix_after, workers=workers, **solve_kwargs
+    )
+
+    began = time.perf_counter()
+    model = build(**instance)
+    model.solve(**solve_kwargs)
+    report["deterministic_time"] = time.perf_counter() - began
+    plans = {"stochastic": plan, "deterministic": model.solution(), "none": None}
+    for name, candidate in plans.items():
+        for sample, sample_days in (("in_sample", sampled), ("out_of_sample", held_out)):
+            if len(sample_days):
+                scores = simulate(candidate, instance, rentals[sample_days], returns[sample_days])
+                report[f"{name}_{sample}"] = scores["objective"].mean()
+    return plan, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["baseline", "electric"], default="electric")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int, default=10)
+    parser.add_argument("--periods", type=int, default=16)
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--scenarios", type=int, default=100, help="days drawn from the demand store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rho", type=float, default=1.0)
+    parser.add_argument("--move-cost", type=float, default=0.01, help="cost per bike moved in the day models")
+    parser.add_argument("--hedge-moves", action="store_true", help="make the moves first-stage decisions too")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--fix-after", type=int, default=3, help="0 to never fix agreed vehicle positions")
+    parser.add_argument("--workers", type=int, help="parallel subproblem solves (default: threads of the pool)")
+    parser.add_argument("--time-limit", type=float, default=60, help="Gurobi time limit per subproblem solve")
+    args = parser.parse_args()
+
+    load, build = {
+        "baseline": (load_baseline_instance, build_baseline_gurobi),
+        "electric": (load_electric_instance, build_electric_gurobi),
+    }[args.model]
+    instance = load(S=args.stations, T=args.periods, V=args.vehicles, data_dir=args.data_dir, start=args.start)
+    _, report = compare_deterministic(
+        build, instance, data_dir=args.data_dir, start=args.start, scenarios=args.scenarios, seed=args.seed,
+        electric=args.model == "electric", rho=args.rho, move_cost=args.move_cost,
+        first_stage=FIRST_STAGE + (STACKED_VARIABLES[:4] if args.hedge_moves else ()),
+        max_iterations=args.iterations, fix_after=args.fix_after, workers=args.workers, OutputFlag=0, TimeLimit=args.time_limit,
+    )
+    for iteration, row in enumerate(report["iterations"]):
+        print(
+            f"{iteration:>3}  deviation {row['deviation']:8.2f}  undecided positions {row['undecided']:>5}  "
+            f"mean day objective {row['objective']:7.2f}  slowest day {row['time']:.2f}s"
+        )
+    print(
+        f"{report['scenarios']} scenarios, {'converged' if report['converged'] else 'not converged'}, "
+        f"{report['fixed_positions']} positions fixed, {report['total_time']:.1f}s; "
+        f"wait-and-see bound {report['wait_and_see_bound']:.2f}"
+    )
+    print(f"{'mean replayed objective':<24}{'sampled days':>14}{'other days':>12}")
+    for name in ("stochastic", "deterministic", "none"):
+        held_out = report.get(f"{name}_out_of_sample")
+        print(
+            f"{name:<24}{report[f'{name}_in_sample']:>14.2f}"
+            f"{'-' if held_out is None else f'{held_out:.2f}':>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Streaming trip aggregation into the demand store
+
+input_data.ipynb (and ingest.py) hold every trip of every day in memory
+before counting. StreamingAggregator instead keeps running (kind, bike
+type, station, period) counts in the uint16 demand store on disk and folds
+trips in one file, or one fixed-size chunk, at a time, so memory is
+bounded by the largest chunk and never by the whole trip log. Row s of the
+store is station id s; the store starts with the usual 500 days and its
+station and period axes grow as new stations and days show up.
+
+Days are tracked in the store header, so a new day of simu data is added
+without touching the other days, and re-adding a day replaces its counts
+instead of doubling them:
+
+    python -m rebalancing.streaming --input "ORIE-5213-Spring2023/Bike sharing/Dataset" --store .
+    python -m rebalancing.streaming --file simu0_500.json --store .
+
+The bike type draw is the per-day one of ingest.assign_bike_types, so with
+the same seed the counts are those of compiling the CSVs written by
+ingest.py, over the same store_periods() columns (rows are station ids
+here, and only the stations with trips there). demand_matrix reads a store
+built this way in place of the CSVs.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .demand_store import BIKE_TYPES, HEADER_FILENAME, KINDS, PERIODS_PER_DAY, STORE_FILENAME, DemandStore, store_periods
+from .ingest import assign_bike_types, read_trip_file, trip_files, trip_periods
+
+TRIP_COLUMNS = ["departure_minute", "departure_station", "arrival_minute", "arrival_station"]
+
+
+class StreamingAggregator:
+    """
+    Running trip counts in a writable, memory-mapped demand store
+    """
+    def __init__(self, store_dir=".", seed=0, electric_share=0.4):
+        self.store_dir = store_dir
+        self.seed = seed
+        self.electric_share = electric_share
+        header_path = os.path.join(store_dir, HEADER_FILENAME)
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                self.header = json.load(f)
+            if self.header.get("origin") != "trips":
+                raise ValueError(f"{store_dir} holds a store compiled from CSVs, not from trips")
+            if (self.header["seed"], self.header["electric_share"]) != (seed, electric_share):
+                raise ValueError("seed and electric_share must match the ones the store was built with")
+            self.demand = np.load(os.path.join(store_dir, STORE_FILENAME), mmap_mode="r+")
+        else:
+            self.header = {
+                "origin": "trips",
+                "kinds": list(KINDS),
+                "bike_types": list(BIKE_TYPES),
+                "seed": seed,
+                "electric_share": electric_share,
+                "days": [],
+                "sources": {},
+                "trip_files": {},
+            }
+            self.demand = None
+            # Same period range as a compiled store; longer logs grow it
+            self._resize(0, store_periods())
+
+    @property
+    def days(self):
+        return set(self.header["days"])
+
+    def _resize(self, stations, periods):
+        """
+        Grow the store to at least (stations, periods), keeping its counts
+        """
+        old = self.demand
+        if old is not None and stations <= old.shape[2] and periods <= old.shape[3]:
+            return
+        if old is not None:
+            stations, periods = max(stations, old.shape[2]), max(periods, old.shape[3])
+        shape = (len(KINDS), len(BIKE_TYPES), stations, periods)
+        path = os.path.join(self.store_dir, STORE_FILENAME)
+        resized = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=np.uint16, shape=shape)
+        if old is not None:
+            resized[:, :, :old.shape[2], :old.shape[3]] = old
+            del old
+        resized.flush()
+        del resized
+        os.replace(path + ".tmp", path)
+        self.demand = np.load(path, mmap_mode="r+")
+        self._write_header()
+
+    def _write_header(self):
+        self.header["shape"] = list(self.demand.shape)
+        self.header["station_ids"] = list(range(self.demand.shape[2]))
+        path = os.path.join(self.store_dir, HEADER_FILENAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.header, f)
+        os.replace(path + ".tmp", path)
+
+    def _count(self, trips, days, generators=None):
+        """
+        Add an (n, 4) block of trips, with the day of each trip, to the counts
+        """
+        if len(trips) == 0:
+            return
+        bike_types = assign_bike_types(days, self.seed, self.electric_share, generators)
+        departure, arrival = trip_periods(trips)
+        offset = days.astype(np.int64) * PERIODS_PER_DAY + 1
+        self._resize(int(max(trips[:, 1].max(), trips[:, 3].max())) + 1, store_periods(int(days.max()) + 1))
+        for k, (stations, periods) in enumerate(((trips[:, 1], departure), (trips[:, 3], arrival))):
+            # Count on flat keys first so np.add.at only sees one entry per cell
+            key = (bike_types.astype(np.int64) * self.demand.shape[2] + stations) * self.demand.shape[3] + offset + periods
+            keys, counts = np.unique(key, return_counts=True)
+            bike, rest = np.divmod(keys, self.demand.shape[2] * self.demand.shape[3])
+            station, period = np.divmod(rest, self.demand.shape[3])
+            np.add.at(self.demand[k], (bike, station, period), counts.astype(np.uint16))
+
+    def _clear(self, day):
+        first = day * PERIODS_PER_DAY + 1
+        self.demand[:, :, :, first:first + PERIODS_PER_DAY] = 0
+
+    def add_day(self, trips, day, source=None):
+        """
+        Set the counts of one day from its (n, 4) trips, replacing any earlier ones
+        """
+        if day in self.days:
+            self._clear(day)
+        self._count(trips, np.full(len(trips), day, dtype=np.int32))
+        self.header["days"] = sorted(self.days | {day})
+        if source is not None:
+            self.header["trip_files"][os.path.basename(source)] = day
+        self.flush()
+
+    def add_day_file(self, day, path):
+        """
+        Add one simu<k>_<day>.json file
+        """
+        self.add_day(read_trip_file(path), day, source=path)
+
+    def add_folder(self, folder, replace=False):
+        """
+        Add every simu file in folder whose day is not in the store yet
+        (or all of them with replace=True); returns the days added
+        """
+        added = []
+        for day, path in trip_files(folder):
+            if replace or day not in self.days:
+                self.add_day_file(day, path)
+                added.append(day)
+        return added
+
+    def add_trip_log(self, path, chunksize=1_000_000):
+        """
+        Add a CSV trip log with a day column and the four trip columns,
+        read chunksize rows at a time
+
+        Days already in the store are replaced by the log's trips. A day
+        may span several chunks, so each day is only cleared the first time
+        it shows up, and keeps drawing bike types from the same per-day
+        generator across chunks.
+        """
+        seen = set()
+        generators = {}
+        for chunk in pd.read_csv(path, usecols=["day"] + TRIP_COLUMNS, chunksize=chunksize):
+            days = chunk["day"].to_numpy(dtype=np.int32)
+            for day in set(np.unique(days).tolist()) - seen:
+                if day in self.days:
+                    self._clear(day)
+                seen.add(day)
+            self._count(chunk[TRIP_COLUMNS].to_numpy(dtype=np.int32), days, generators)
+        self.header["days"] = sorted(self.days | seen)
+        self.flush()
+        return sorted(seen)
+
+    def flush(self):
+        self.demand.flush()
+        self._write_header()
+
+    def store(self):
+        """
+        Read-only DemandStore over the current counts
+        """
+        self.flush()
+        return DemandStore(self.store_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="folder with simu*.json files; only new days are added")
+    source.add_argument("--file", help="a single simu<k>_<day>.json file")
+    source.add_argument("--trip-log", help="CSV with day, departure/arrival minute and station columns")
+    parser.add_argument("--store", default=".", help="folder of the demand store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--electric-share", type=float, default=0.4)
+    parser.add_argument("--replace", action="store_true", help="with --input, also re-add days already stored")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    aggregator = StreamingAggregator(args.store, args.seed, args.electric_share)
+    if args.input:
+        days = aggregator.add_folder(args.input, args.replace)
+    elif args.file:
+        day = int(os.path.basename(args.file).split("_")[1].split(".")[0])
+        aggregator.add_day_file(day, args.file)
+        days = [day]
+    else:
+        days = aggregator.add_trip_log(args.trip_log, args.chunksize)
+    print(f"Added {len(days)} days in {time.perf_counter() - start:.1f}s; store shape {aggregator.demand.shape}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Parallel scenario sweeps over the e-bike rebalancing model
+
+Every configuration is a dict of overrides on load_electric_instance:
+
+    ebike_share   share of demand and initial inventory that is e-bikes
+                  (default: the split in the CSVs and electric_bike_problem.py)
+    V             number of vehicles
+    bike_share    share of each vehicle's truck_space used for classic bikes
+                  (C_hat_v); the rest holds e-bikes/batteries (C_tilde_v)
+    truck_space   total space per vehicle (default 80)
+    T, S, start   horizon, number of stations and first period
+    time_limit, mip_gap
+                  solver limits for the run
+    solver, preset
+                  cvxpy solver and tuning preset (see solvers.py); without
+                  a solver the run uses Gurobi through gurobi_backend.py
+
+Runs are fanned out over a process pool; each worker gets its own Gurobi
+thread budget so workers * threads does not exceed the machine. One KPI
+row per run is appended to a CSV as soon as it finishes, keyed by a hash
+of the configuration, so an interrupted sweep picks up where it stopped.
+With --cache-dir, solutions are also kept in a SolutionCache (cache.py)
+shared by the workers, so configurations that end up with the same inputs
+(and later sweeps) are solved once:
+
+    python -m rebalancing.sweep --out sweep.csv --ebike-share 0.2 0.4 \\
+        --vehicles 1 2 3 --bike-share 0.25 0.5 0.75 --periods 30 96 --workers 4
+"""
+import argparse
+import csv
+import functools
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from gurobipy import GRB
+
+from .cache import DEFAULT_MAX_GAP, SolutionCache
+from .data import load_electric_instance
+from .gurobi_backend import build_electric_gurobi
+from .kpis import summary_kpis
+from .model import build_electric_model
+from .results import Results
+from .solvers import solver_options
+from .telemetry import Trace, model_size
+
+KPI_COLUMNS = [
+    "objective", "lost_classic_rentals", "lost_classic_returns", "lost_ebike_rentals",
+    "lost_ebike_returns", "volatility", "unique_stations_visited", "build_time",
+    "solve_time", "mip_gap", "status",
+]
+DEFAULTS = {"S": 30, "T": 30, "V": 1, "start": 0, "truck_space": 80}
+STATUS_NAMES = {getattr(GRB.Status, name): name.lower() for name in dir(GRB.Status) if name.isupper()}
+
+
+def config_id(config):
+    """
+    Stable key of a configuration, independent of key order
+    """
+    canonical = json.dumps(config, sort_keys=True, default=float)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+
+def sweep_grid(**axes):
+    """
+    All combinations of the given axes, e.g. sweep_grid(V=[1, 2], bike_share=[0.25, 0.5])
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+@functools.lru_cache(maxsize=8)
+def _base_instance(data_dir, S, T, V, start):
+    return load_electric_instance(S=S, T=T, V=V, data_dir=data_dir, start=start)
+
+
+def scenario_instance(config, data_dir="."):
+    """
+    Inputs of build_electric_model for one sweep configuration
+    """
+    config = {**DEFAULTS, **config}
+    instance = dict(_base_instance(data_dir, config["S"], config["T"], config["V"], config["start"]))
+    if config.get("ebike_share") is not None:
+        share = config["ebike_share"]
+        rentals = instance["f_plus"] + instance["f_bar_plus"]
+        returns = instance["f_minus"] + instance["f_bar_minus"]
+        bikes = instance["d_s_1"] + instance["d_bar_s_1"]
+        instance.update(
+            f_plus=(1 - share) * rentals, f_bar_plus=share * rentals,
+            f_minus=(1 - share) * returns, f_bar_minus=share * returns,
+            d_bar_s_1=np.round(share * bikes), d_s_1=bikes - np.round(share * bikes),
+        )
+    if config.get("bike_share") is not None:
+        C_hat_v = np.full(config["V"], np.round(config["bike_share"] * config["truck_space"]))
+        instance.update(C_hat_v=C_hat_v, C_tilde_v=config["truck_space"] - C_hat_v)
+    return instance
+
+
+def solution_kpis(solution, instance):
+    """
+    Lost demand, volatility and vehicle KPIs of one solved e-bike model
+    """
+    kpis = summary_kpis(solution, instance)
+    row = {name: kpis[name] for name in KPI_COLUMNS if name in kpis}
+    row["unique_stations_visited"] = kpis["unique_stations_visited"].sum()
+    return row
+
+
+def run_config(config, data_dir=".", threads=1, trace_dir=None, cache_dir=None):
+    """
+    Build and solve one configuration; returns its KPI row
+
+    With trace_dir, the phases and solver progress of the run are written
+    to <trace_dir>/<run_id>.json (see telemetry.py). With cache_dir, a
+    cached solution of the same inputs with at most the configuration's
+    mip_gap is used instead of solving (status "cached").
+    """
+    row = {"run_id": config_id(config), "config": json.dumps(config, sort_keys=True, default=float)}
+    trace = Trace(run_id=row["run_id"], **config)
+    with trace.phase("load"):
+        instance = scenario_instance(config, data_dir)
+    cache = SolutionCache(cache_dir) if cache_dir is not None else None
+    if cache is not None:
+        with trace.phase("cache") as lookup:
+            cached = cache.get(instance, config.get("mip_gap") or DEFAULT_MAX_GAP)
+        if cached is not None:
+            row.update(build_time=0.0, solve_time=lookup["wall_time"], status="cached")
+            row.update(objective=cached.objective, mip_gap=cached.mip_gap)
+            row.update(solution_kpis(cached.solution, instance))
+            if trace_dir is not None:
+                trace.save(os.path.join(trace_dir, f"{row['run_id']}.json"))
+            return row
+    # Gurobi runs use the direct backend; any other solver goes through cvxpy
+    solver = config.get("solver")
+    direct = solver is None or solver.upper() == "GUROBI"
+    with trace.phase("build") as build:
+        model = build_electric_gurobi(**instance) if direct else build_electric_model(**instance)
+        build.update(model_size(model))
+    if direct:
+        params = {"OutputFlag": 0, "Threads": threads}
+        if config.get("time_limit") is not None:
+            params["TimeLimit"] = config["time_limit"]
+        if config.get("mip_gap") is not None:
+            params["MIPGap"] = config["mip_gap"]
+    else:
+        params = solver_options(solver, config.get("time_limit"), config.get("mip_gap"), threads, config.get("preset", "default"))
+    start = time.perf_counter()
+    trace.solve(model, **params)
+    row.update(build_time=build["wall_time"], solve_time=time.perf_counter() - start)
+    row["status"] = STATUS_NAMES.get(model.model.Status, model.model.Status) if direct else model.problem.status
+    if model.objective_value is not None:
+        row.update(objective=model.objective_value, mip_gap=model.mip_gap)
+        with trace.phase("extract"):
+            row.update(solution_kpis(model.solution(), instance))
+        if cache is not None:
+            cache.put(instance, Results.from_model(model, instance, config))
+    if trace_dir is not None:
+        trace.save(os.path.join(trace_dir, f"{row['run_id']}.json"))
+    return row
+
+
+def _run_safely(config, data_dir, threads, trace_dir=None, cache_dir=None):
+    try:
+        return run_config(config, data_dir, threads, trace_dir, cache_dir)
+    except Exception as error:
+        return {"run_id": config_id(config), "config": json.dumps(config, sort_keys=True, default=float),
+                "status": f"error: {error}"}
+
+
+def completed_runs(path):
+    """
+    run_ids already solved in a results CSV (errors are retried)
+    """
+    if not os.path.exists(path):
+        return set()
+    done = pd.read_csv(path, usecols=["run_id", "status"], dtype=str)
+    return set(done.loc[~done["status"].str.startswith("error"), "run_id"])
+
+
+def run_sweep(
+    configs, out="sweep.csv", data_dir=".", workers=None, threads=None, resume=True, trace_dir=None, cache_dir=None,
+):
+    """
+    Solve every configuration over a process pool, streaming KPI rows to out
+
+    threads is the Gurobi thread budget of each worker; by default the CPUs
+    are split evenly between the workers. With trace_dir, every run also
+    writes its telemetry trace there; with cache_dir, solutions are shared
+    through a SolutionCache. Returns the full results table.
+    """
+    if trace_dir is not None:
+        os.makedirs(trace_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    threads = threads or max(1, os.cpu_count() // workers)
+    done = completed_runs(out) if resume else set()
+    pending = [config for config in configs if config_id(config) not in done]
+    print(f"{len(configs) - len(pending)} of {len(configs)} runs already done; {workers} workers x {threads} threads")
+
+    write_header = not (resume and os.path.exists(out))
+    with open(out, "a" if resume else "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["run_id", "config"] + KPI_COLUMNS)
+        if write_header:
+            writer.writeheader()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_safely, config, data_dir, threads, trace_dir, cache_dir) for config in pending]
+            for i, future in enumerate(as_completed(futures), 1):
+                writer.writerow(future.result())
+                f.flush()
+                print(f"[{i}/{len(pending)}] {future.result()['status']}")
+    return results_table(out)
+
+
+def results_table(path):
+    """
+    Results CSV with the configuration expanded into columns
+    """
+    results = pd.read_csv(path)
+    configs = pd.DataFrame([json.loads(config) for config in results["config"]], index=results.index)
+    return pd.concat([configs, results.drop(columns="config")], axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="sweep.csv")
+    parser.add_argument("--parquet", help="also write the consolidated table to this Parquet file")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--ebike-share", type=float, nargs="+", default=[None])
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[1])
+    parser.add_argument("--bike-share", type=float, nargs="+", default=[None])
+    parser.add_argument("--truck-space", type=float, default=80)
+    parser.add_argument("--periods", type=int, nargs="+", default=[30])
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--time-limit", type=float)
+    parser.add_argument("--mip-gap", type=float)
+    parser.add_argument("--solver", help="e.g. HIGHS or SCIP for workers without a Gurobi license")
+    parser.add_argument("--preset", default="default", help="solver tuning preset (see solvers.py)")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--threads", type=int, help="Gurobi threads per worker")
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument("--trace-dir", help="write a telemetry trace per run to this folder")
+    parser.add_argument("--cache-dir", help="reuse and store solutions in this solution cache folder")
+    args = parser.parse_args()
+
+    configs = sweep_grid(
+        ebike_share=args.ebike_share, V=args.vehicles, bike_share=args.bike_share, T=args.periods,
+    )
+    for config in configs:
+        config.update(S=args.stations, truck_space=args.truck_space, time_limit=args.time_limit, mip_gap=args.mip_gap)
+        if args.solver:
+            config.update(solver=args.solver.upper(), preset=args.preset)
+    results = run_sweep(
+        configs, args.out, args.data_dir, args.workers, args.threads, resume=not args.no_resume, trace_dir=args.trace_dir,
+        cache_dir=args.cache_dir,
+    )
+    if args.parquet:
+        results.to_parquet(args.parquet)
+
+
+if __name__ == "__main__":
+    main()
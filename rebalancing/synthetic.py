@@ -0,0 +1,177 @@
+"""
+Synthetic large-network instances
+
+The data has 30 stations. generate_network writes a larger, made-up
+network in the formats the loaders read, so load_baseline_instance /
+load_electric_instance (and everything built on them) run unchanged on
+hundreds or thousands of stations:
+
+  - Capacities.json: station capacities in the C_s pattern, the first
+    sixth of the stations are 40-dock hubs, the others have 20 docks
+  - Initial_Inven.json: initial bikes, 20-80% of each station's capacity
+  - demand_store.npy / .json: classic and electric rentals and returns per
+    15-minute period, as a demand store (see demand_store.py)
+  - distances.npy (optional): (S, S) float32 road distances in km
+
+Demand is Poisson with a per-station base rate and a daily profile: hubs
+see the evening peak in rentals and the morning peak in returns (people
+riding in to work), the other stations the reverse; weekends are flatter
+and quieter. A share of the trips (40% by default) is electric.
+
+Every day is drawn from its own generator, seeded with (seed, day), and
+written straight into the memory-mapped store, so memory stays at one day
+of demand and the output does not depend on how the days are chunked:
+
+    python -m rebalancing.synthetic --out synthetic --stations 2000 --days 500 --distances
+
+    instance = load_electric_instance(S=2000, T=96, V=5, data_dir="synthetic")
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from .data import CAPACITY_FILENAME, DISTANCE_FILENAME, INVENTORY_FILENAME
+from .demand_store import BIKE_TYPES, HEADER_FILENAME, KINDS, NUM_DAYS, PERIODS_PER_DAY, STORE_FILENAME, store_periods
+
+HUB_CAPACITY = 40
+CAPACITY = 20
+# Trips start in the same 15-minute period in the data, so the mean
+# per-period count of an average station is about what the simu files give
+MEAN_RATE = 0.5
+AREA_KM = 2.0 # side of the square holding sqrt(1000) stations
+DETOUR = 1.3 # road distance over straight-line distance
+DISTANCE_BLOCK = 1024
+DAYS_PER_BLOCK = 25
+
+
+def daily_profile(peak, weekend=False):
+    """
+    (96,) relative demand of each period of a day, with mean 1: a peak at
+    8:00 (peak="morning") or 17:30 (peak="evening") over a daytime base
+    """
+    hours = (np.arange(PERIODS_PER_DAY) + 0.5) / (PERIODS_PER_DAY / 24)
+    bump = lambda center, width: np.exp(-0.5 * ((hours - center) / width) ** 2)
+    if weekend:
+        profile = 0.1 + bump(14, 3.5)
+    else:
+        main, other = (8, 17.5) if peak == "morning" else (17.5, 8)
+        profile = 0.1 + 0.5 * bump(13, 3) + 1.5 * bump(main, 1) + 0.5 * bump(other, 1)
+    return profile / profile.mean()
+
+
+def station_layout(S, seed=0):
+    """
+    Capacities, hub flags, base rates and (x, y) km coordinates of S stations
+    """
+    rng = np.random.default_rng([seed, S, 1])
+    hub = np.arange(S) < S // 6 # the C_s pattern: 5 hubs out of 30
+    capacities = np.where(hub, HUB_CAPACITY, CAPACITY)
+    # Demand scales with the docks, with a heavy tail of busy stations
+    rates = rng.lognormal(-0.125, 0.5, S) * capacities / capacities.mean() * MEAN_RATE
+    side = AREA_KM * np.sqrt(S / 1000)
+    coordinates = rng.uniform(0, side, (S, 2))
+    # Hubs sit downtown, near the center
+    coordinates[hub] = side / 2 + rng.normal(0, side / 10, (hub.sum(), 2))
+    return capacities, hub, rates, coordinates
+
+
+def initial_inventories(capacities, seed=0):
+    rng = np.random.default_rng([seed, len(capacities), 2])
+    return np.round(capacities * rng.uniform(0.2, 0.8, len(capacities)))
+
+
+def day_demand(day, rates, hub, seed=0, electric_share=0.4):
+    """
+    (kind, bike type, S, 96) demand of one day
+    """
+    rng = np.random.default_rng([seed, day])
+    weekend = day % 7 >= 5
+    scale = 0.7 if weekend else 1.0
+    # Rentals peak in the evening at hubs and in the morning elsewhere; returns the reverse
+    evening = daily_profile("evening", weekend)
+    morning = daily_profile("morning", weekend)
+    rentals = np.where(hub[:, None], evening, morning) * rates[:, None] * scale
+    returns = np.where(hub[:, None], morning, evening) * rates[:, None] * scale
+    demand = np.empty((len(KINDS), len(BIKE_TYPES), len(rates), PERIODS_PER_DAY), dtype=np.uint16)
+    for k, mean in enumerate((rentals, returns)):
+        trips = rng.poisson(mean)
+        electric = rng.binomial(trips, electric_share)
+        demand[k, 0] = trips - electric
+        demand[k, 1] = electric
+    return demand
+
+
+def write_distances(path, coordinates, block=DISTANCE_BLOCK):
+    """
+    (S, S) float32 road distances in km, written block of rows by block of rows
+    """
+    S = len(coordinates)
+    distances = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(S, S))
+    for first in range(0, S, block):
+        rows = coordinates[first:first + block]
+        distances[first:first + block] = DETOUR * np.hypot(*(rows[:, None, :] - coordinates[None, :, :]).transpose(2, 0, 1))
+    distances.flush()
+
+
+def generate_network(out_dir, stations=300, days=NUM_DAYS, seed=0, electric_share=0.4, distances=False):
+    """
+    Write a synthetic network of `stations` stations and `days` days to out_dir
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    capacities, hub, rates, coordinates = station_layout(stations, seed)
+    with open(os.path.join(out_dir, CAPACITY_FILENAME), "w") as f:
+        json.dump(capacities.astype(float).tolist(), f)
+    with open(os.path.join(out_dir, INVENTORY_FILENAME), "w") as f:
+        json.dump(initial_inventories(capacities, seed).tolist(), f)
+    if distances:
+        write_distances(os.path.join(out_dir, DISTANCE_FILENAME), coordinates)
+
+    # Column p holds time_period p, over the columns of a compiled store
+    periods = store_periods(days)
+    shape = (len(KINDS), len(BIKE_TYPES), stations, periods)
+    path = os.path.join(out_dir, STORE_FILENAME)
+    np.lib.format.open_memmap(path, mode="w+", dtype=np.uint16, shape=shape).flush()
+    for block in range(0, days, DAYS_PER_BLOCK):
+        # Map the file again for every block so written pages leave the process
+        demand = np.load(path, mmap_mode="r+")
+        for day in range(block, min(block + DAYS_PER_BLOCK, days)):
+            first = day * PERIODS_PER_DAY + 1
+            demand[..., first:first + PERIODS_PER_DAY] = day_demand(day, rates, hub, seed, electric_share)
+        demand.flush()
+        del demand
+
+    header = {
+        "origin": "synthetic",
+        "shape": list(shape),
+        "kinds": list(KINDS),
+        "bike_types": list(BIKE_TYPES),
+        "station_ids": list(range(stations)),
+        "seed": seed,
+        "electric_share": electric_share,
+        "days": list(range(days)),
+        "sources": {},
+    }
+    with open(os.path.join(out_dir, HEADER_FILENAME), "w") as f:
+        json.dump(header, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="synthetic", help="folder to write the network to")
+    parser.add_argument("--stations", type=int, default=300)
+    parser.add_argument("--days", type=int, default=NUM_DAYS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--electric-share", type=float, default=0.4)
+    parser.add_argument("--distances", action="store_true", help="also write the station distance matrix")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate_network(args.out, args.stations, args.days, args.seed, args.electric_share, args.distances)
+    print(f"Wrote {args.stations} stations x {args.days} days to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Phase timings and solver telemetry
+
+A Trace records every phase of a run (load, build, canonicalize, solve,
+extract) with its wall and CPU time, resident memory before and after and
+the model size, plus the solver's progress while it runs: the incumbent,
+the best bound and the node count over time, from a Gurobi callback for
+gurobipy models. A trace is written as JSON, or as CSV with one row per
+phase or progress record, and traces of many runs (sweep configurations,
+rolling-horizon windows) are combined into one table by tag:
+
+    trace = Trace(model="electric", T=96)
+    with trace.phase("load"):
+        instance = load_electric_instance(T=96)
+    with trace.phase("build") as phase:
+        model = build_electric_gurobi(**instance)
+        phase.update(model_size(model))
+    trace.solve(model, TimeLimit=60)
+    with trace.phase("extract"):
+        solution = model.solution()
+    trace.save("trace.json")
+
+    python -m rebalancing.telemetry --model electric --periods 96 --out trace.json
+    python -m rebalancing.telemetry --summarize traces/*.json
+
+cvxpy models are canonicalized (problem.get_problem_data) and solved from
+the canonical data as two separate phases; cvxpy does not pass callbacks
+to the solver, so their progress is only the final incumbent and bound.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import resource
+import sys
+import time
+
+import pandas as pd
+from gurobipy import GRB
+
+from .data import load_baseline_instance, load_electric_instance
+from .gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+from .model import build_baseline_model, build_electric_model
+
+PHASES = ("load", "build", "canonicalize", "solve", "extract")
+PROGRESS_INTERVAL = 1.0 # seconds between periodic progress records
+
+
+def rss_mb():
+    """
+    Current resident set size in MB (the peak where /proc is not available)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def model_size(model):
+    """
+    Variables, constraints and nonzeros of a built model (either backend)
+    """
+    if hasattr(model, "problem"):
+        metrics = model.problem.size_metrics
+        return {
+            "variables": metrics.num_scalar_variables,
+            "constraints": metrics.num_scalar_eq_constr + metrics.num_scalar_leq_constr,
+            "nonzeros": metrics.num_scalar_data,
+        }
+    model.model.update()
+    return {
+        "variables": model.model.NumVars,
+        "integer_variables": model.model.NumIntVars,
+        "constraints": model.model.NumConstrs,
+        "nonzeros": model.model.NumNZs,
+    }
+
+
+class Trace:
+    """
+    Phase records and solver progress of one run, tagged with its configuration
+    """
+    def __init__(self, **tags):
+        self.tags = tags
+        self.phases = []
+        self.progress = []
+
+    @contextlib.contextmanager
+    def phase(self, name, **info):
+        """
+        Time the enclosed block; the yielded dict can be filled with more fields
+        """
+        record = {"phase": name, **info}
+        rss = rss_mb()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            wall, cpu, after = time.perf_counter() - wall, time.process_time() - cpu, rss_mb()
+            record.update(
+                wall_time=wall,
+                cpu_time=cpu,
+                rss_mb=after,
+                rss_delta_mb=after - rss,
+                peak_rss_mb=peak_rss_mb(),
+            )
+            self.phases.append(record)
+
+    def gurobi_callback(self, interval=PROGRESS_INTERVAL, **info):
+        """
+        Callback for Model.optimize recording every new incumbent and, at most
+        every `interval` seconds, the incumbent, bound and node count
+        """
+        last = [-interval]
+
+        def callback(gurobi_model, where):
+            if where == GRB.Callback.MIPSOL:
+                self.progress.append({
+                    "event": "incumbent", **info,
+                    "time": gurobi_model.cbGet(GRB.Callback.RUNTIME),
+                    "incumbent": gurobi_model.cbGet(GRB.Callback.MIPSOL_OBJ),
+                    "bound": _finite(gurobi_model.cbGet(GRB.Callback.MIPSOL_OBJBND)),
+                    "nodes": gurobi_model.cbGet(GRB.Callback.MIPSOL_NODCNT),
+                })
+            elif where == GRB.Callback.MIP:
+                runtime = gurobi_model.cbGet(GRB.Callback.RUNTIME)
+                if runtime - last[0] < interval:
+                    return
+                last[0] = runtime
+                self.progress.append({
+                    "event": "progress", **info,
+                    "time": runtime,
+                    "incumbent": _finite(gurobi_model.cbGet(GRB.Callback.MIP_OBJBST)),
+                    "bound": _finite(gurobi_model.cbGet(GRB.Callback.MIP_OBJBND)),
+                    "nodes": gurobi_model.cbGet(GRB.Callback.MIP_NODCNT),
+                })
+
+        return callback
+
+    def solve(self, model, interval=PROGRESS_INTERVAL, info=None, **params):
+        """
+        Solve a model of either backend as traced phases; params are Gurobi
+        parameters (gurobipy) or cvxpy solve() arguments (cvxpy)
+        """
+        info = info or {}
+        if hasattr(model, "problem"):
+            return self._solve_cvxpy(model, info, **params)
+        for name, value in params.items():
+            model.model.setParam(name, value)
+        with self.phase("solve", **info) as record:
+            model.model.optimize(self.gurobi_callback(interval, **info))
+        record.update(solver_time=model.model.Runtime, status=model.model.Status)
+        if model.model.IsMIP:
+            record["nodes"] = model.model.NodeCount
+        self._final(model, record, info)
+        return model.objective_value
+
+    def _solve_cvxpy(self, model, info, solver=None, verbose=False, **solver_opts):
+        problem = model.problem
+        warm_start = solver_opts.pop("warm_start", model.has_start)
+        with self.phase("canonicalize", **info):
+            data, chain, inverse_data = problem.get_problem_data(solver)
+        with self.phase("solve", **info) as record:
+            raw = chain.solve_via_data(problem, data, warm_start, verbose, solver_opts)
+            problem.unpack_results(raw, chain, inverse_data)
+        record.update(solver=chain.solver.name(), solver_time=problem.solver_stats.solve_time, status=problem.status)
+        self._final(model, record, info)
+        return model.objective_value
+
+    def _final(self, model, record, info):
+        record.update(objective=model.objective_value, mip_gap=model.mip_gap)
+        if model.objective_value is not None:
+            self.progress.append({
+                "event": "final", **info, "time": record.get("solver_time"),
+                "incumbent": model.objective_value, "bound": _bound(model),
+                "nodes": record.get("nodes"),
+            })
+
+    def totals(self):
+        """
+        Wall time per phase, summed over repeated phases (e.g. windows)
+        """
+        totals = {}
+        for record in self.phases:
+            totals[record["phase"]] = totals.get(record["phase"], 0.0) + record["wall_time"]
+        return totals
+
+    def to_dict(self):
+        return {"tags": self.tags, "phases": self.phases, "progress": self.progress}
+
+    def rows(self):
+        """
+        Flat records, tags first: one per phase ("record": "phase") and one
+        per progress point ("record": "progress")
+        """
+        return (
+            [{**self.tags, "record": "phase", **record} for record in self.phases]
+            + [{**self.tags, "record": "progress", **record} for record in self.progress]
+        )
+
+    def save(self, path):
+        """
+        Write the trace as JSON, or as CSV if path ends in .csv
+        """
+        if path.endswith(".csv"):
+            rows = self.rows()
+            columns = list(dict.fromkeys(name for row in rows for name in row))
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=1, default=_json_default)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        trace = cls(**data["tags"])
+        trace.phases = data["phases"]
+        trace.progress = data["progress"]
+        return trace
+
+
+def _finite(value):
+    """
+    None for Gurobi's +-1e100 placeholders (no incumbent or bound yet)
+    """
+    return value if abs(value) < GRB.INFINITY else None
+
+
+def _bound(model):
+    if hasattr(model, "problem"):
+        gap = model.mip_gap
+        value = model.objective_value
+        return None if gap is None else value - gap * abs(value)
+    return model.model.ObjBound if model.model.IsMIP else model.objective_value
+
+
+def _json_default(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def combine(traces, record="phase"):
+    """
+    One table of the phase (or "progress") records of many traces, with
+    their tags as columns, e.g. for all runs of a sweep
+    """
+    return pd.DataFrame([row for trace in traces for row in trace.rows() if row["record"] == record])
+
+
+def phase_summary(traces):
+    """
+    Wall time, CPU time and memory growth of each phase over many traces
+    """
+    phases = combine(traces)
+    summary = phases.groupby("phase")[["wall_time", "cpu_time", "rss_delta_mb"]].agg(["sum", "mean", "max"])
+    order = [name for name in PHASES if name in summary.index] + [name for name in summary.index if name not in PHASES]
+    return summary.loc[order]
+
+
+def traced_run(load, build, load_kwargs=None, solve_kwargs=None, trace=None):
+    """
+    Load, build, solve and extract one model as traced phases;
+    returns (model, solution, trace)
+    """
+    trace = trace if trace is not None else Trace(**(load_kwargs or {}))
+    with trace.phase("load"):
+        instance = load(**(load_kwargs or {}))
+    with trace.phase("build") as record:
+        model = build(**instance)
+        record.update(model_size(model))
+    trace.solve(model, **(solve_kwargs or {}))
+    with trace.phase("extract"):
+        solution = model.solution() if model.objective_value is not None else None
+    return model, solution, trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["baseline", "electric"], default="electric")
+    parser.add_argument("--backend", choices=["gurobipy", "cvxpy"], default="gurobipy")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--stations", type=int, default=30)
+    parser.add_argument("--periods", type=int, default=30)
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--out", default="trace.json", help="trace file (.json or .csv)")
+    parser.add_argument("--summarize", nargs="+", metavar="TRACE", help="print the phase summary of saved JSON traces instead")
+    args = parser.parse_args()
+
+    if args.summarize:
+        print(phase_summary([Trace.load(path) for path in args.summarize]).to_string())
+        return
+
+    load = {"baseline": load_baseline_instance, "electric": load_electric_instance}[args.model]
+    build = {
+        ("baseline", "gurobipy"): build_baseline_gurobi, ("electric", "gurobipy"): build_electric_gurobi,
+        ("baseline", "cvxpy"): build_baseline_model, ("electric", "cvxpy"): build_electric_model,
+    }[args.model, args.backend]
+    if args.backend == "gurobipy":
+        solve_kwargs = {"OutputFlag": 0, "TimeLimit": args.time_limit}
+    else:
+        solve_kwargs = {"solver": "GUROBI", "TimeLimit": args.time_limit}
+    load_kwargs = {"S": args.stations, "T": args.periods, "V": args.vehicles, "data_dir": args.data_dir, "start": args.start}
+    trace = Trace(model=args.model, backend=args.backend, S=args.stations, T=args.periods, V=args.vehicles)
+    traced_run(load, build, load_kwargs, solve_kwargs, trace)
+    for record in trace.phases:
+        print(
+            f"{record['phase']:<13}wall {record['wall_time']:>8.3f}s  cpu {record['cpu_time']:>8.3f}s  "
+            f"rss {record['rss_mb']:>7.1f} MB ({record['rss_delta_mb']:+.1f})"
+        )
+    print(f"{len(trace.progress)} progress records")
+    trace.save(args.out)
+
+
+if __name__ == "__main__":
+    main()
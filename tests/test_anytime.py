@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from rebalancing.anytime import solve_anytime, start_is_feasible
+from rebalancing.data import random_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi
+from rebalancing.heuristic import greedy_plan, plan_objective
+
+
+@pytest.mark.parametrize("strengthen", [False, True])
+def test_incumbents_score_their_objective(strengthen):
+    for seed in range(5):
+        instance = random_instance(6, 8, 3, seed=seed)
+        model = build_baseline_gurobi(**instance, strengthen=strengthen)
+        result = solve_anytime(model, instance)
+        for incumbent in result.incumbents:
+            assert plan_objective(incumbent.solution, instance) == pytest.approx(incumbent.objective)
+        assert plan_objective(result.solution, instance) == pytest.approx(result.objective)
+
+
+def test_start_is_checked_against_the_rows():
+    instance = random_instance(6, 8, 3)
+    model = build_baseline_gurobi(**instance, strengthen=True)
+    plan = greedy_plan(**instance)
+    model.set_start(plan)
+    assert start_is_feasible(model)
+    model.set_start({**plan, "z": np.zeros_like(plan["z"])})
+    assert not start_is_feasible(model)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from rebalancing.data import random_instance
+from rebalancing.decomposition import decompose
+from rebalancing.gurobi_backend import build_baseline_gurobi
+
+
+def two_sided_instance(seed):
+    """
+    Stations 0-3 fill up and stations 4-7 run empty, ten times farther apart
+    than the stations of one side
+    """
+    instance = random_instance(8, 8, 2, seed=seed, rate=1.0)
+    rng = np.random.default_rng(seed)
+    instance["f_minus"][:4] += rng.poisson(2, (4, 8))
+    instance["f_plus"][4:] += rng.poisson(2, (4, 8))
+    instance["d_s_1"] = np.where(np.arange(8) < 4, 14, 3)
+    position = np.arange(8) // 4 * 10.0 + np.arange(8) % 4
+    return instance, np.abs(position[:, None] - position[None, :])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_plan_is_feasible_for_the_monolithic_model(seed):
+    instance, distances = two_sided_instance(seed)
+    plan, report = decompose(
+        build_baseline_gurobi, instance, zones=2, distances=distances, workers=1, OutputFlag=0,
+    )
+    assert report["delivered_transfers"][0] > 0
+    _, _, gateway = report["gateways"][0]
+    assert plan["z"][:, gateway].any()
+
+    model = build_baseline_gurobi(**instance)
+    for name in ("x_plus", "x_minus", "r_plus", "r_minus", "z"):
+        model.tighten_bounds(name, plan[name], plan[name])
+    model.solve(OutputFlag=0)
+    assert model.objective_value == pytest.approx(report["objective"])
+    assert report["bound_gap"] is None
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from rebalancing.demand_store import BIKE_TYPES, KINDS, STORE_FILENAME, compile_demand_store, store_periods
+from rebalancing.streaming import StreamingAggregator
+from rebalancing.synthetic import generate_network
+
+
+def test_compiled_and_streamed_stores_keep_the_last_period(tmp_path):
+    # One classic trip from station 0 to station 1 in the last period of day 499
+    for kind, station in zip(KINDS, (0, 1)):
+        pd.DataFrame({
+            "station_id": [station], kind: [1], "bike_type": [BIKE_TYPES[0]], "time_period": [store_periods() - 1],
+        }).to_csv(tmp_path / f"{kind}.csv", index=False)
+    compile_demand_store(str(tmp_path))
+    compiled = np.load(tmp_path / STORE_FILENAME)
+
+    streamed_dir = tmp_path / "streamed"
+    streamed_dir.mkdir()
+    aggregator = StreamingAggregator(str(streamed_dir), electric_share=0)
+    aggregator.add_day(np.array([[1439, 0, 1439, 1]]), 499)
+    streamed = np.load(streamed_dir / STORE_FILENAME)
+
+    assert compiled.shape == streamed.shape == (2, 2, 2, store_periods())
+    assert np.array_equal(compiled, streamed)
+    assert compiled[0, 0, 0, -1] == compiled[1, 0, 1, -1] == 1
+
+
+def test_synthetic_store_has_the_compiled_period_count(tmp_path):
+    generate_network(str(tmp_path), stations=3, days=2)
+    assert np.load(tmp_path / STORE_FILENAME, mmap_mode="r").shape == (2, 2, 3, store_periods())
@@ -0,0 +1,18 @@
+import pytest
+
+from rebalancing.data import random_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi
+from rebalancing.heuristic import greedy_plan, plan_objective
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_greedy_start_is_feasible_for_the_strengthened_model(seed):
+    instance = random_instance(6, 8, 3, seed=seed)
+    plan = greedy_plan(**instance)
+    model = build_baseline_gurobi(**instance, strengthen=True)
+    model.set_start(plan)
+    # Fix every column to the start, with the vehicles renumbered by set_start
+    model.model.update()
+    model.x.LB = model.x.UB = model.x.Start
+    model.solve(OutputFlag=0)
+    assert model.objective_value == pytest.approx(plan_objective(plan, instance))
@@ -0,0 +1,13 @@
+import numpy as np
+
+from rebalancing.ingest import count_trips, demand_tables
+
+
+def test_no_trips_count_no_rows():
+    empty = np.zeros(0, dtype=np.int64)
+    counts = count_trips(empty, empty, empty, empty, "departure_time")
+    assert len(counts) == 0
+    assert list(counts.columns) == ["station_id", "departure_time", "day", "bike_type", "counts", "time_period"]
+
+    rentals, returns = demand_tables(np.zeros((0, 4), dtype=np.int64), empty, empty)
+    assert len(rentals) == len(returns) == 0
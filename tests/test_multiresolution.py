@@ -0,0 +1,32 @@
+import numpy as np
+
+from rebalancing import multiresolution
+from rebalancing.data import random_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi
+from rebalancing.multiresolution import compare_resolutions, weighted_demand
+
+
+def test_weighted_demand():
+    instance = {"f_plus": np.ones((2, 3)), "f_minus": np.ones((2, 3)), "f_bar_plus": np.ones((2, 3)),
+                "f_bar_minus": np.zeros((2, 3)), "a_electric": 3}
+    assert weighted_demand(instance) == 12 + 18
+
+
+def test_loss_is_a_share_of_the_demand():
+    instance = random_instance(5, 8, 1, rate=2.0)
+    rows = compare_resolutions(build_baseline_gurobi, instance, factors=(4,), OutputFlag=0)
+    demand = weighted_demand(instance)
+    for row in rows:
+        assert np.isclose(row["difference"], row["objective"] - rows[0]["objective"])
+        assert np.isclose(row["loss"], row["difference"] / demand)
+        assert 0 <= row["loss"] <= 1
+
+
+def test_rows_without_a_solution_print_a_dash(monkeypatch, capsys):
+    row = {"factor": 1, "mode": "full", "objective": None, "difference": None, "loss": None,
+           "total_time": 1.0, "speedup": 1.0}
+    monkeypatch.setattr(multiresolution, "load_baseline_instance", lambda **kwargs: {})
+    monkeypatch.setattr(multiresolution, "compare_resolutions", lambda *args, **kwargs: [row])
+    monkeypatch.setattr("sys.argv", ["multiresolution", "--model", "baseline"])
+    multiresolution.main()
+    assert capsys.readouterr().out.splitlines()[1].split()[2:5] == ["-", "-", "-"]
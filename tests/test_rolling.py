@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from rebalancing.data import random_electric_instance
+from rebalancing.gurobi_backend import build_electric_gurobi
+from rebalancing.rolling import rolling_horizon, shifted_start
+from rebalancing.routing import dense_arcs
+
+
+def test_commit_must_be_shorter_than_window():
+    instance = random_electric_instance(4, 12, 1)
+    with pytest.raises(ValueError):
+        rolling_horizon(build_electric_gurobi, instance, 4, 4, OutputFlag=0)
+
+
+def test_shift_past_the_plan_gives_no_start():
+    assert shifted_start({"d": np.zeros((3, 4))}, 4, 4) == {}
+
+
+def test_plan_covers_the_horizon():
+    instance = random_electric_instance(4, 12, 1)
+    plan, windows = rolling_horizon(build_electric_gurobi, instance, 6, 3, OutputFlag=0)
+    assert plan["d"].shape == (4, 12)
+    assert plan["z"].shape == (12, 4, 1)
+    assert sum(row["committed"] for row in windows) == 12
+
+
+def test_arcs_follow_the_committed_positions():
+    instance = {**random_electric_instance(5, 9, 1), "arcs": dense_arcs(5)}
+    plan, _ = rolling_horizon(build_electric_gurobi, instance, 6, 3, OutputFlag=0)
+    assert plan["y"].shape == (25, 8)
+    stations = np.argmax(plan["z"][:, :, 0], axis=1)
+    arcs = np.argmax(plan["y"], axis=0)
+    assert np.array_equal(arcs, stations[:-1] * 5 + stations[1:])
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from rebalancing.data import random_electric_instance, random_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi, build_electric_gurobi
+from rebalancing.simulator import simulate
+
+DEMAND = (("f_plus", "f_minus"), ("f_bar_plus", "f_bar_minus"))
+
+
+def busy_electric_instance(S, T, V, seed):
+    instance = random_electric_instance(S, T, V, seed=seed)
+    instance["f_bar_plus"] *= 4
+    instance["f_bar_minus"] *= 4
+    return instance
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("build, make, K", [
+    (build_baseline_gurobi, lambda seed: random_instance(6, 10, 2, seed=seed, rate=3.0), 1),
+    (build_electric_gurobi, lambda seed: busy_electric_instance(5, 10, 1, seed), 2),
+])
+def test_replay_on_the_solve_day_scores_the_mip_objective(build, make, K, seed):
+    instance = make(seed)
+    model = build(**instance)
+    model.solve(OutputFlag=0, MIPGap=0)
+    rentals = np.stack([instance[plus] for plus, _ in DEMAND[:K]])[None]
+    returns = np.stack([instance[minus] for _, minus in DEMAND[:K]])[None]
+    # Trips of the last period are free in the MIP
+    rentals[..., -1] = returns[..., -1] = 0
+    scores = simulate(model.solution(), instance, rentals, returns)
+    assert scores["objective"][0] == pytest.approx(model.objective_value)
+
+
+def test_no_plan_loses_what_the_stations_cannot_serve():
+    instance = random_instance(3, 2, 1)
+    instance["d_s_1"] = np.array([0, 1, 20])
+    rentals = np.array([[[[2, 0], [3, 0], [0, 0]]]], dtype=float)
+    returns = np.zeros_like(rentals)
+    scores = simulate(None, instance, rentals, returns)
+    assert scores["lost_classic_rentals"][0] == 2 + 2
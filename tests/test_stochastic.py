@@ -0,0 +1,20 @@
+import numpy as np
+
+from rebalancing.data import random_instance
+from rebalancing.gurobi_backend import build_baseline_gurobi
+from rebalancing.stochastic import progressive_hedging, scenario_instances
+
+
+def test_wait_and_see_bound_is_the_mean_day_optimum():
+    instance = random_instance(4, 6, 1)
+    rng = np.random.default_rng(0)
+    rentals = rng.poisson(2.0, (3, 1, 4, 6)).astype(float)
+    returns = rng.poisson(2.0, (3, 1, 4, 6)).astype(float)
+    _, report = progressive_hedging(
+        build_baseline_gurobi, instance, rentals, returns, move_cost=0.5, max_iterations=2, MIPGap=0,
+    )
+    optima = []
+    for scenario in scenario_instances(instance, rentals, returns):
+        model = build_baseline_gurobi(**scenario)
+        optima.append(model.solve(OutputFlag=0, MIPGap=0))
+    assert np.isclose(report["wait_and_see_bound"], np.mean(optima))